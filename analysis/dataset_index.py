@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import Optional
+from usat_designer.processing.constants import *
+from sampling_utils import PARAMETERS_COLUMN, LazyMatrix, iter_dataset_chunks, load_seed_folder, load_shard
+from metrics_cache import cached_quality_metrics
+from parameter_sampling.utils import dataset
+
+DATASET_INDEX_FILE_NAME = "dataset_index.sqlite"
+DATASET_INDEX_TABLE     = "decodings"
+COEFFICIENT_PREFIX      = "coef_"
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _attribute(parameters, tag, key):
+    # Parsed XML keeps attributes of an element either flat or nested under the element tag
+    value = parameters.get(tag)
+    if isinstance(value, dict):
+        return value.get(key)
+    return value
+
+
+def flatten_parameters(parameters):
+    """One flat row of coefficients, formats and layouts from a parsed parameters XML."""
+    settings    = parameters.get(DSN_XML_SETTINGS, {})
+    row         = {f"{COEFFICIENT_PREFIX}{name}": _to_number(value)
+                   for name, value in parameters.get(DSN_XML_COEFFICIENTS, {}).items()}
+
+    for direction, type_key, ambisonics_tag, order_key, layout_tag in (
+            ("input", DSN_XML_INPUT_TYPE, DSN_XML_INPUT_AMBISONICS, DSN_XML_AMBISONICS_ORDER_IN, DSN_SMPL_INPUT_LAYOUT_DESC),
+            ("output", DSN_XML_OUTPUT_TYPE, DSN_XML_OUTPUT_AMBISONICS, DSN_XML_AMBISONICS_ORDER_OUT, DSN_SMPL_OUTPUT_LAYOUT_DESC)):
+
+        fmt                         = settings.get(type_key)
+        row[f"{direction}_format"]  = fmt
+        row[f"{direction}_layout"]  = _attribute(parameters, layout_tag, layout_tag)
+        if fmt == DSN_XML_AMBISONICS:
+            row[f"{direction}_order"] = _to_number(_attribute(parameters, ambisonics_tag, order_key))
+
+    return row
+
+
+def build_index(base_dir: str,
+                index_path: Optional[str] = None,
+                with_metrics: bool = True,
+                num_workers: Optional[int] = None,
+                max_folders: Optional[int] = None):
+    """
+    Scans a run once into an SQLite table with one row per decoding: seed, sampled coefficients,
+    formats, layouts, quality metrics and the location of its matrix file. Metrics come from the
+    metrics cache, so only new decodings are computed.
+
+    Args:
+        base_dir (str): Run directory containing outputs/<config>/.
+        index_path (str): SQLite file, defaults to dataset_index.sqlite next to outputs/.
+        with_metrics (bool): Join the quality metrics of every decoding.
+        num_workers (int): Worker processes used for loading and metrics.
+        max_folders (int): Index at most this many folders and shards.
+
+    Returns:
+        DatasetIndex: The freshly built index.
+    """
+    if index_path is None:
+        index_path = os.path.join(base_dir, DATASET_INDEX_FILE_NAME)
+
+    rows = []
+    for chunk in iter_dataset_chunks(base_dir, columns=(PARAMETERS_COLUMN,), lazy=True,
+                                     num_workers=num_workers, max_folders=max_folders):
+        for entry in chunk.to_dict("records"):
+            is_shard    = not os.path.isdir(entry["folder"])
+            row         = {DSN_SMPL_SEED: int(entry["seed"]),
+                           "folder": entry["folder"],
+                           "matrix_path": (entry["folder"] + dataset.SHARD_MATRICES_SUFFIX if is_shard
+                                           else dataset.seed_dir_files(entry["folder"], entry["seed"])[0]),
+                           "is_shard": int(is_shard)}
+            if isinstance(entry.get(PARAMETERS_COLUMN), dict):
+                row.update(flatten_parameters(entry[PARAMETERS_COLUMN]))
+            rows.append(row)
+
+    table = pd.DataFrame(rows)
+    if with_metrics and not table.empty:
+        metrics = cached_quality_metrics(base_dir, num_workers=num_workers, max_folders=max_folders)
+        if not metrics.empty:
+            # Seeds can repeat across configs and shards, the folder makes the key unique
+            table = table.merge(metrics.rename(columns={"seed": DSN_SMPL_SEED}), on=[DSN_SMPL_SEED, "folder"], how="left")
+
+    with sqlite3.connect(index_path) as connection:
+        table.to_sql(DATASET_INDEX_TABLE, connection, if_exists="replace", index=False)
+        for column in (DSN_SMPL_SEED, DSN_SMPL_P, DSN_SMPL_QUALITY_SCORE):
+            if column in table.columns:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS idx_{column} ON {DATASET_INDEX_TABLE} ("{column}")')
+
+    print(f"Indexed {len(table)} decodings to {index_path}")
+    return DatasetIndex(index_path)
+
+
+class DatasetIndex:
+    """
+    Read-only queries over an index built by build_index. Filters, quantiles and nearest-P
+    lookups only touch the SQLite table; matrices are loaded for selected seeds on request.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+
+    def query(self, where=None, params=(), columns="*", order_by=None, limit=None):
+        """Rows matching an SQL condition, e.g. query('"quality_score" > ?', (75,))."""
+        if not isinstance(columns, str):
+            columns = ", ".join(f'"{column}"' for column in columns)
+
+        sql = f"SELECT {columns} FROM {DATASET_INDEX_TABLE}"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def quantiles(self, column, qs=(0.1, 0.5, 0.9), where=None, params=()):
+        values = self.query(where, params, columns=[column])[column].dropna()
+        return pd.Series(np.quantile(values, qs) if len(values) else np.full(len(qs), np.nan), index=qs)
+
+    def nearest_p(self, target, k=1, where=None, params=()):
+        """The k decodings whose P is closest to target, optionally within a filter."""
+        order_by = f'ABS("{DSN_SMPL_P}" - {float(target)!r})'
+        return self.query(where, params, order_by=order_by, limit=k)
+
+    def exemplars(self, quality_threshold=75, unique_p=True):
+        """
+        Lowest, median and highest P among decodings above quality_threshold, as selected in the
+        analysis notebook. With unique_p, P values shared by several decodings are skipped.
+        """
+        where   = f'"{DSN_SMPL_QUALITY_SCORE}" > ?'
+        if unique_p:
+            where += (f' AND "{DSN_SMPL_P}" IN (SELECT "{DSN_SMPL_P}" FROM {DATASET_INDEX_TABLE} '
+                      f'GROUP BY "{DSN_SMPL_P}" HAVING COUNT(*) = 1)')
+
+        candidates = self.query(where, (quality_threshold,), order_by=f'"{DSN_SMPL_P}"')
+        if candidates.empty:
+            return candidates
+
+        groups = {"low": 0, "mid": len(candidates) // 2, "high": len(candidates) - 1}
+        result = candidates.iloc[list(groups.values())].copy()
+        result["P_group"] = list(range(len(groups)))
+        result.index = list(groups.keys())
+        return result
+
+    def load_entries(self, seeds, columns=None):
+        """Full loader entries (matrices, parameters, coordinates) for a handful of seeds."""
+        seeds       = [int(seed) for seed in seeds]
+        placeholder = ", ".join("?" * len(seeds))
+        locations   = self.query(f'"{DSN_SMPL_SEED}" IN ({placeholder})', seeds,
+                                 columns=[DSN_SMPL_SEED, "folder", "is_shard"])
+
+        entries = []
+        for seed, folder, is_shard in locations.itertuples(index=False):
+            if not is_shard:
+                entry = load_seed_folder(folder, seed, columns)
+                if entry is not None:
+                    entries.append(entry)
+                continue
+
+            for entry in load_shard(folder, columns, lazy=True):
+                if entry["seed"] == seed:
+                    entries.append({key: np.asarray(value) if isinstance(value, LazyMatrix) else value
+                                    for key, value in entry.items()})
+                    break
+
+        return pd.DataFrame(entries)
+
+    def close(self):
+        self.connection.close()
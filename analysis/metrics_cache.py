@@ -0,0 +1,163 @@
+import os
+import json
+import sqlite3
+import hashlib
+import pandas as pd
+from tqdm import tqdm
+from typing import Optional
+from usat_designer.processing.constants import *
+from sampling_utils import compute_quality_metrics, find_results_dir, list_load_units, load_unit
+from parameter_sampling.utils import dataset
+
+# Bump whenever compute_qs_and_ps or the intensity metrics change, so cached rows are recomputed
+METRICS_VERSION         = 1
+METRICS_CACHE_FILE_NAME = "metrics_cache.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path            TEXT PRIMARY KEY,
+    size            INTEGER NOT NULL,
+    mtime_ns        INTEGER NOT NULL,
+    content_hash    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    seed            INTEGER NOT NULL,
+    content_hash    TEXT NOT NULL,
+    metrics_version INTEGER NOT NULL,
+    metrics         TEXT NOT NULL,
+    PRIMARY KEY (seed, content_hash, metrics_version)
+);
+"""
+
+
+def hash_file(path, block_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MetricsCache:
+    """
+    SQLite sidecar of computed quality metrics, keyed by seed, the content hash of the matrix
+    file and METRICS_VERSION. File hashes are only recomputed when a file's size or mtime changes.
+    """
+
+    def __init__(self, path, metrics_version=METRICS_VERSION):
+        self.path               = path
+        self.metrics_version    = metrics_version
+        self.connection         = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def content_hash(self, file_path):
+        stat    = os.stat(file_path)
+        row     = self.connection.execute("SELECT size, mtime_ns, content_hash FROM files WHERE path = ?",
+                                          (file_path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        content_hash = hash_file(file_path)
+        self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                (file_path, stat.st_size, stat.st_mtime_ns, content_hash))
+        return content_hash
+
+    def lookup(self, content_hash, seed=None):
+        """Cached metrics of one file as {seed: metrics}, optionally restricted to one seed."""
+        query   = "SELECT seed, metrics FROM metrics WHERE content_hash = ? AND metrics_version = ?"
+        params  = [content_hash, self.metrics_version]
+        if seed is not None:
+            query += " AND seed = ?"
+            params.append(int(seed))
+        return {seed: json.loads(metrics) for seed, metrics in self.connection.execute(query, params)}
+
+    def store(self, content_hash, seed, metrics):
+        self.connection.execute("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?)",
+                                (int(seed), content_hash, self.metrics_version, json.dumps(metrics)))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _unit_matrix_file(unit):
+    kind, path, seed = unit[:3]
+    if kind == "shard":
+        return path + dataset.SHARD_MATRICES_SUFFIX
+    return dataset.seed_dir_files(path, seed)[0]
+
+
+def cached_quality_metrics(base_dir: str,
+                           cache_path: Optional[str] = None,
+                           num_workers: Optional[int] = None,
+                           chunk_size: int = 1000,
+                           max_folders: Optional[int] = None) -> pd.DataFrame:
+    """
+    Quality metrics of every decoding in a run, computing only decodings that are new, whose
+    matrix file changed, or whose metrics were cached under another METRICS_VERSION.
+
+    Args:
+        base_dir (str): Run directory containing outputs/<config>/.
+        cache_path (str): SQLite file, defaults to metrics_cache.sqlite next to outputs/.
+        num_workers (int): Worker processes for loading and fallback metric computation.
+        chunk_size (int): Folders (or shards) loaded and computed at a time.
+        max_folders (int): Consider at most this many folders and shards.
+
+    Returns:
+        pd.DataFrame: One row per decoding with the seed, the folder or shard holding it and its
+                      metrics. Seeds are only unique together with their folder.
+    """
+    if cache_path is None:
+        cache_path = os.path.join(base_dir, METRICS_CACHE_FILE_NAME)
+
+    columns = (DSN_OUT_SPEAKER_MATRIX, DSN_OUT_CLOUD, DSN_OUT_OUTPUT_LAYOUT)
+    units   = list_load_units(find_results_dir(base_dir), columns, lazy=False, max_folders=max_folders)
+    rows    = []
+    stale   = []
+
+    with MetricsCache(cache_path) as cache:
+        for unit in tqdm(units, desc="Checking metrics cache"):
+            matrix_file = _unit_matrix_file(unit)
+            if not os.path.exists(matrix_file):
+                continue
+
+            content_hash    = cache.content_hash(matrix_file)
+            cached          = cache.lookup(content_hash, seed=unit[2])
+            if cached:
+                rows.extend({"seed": seed, "folder": unit[1], **metrics} for seed, metrics in cached.items())
+            else:
+                stale.append((unit, content_hash))
+        cache.commit()
+
+        print(f"{len(units) - len(stale)} cached, {len(stale)} to compute")
+
+        for start in range(0, len(stale), chunk_size):
+            chunk   = stale[start:start + chunk_size]
+            entries = []
+            hashes  = []
+            for unit, content_hash in chunk:
+                unit_entries = load_unit(unit)
+                entries.extend(unit_entries)
+                hashes.extend([content_hash] * len(unit_entries))
+
+            if not entries:
+                continue
+
+            metrics_df      = compute_quality_metrics(pd.DataFrame(entries), num_workers=num_workers)
+            metric_names    = [name for name in metrics_df.columns if name not in entries[0]]
+            for (_, row), content_hash in zip(metrics_df.iterrows(), hashes):
+                metrics = {name: float(row[name]) for name in metric_names}
+                cache.store(content_hash, row["seed"], metrics)
+                rows.append({"seed": int(row["seed"]), "folder": row["folder"], **metrics})
+            cache.commit()
+
+    return pd.DataFrame(rows)
@@ -1,30 +1,297 @@
 import sys
 import os
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import hashlib
 import json
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from universal_transcoder.plots_and_logs import *
-from universal_transcoder.calculations.energy_intensity import *
 from usat_designer.processing.constants import *
-from usat_designer.processing.plots_usat_designer import *
 import usat_designer.utils.parameter_utils as pu
+from parameter_sampling.utils import dataset
+from parameter_sampling.utils import artifacts
+from parameter_sampling.utils import matrix_codecs
+from parameter_sampling.utils.metrics import (get_width_and_angular_error, compute_qs_and_ps_batch,
+                                              compute_qs_and_ps, compute_decoding_metrics)
 import warnings
 
-def get_width_and_angular_error(cloud_points, S, output_layout):
-    radial_i        = radial_I_calculation(cloud_points, S, output_layout)
-    transverse_i    = transverse_I_calculation(cloud_points, S, output_layout)
-    
-    angular_error_calc  = angular_error(radial_i, transverse_i)
-    width_calc          = width_angle(radial_i)
-
-    return angular_error_calc, width_calc
+# The transcoder calculations and the plotting stack are imported where they are used, so that
+# loading data does not pay for them
 
 from typing import Optional
 
-def create_df_from_files(base_dir: str, max_folders: Optional[int] = None):
+# Decodings stacked per batched NumPy evaluation, bounds memory to batch_size * points * speakers
+METRICS_BATCH_SIZE  = 256
+METRICS_RTOL        = 1e-6
+METRICS_ATOL        = 1e-6
+
+
+def _coordinates_key(coordinates):
+    cart = np.ascontiguousarray(np.asarray(coordinates.cart(), dtype=np.float64))
+    return hashlib.sha1(str(cart.shape).encode("utf-8") + cart.tobytes()).hexdigest()
+
+
+def batched_energy_and_intensity(cloud_cart, S, layout_cart):
+    """
+    Energy, angular error and source width of a stack of decodings sharing one cloud and
+    output layout.
+
+    Args:
+        cloud_cart (np.ndarray): (points, 3) unit vectors of the virtual sources.
+        S (np.ndarray): (decodings, points, speakers) speaker gains.
+        layout_cart (np.ndarray): (speakers, 3) unit vectors of the output layout.
+
+    Returns:
+        tuple: energy, angular error and source width, each (decodings, points).
+    """
+    power           = S ** 2
+    energy          = power.sum(axis=2)
+    intensity       = (power @ layout_cart) / energy[..., None]
+    radial_i        = np.einsum("npk,pk->np", intensity, cloud_cart)
+    transverse_i    = np.linalg.norm(intensity - radial_i[..., None] * cloud_cart, axis=2)
+
+    ang_error       = np.degrees(np.arctan2(transverse_i, radial_i))
+    source_width    = np.degrees(np.arccos(np.clip(radial_i, -1.0, 1.0)))
+    return energy, ang_error, source_width
+
+
+def _reference_energy_and_intensity(cloud_points, S, output_layout):
+    from universal_transcoder.calculations.energy_intensity import energy_calculation
+
+    energy                  = energy_calculation(S)
+    ang_error, source_width = get_width_and_angular_error(cloud_points, S, output_layout)
+    return np.asarray(energy), np.asarray(ang_error), np.asarray(source_width)
+
+
+def _batched_path_matches_reference(cloud_points, S, output_layout):
+    # The batched formulas are checked against the library on one decoding of every group
+    try:
+        batched     = batched_energy_and_intensity(np.asarray(cloud_points.cart(), dtype=np.float64),
+                                                   np.asarray(S, dtype=np.float64)[None],
+                                                   np.asarray(output_layout.cart(), dtype=np.float64))
+        reference   = _reference_energy_and_intensity(cloud_points, S, output_layout)
+    except Exception as e:
+        print(f"Batched metrics unavailable for this group: {e}")
+        return False
+
+    return all(np.allclose(b[0], r, rtol=METRICS_RTOL, atol=METRICS_ATOL, equal_nan=True)
+               for b, r in zip(batched, reference))
+
+
+def _compute_metrics_task(args):
+    cloud_points, S, output_layout = args
+    return compute_decoding_metrics(cloud_points, np.asarray(S), output_layout)
+
+
+def compute_quality_metrics(df: pd.DataFrame,
+                            num_workers: Optional[int] = None,
+                            batch_size: int = METRICS_BATCH_SIZE) -> pd.DataFrame:
+    """
+    Adds the quality metrics of every decoding to df. Decodings sharing a cloud and output
+    layout are stacked and evaluated in batched NumPy operations; the rest, and any group
+    where the batched formulas disagree with the library, go through a process pool.
+
+    Args:
+        df (pd.DataFrame): Decodings with cloud, output layout and S columns (arrays or LazyMatrix).
+        num_workers (int): Worker processes for the fallback, 1 runs in-process.
+        batch_size (int): Decodings stacked per batched evaluation.
+
+    Returns:
+        pd.DataFrame: df with a fresh index and one column per metric.
+    """
+    df          = df.reset_index(drop=True)
+    clouds      = df[DSN_OUT_CLOUD].tolist()
+    layouts     = df[DSN_OUT_OUTPUT_LAYOUT].tolist()
+    matrices    = df[DSN_OUT_SPEAKER_MATRIX].tolist()
+    all_metrics = [None] * len(df)
+
+    groups = {}
+    for i, (cloud_points, output_layout) in enumerate(zip(clouds, layouts)):
+        key = (_coordinates_key(cloud_points), _coordinates_key(output_layout))
+        groups.setdefault(key, []).append(i)
+
+    fallback = []
+    for rows in tqdm(groups.values(), desc="Computing quality metrics"):
+        first = rows[0]
+        if len(rows) == 1 or not _batched_path_matches_reference(clouds[first], matrices[first], layouts[first]):
+            fallback.extend(rows)
+            continue
+
+        cloud_cart  = np.asarray(clouds[first].cart(), dtype=np.float64)
+        layout_cart = np.asarray(layouts[first].cart(), dtype=np.float64)
+        for start in range(0, len(rows), batch_size):
+            batch_rows                          = rows[start:start + batch_size]
+            S                                   = np.stack([np.asarray(matrices[i], dtype=np.float64) for i in batch_rows])
+            energy, ang_error, source_width     = batched_energy_and_intensity(cloud_cart, S, layout_cart)
+            for i, metrics in zip(batch_rows, compute_qs_and_ps_batch(ang_error, source_width, energy)):
+                all_metrics[i] = metrics
+
+    if fallback:
+        tasks = [(clouds[i], matrices[i], layouts[i]) for i in fallback]
+        if num_workers == 1 or len(fallback) == 1:
+            results = [_compute_metrics_task(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                results = list(executor.map(_compute_metrics_task, tasks, chunksize=8))
+        for i, metrics in zip(fallback, results):
+            all_metrics[i] = metrics
+
+    return pd.concat([df, pd.DataFrame(all_metrics)], axis=1)
+
+
+# Column groups understood by the loaders; matrices and coordinates are only read when requested
+MATRIX_COLUMNS      = (DSN_OUT_SPEAKER_MATRIX,
+                       DSN_OUT_ENCODING_MATRIX,
+                       DSN_OUT_TRANSCODING_MATRIX,
+                       DSN_OUT_DECODING_MATRIX)
+PARAMETERS_COLUMN   = "y"
+METADATA_COLUMN     = "metadata"
+COORDINATE_COLUMNS  = (DSN_OUT_CLOUD, DSN_OUT_OUTPUT_LAYOUT)
+ALL_COLUMNS         = MATRIX_COLUMNS + (PARAMETERS_COLUMN, METADATA_COLUMN)
+
+
+class LazyMatrix:
+    """
+    Reference to one matrix of a saved decoding, read on first use. Uncompressed NPZ
+    members are memory-mapped. np.asarray(ref) and ref.load() both return the array, in
+    its stored dtype unless upcast is set.
+    """
+
+    def __init__(self, path, key, row=None, upcast=False, reader=None):
+        self.path   = path
+        self.key    = key
+        self.row    = row  # Row inside a shard, None for per-seed NPZ files
+        self.upcast = upcast
+        self.reader = reader  # ShardReader shared by the rows of one shard
+
+    def load(self, upcast=None):
+        upcast = self.upcast if upcast is None else upcast
+        if self.row is not None:
+            if self.reader is None:
+                self.reader = dataset.ShardReader(self.path)
+            return self.reader.matrix(self.row, self.key, upcast)
+
+        # Shared artifacts are plain .npy files, or NPZ files with one member named after the key
+        if self.path.endswith(artifacts.ARRAY_SUFFIX):
+            return np.load(self.path, mmap_mode="r")
+
+        array = matrix_codecs.map_member(self.path, self.key)
+        if array is None:
+            return matrix_codecs.read_npz(self.path, [self.key], upcast)[self.key]
+        if upcast:
+            with np.load(self.path) as data:
+                array = matrix_codecs.upcast(array, matrix_codecs.codec_record(data).get(self.key))
+        return array
+
+    def __array__(self, dtype=None, copy=None):
+        array = np.asarray(self.load())
+        return array if dtype is None else array.astype(dtype)
+
+    def __repr__(self):
+        return f"LazyMatrix({os.path.basename(self.path)}, {self.key!r})"
+
+
+def _resolve_columns(columns):
+    columns = ALL_COLUMNS if columns is None else tuple(columns)
+    unknown = set(columns) - set(ALL_COLUMNS) - set(COORDINATE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns {sorted(unknown)}, expected any of {ALL_COLUMNS + COORDINATE_COLUMNS}")
+    return columns
+
+
+def _parse_metadata(metadata_string):
+    return None if metadata_string is None else json.loads(metadata_string)
+
+
+def _add_shared_matrices(entry, metadata, matrix_keys, store, lazy, upcast=False):
+    # Matrices stored once per run in the shared artifact store instead of in the seed's NPZ
+    for key, name in artifacts.artifact_references(metadata).items():
+        if key in matrix_keys and key not in entry:
+            entry[key] = LazyMatrix(store.path(name), key, upcast=upcast) if lazy else store.get(name, upcast)
+
+
+def _add_text_columns(entry, xml_string, metadata, columns, store):
+    if PARAMETERS_COLUMN in columns and xml_string is not None:
+        entry[PARAMETERS_COLUMN] = pu.usat_xml_to_dict(xml_string)
+
+    wanted_coordinates = [key for key in COORDINATE_COLUMNS if key in columns]
+    if (METADATA_COLUMN in columns or wanted_coordinates) and metadata is not None:
+        coordinates = pu.restore_coordinates(artifacts.resolve_metadata(metadata, store))
+        if METADATA_COLUMN not in columns:
+            coordinates = {key: coordinates[key] for key in wanted_coordinates if key in coordinates}
+        entry.update(coordinates)
+
+
+def _read_optional_text(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def load_seed_folder(folder_path, seed, columns=None, lazy=False, upcast=False):
+    """Loads the requested columns of one seed_<n>/ folder, or None if its matrices are unreadable."""
+    columns                         = _resolve_columns(columns)
+    npz_path, json_path, xml_path   = dataset.seed_dir_files(folder_path, seed)
+    entry                           = {"seed": seed, "folder": folder_path}
+    matrix_keys                     = [key for key in MATRIX_COLUMNS if key in columns]
+    store                           = artifacts.store_for_results_dir(os.path.dirname(folder_path))
+    metadata                        = _parse_metadata(_read_optional_text(json_path))
+    shared_keys                     = artifacts.artifact_references(metadata)
+    local_keys                      = [key for key in matrix_keys if key not in shared_keys]
+
+    try:
+        if lazy:
+            entry.update({key: LazyMatrix(npz_path, key, upcast=upcast) for key in local_keys})
+        elif local_keys:
+            entry.update(matrix_codecs.read_npz(npz_path, local_keys, upcast))
+        _add_shared_matrices(entry, metadata, matrix_keys, store, lazy, upcast)
+    except Exception as e:
+        print(f"Failed to load {npz_path}: {e}")
+        return None
+
+    _add_text_columns(entry, _read_optional_text(xml_path), metadata, columns, store)
+    return entry
+
+
+def load_shard(path_base, columns=None, lazy=False, upcast=False):
+    """Loads the requested columns of every decoding in one shard."""
+    columns     = _resolve_columns(columns)
+    reader      = dataset.ShardReader(path_base)
+    matrix_keys = [key for key in MATRIX_COLUMNS if key in columns]
+    local_keys  = [key for key in matrix_keys if key in reader.keys]
+    matrices    = {} if lazy else {key: reader.matrices(key, upcast) for key in local_keys}
+    store       = artifacts.store_for_results_dir(os.path.dirname(os.path.dirname(path_base)))
+
     entries = []
+    for record in reader.records:
+        row         = record["row"]
+        entry       = {"seed": record["seed"], "folder": path_base}
+        metadata    = _parse_metadata(record.get("metadata"))
+        for key in local_keys:
+            entry[key] = LazyMatrix(path_base, key, row=row, upcast=upcast, reader=reader) if lazy else matrices[key][row]
+        _add_shared_matrices(entry, metadata, matrix_keys, store, lazy, upcast)
+        _add_text_columns(entry, record.get("xml"), metadata, columns, store)
+        entries.append(entry)
+
+    return entries
+
 
+def load_unit(unit):
+    kind, path, seed, columns, lazy, upcast = unit
+    if kind == "shard":
+        return load_shard(path, columns, lazy, upcast)
+
+    entry = load_seed_folder(path, seed, columns, lazy, upcast)
+    return [] if entry is None else [entry]
+
+
+def find_results_dir(base_dir: str):
     outputs_dir = os.path.join(base_dir, "outputs")
     if not os.path.isdir(outputs_dir):
         raise ValueError(f"No outputs directory found at {outputs_dir}")
@@ -37,72 +304,203 @@ def create_df_from_files(base_dir: str, max_folders: Optional[int] = None):
     if not os.path.isdir(second_level_dir):
         raise ValueError(f"No directory found at second level: {second_level_dir}")
 
-    folders = os.listdir(second_level_dir)
-    if max_folders is not None:
-        folders = folders[:max_folders]
+    return second_level_dir
 
-    for folder_name in tqdm(folders, desc="Loading folders"):
-        folder_path = os.path.join(second_level_dir, folder_name)
-        if not os.path.isdir(folder_path):
-            continue
 
+def list_load_units(results_dir, columns=None, lazy=False, max_folders=None, upcast=False):
+    # Seed folders and shards of one run, as picklable work items
+    columns = _resolve_columns(columns)
+    units   = []
+
+    for folder_name in os.listdir(results_dir):
+        folder_path = os.path.join(results_dir, folder_name)
+        if not os.path.isdir(folder_path) or not folder_name.startswith("seed_"):
+            continue
         try:
             seed = int(folder_name.split("_")[-1])
         except ValueError:
             print(f"Skipping folder with invalid seed: {folder_name}")
             continue
+        units.append(("folder", folder_path, seed, columns, lazy, upcast))
 
-        npz_path  = os.path.join(folder_path, f"matrix_data_{seed}.npz")
-        json_path = os.path.join(folder_path, f"metadata_{seed}.json")
-        xml_path  = os.path.join(folder_path, f"y_parameters_{seed}.xml")
+    shard_dir = os.path.join(results_dir, dataset.SHARD_DIR_NAME)
+    if os.path.isdir(shard_dir):
+        units.extend(("shard", path_base, None, columns, lazy, upcast) for path_base in dataset.list_shards(shard_dir))
 
-        try:
-            with np.load(npz_path) as data:
-                entry = {
-                    "seed": seed,
-                    "folder": folder_path,
-                    DSN_OUT_SPEAKER_MATRIX: data[DSN_OUT_SPEAKER_MATRIX],
-                    DSN_OUT_ENCODING_MATRIX: data[DSN_OUT_ENCODING_MATRIX],
-                    DSN_OUT_TRANSCODING_MATRIX: data[DSN_OUT_TRANSCODING_MATRIX],
-                    DSN_OUT_DECODING_MATRIX: data[DSN_OUT_DECODING_MATRIX],
-                }
-        except Exception as e:
-            print(f"Failed to load {npz_path}: {e}")
-            continue
+    if max_folders is not None:
+        units = units[:max_folders]
+    return units
 
-        if os.path.exists(xml_path):
-            with open(xml_path, "r", encoding="utf-8") as f:
-                xml_string  = f.read()
-                parsed_xml  = pu.usat_xml_to_dict(xml_string)
-                entry["y"]  = parsed_xml
-
-        if os.path.exists(json_path):
-            with open(json_path, "r") as f:
-                metadata    = json.load(f)
-                coordinates = pu.restore_coordinates(metadata)
-            entry.update(coordinates)
-        '''
-        energy                  = energy_calculation(entry[DSN_OUT_SPEAKER_MATRIX])
-        ang_error, source_width = get_width_and_angular_error(entry[DSN_OUT_CLOUD], 
-                                                              entry[DSN_OUT_SPEAKER_MATRIX], 
-                                                              entry[DSN_OUT_OUTPUT_LAYOUT])
-        q_s, x_p = compute_qs_and_xp(ang_error, source_width, energy)
-        entry[DSN_SMPL_QUALITY_SCORE] = round(q_s, 2)
-        entry[DSN_SMPL_X_p] = round(x_p, 2)
-        '''
-        entries.append(entry)
 
-    return pd.DataFrame(entries)
+def iter_dataset_chunks(base_dir: str,
+                        columns=None,
+                        lazy: bool = True,
+                        chunk_size: int = 1000,
+                        num_workers: Optional[int] = None,
+                        max_folders: Optional[int] = None,
+                        upcast: bool = False):
+    """
+    Streams a run as DataFrames of about chunk_size decodings, reading folders and shards
+    on a process pool. The next chunk is read while the caller processes the current one.
+
+    Args:
+        base_dir (str): Run directory containing outputs/<config>/.
+        columns (iterable): Columns to load from MATRIX_COLUMNS, PARAMETERS_COLUMN,
+                            METADATA_COLUMN and COORDINATE_COLUMNS. Defaults to all of them.
+        lazy (bool): Store LazyMatrix references instead of reading matrices.
+        chunk_size (int): Folders (or shards) read per chunk.
+        num_workers (int): Worker processes, 1 reads in-process. Defaults to the CPU count.
+        max_folders (int): Read at most this many folders and shards.
+        upcast (bool): Return downcast matrices in the dtype they had before saving.
+    """
+    units   = list_load_units(find_results_dir(base_dir), columns, lazy, max_folders, upcast)
+    chunks  = [units[i:i + chunk_size] for i in range(0, len(units), chunk_size)]
+
+    if num_workers == 1:
+        for chunk in tqdm(chunks, desc="Loading chunks"):
+            yield pd.DataFrame([entry for unit in chunk for entry in load_unit(unit)])
+        return
+
+    num_workers = num_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = None
+        for chunk in tqdm(chunks, desc="Loading chunks"):
+            results = executor.map(load_unit, chunk, chunksize=max(1, len(chunk) // (4 * num_workers)))
+            if pending is not None:
+                yield pd.DataFrame([entry for entries in pending for entry in entries])
+            pending = results
+
+        if pending is not None:
+            yield pd.DataFrame([entry for entries in pending for entry in entries])
+
+
+def load_dataset(base_dir: str, columns=None, lazy: bool = True, num_workers: Optional[int] = None,
+                 max_folders: Optional[int] = None, chunk_size: int = 1000, upcast: bool = False):
+    chunks = list(iter_dataset_chunks(base_dir, columns, lazy, chunk_size, num_workers, max_folders, upcast))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+
+def create_df_from_files(base_dir: str, max_folders: Optional[int] = None, num_workers: Optional[int] = None):
+    # Every column, matrices read eagerly
+    return load_dataset(base_dir, columns=None, lazy=False, num_workers=num_workers, max_folders=max_folders)
+
+# Scalar maps are drawn as a Gouraud-shaded triangulation of the cloud in azimuth / elevation,
+# straight onto the caller's axes. Triangulations are cached per cloud and process
+_projection_cache = {}
+POLE_ELEVATION_DEG  = 90 - 1e-6  # Points this close to a pole have no meaningful azimuth
+MIN_TRIANGLE_AREA   = 1e-9       # Square degrees; flatter projected triangles are masked
+
+
+def _cloud_cart(cloud_points):
+    cart = cloud_points.cart() if hasattr(cloud_points, "cart") else cloud_points
+    return np.ascontiguousarray(np.asarray(cart, dtype=np.float64))
+
+
+def _sphere_triangles(unit):
+    # Faces of the convex hull connect neighbours on the sphere, so nothing is stretched across
+    # the azimuth seam; without scipy fall back to a Delaunay triangulation of the projection
+    try:
+        from scipy.spatial import ConvexHull
+    except ImportError:
+        return None
+    return ConvexHull(unit).simplices
+
+
+def cloud_projection(cloud_points):
+    """
+    Triangulation of a cloud (or its (points, 3) Cartesian array) in azimuth and elevation
+    degrees, computed once per distinct cloud. Triangles that wrap around the +-180 degree
+    seam, touch a pole or are flat in the projection are masked rather than drawn stretched.
+    """
+    from matplotlib.tri import Triangulation
+
+    cart    = _cloud_cart(cloud_points)
+    key     = hashlib.sha1(str(cart.shape).encode("utf-8") + cart.tobytes()).hexdigest()
+    if key not in _projection_cache:
+        radius      = np.linalg.norm(cart, axis=1)
+        unit        = cart / np.where(radius > 0, radius, 1)[:, None]
+        azimuth     = np.degrees(np.arctan2(unit[:, 1], unit[:, 0]))
+        elevation   = np.degrees(np.arcsin(np.clip(unit[:, 2], -1, 1)))
+
+        triangulation   = Triangulation(azimuth, elevation, _sphere_triangles(unit))
+        corners_az      = azimuth[triangulation.triangles]
+        corners_el      = elevation[triangulation.triangles]
+        area            = 0.5 * np.abs((corners_az[:, 1] - corners_az[:, 0]) * (corners_el[:, 2] - corners_el[:, 0])
+                                       - (corners_az[:, 2] - corners_az[:, 0]) * (corners_el[:, 1] - corners_el[:, 0]))
+
+        triangulation.set_mask((np.ptp(corners_az, axis=1) > 180)
+                               | np.any(np.abs(corners_el) > POLE_ELEVATION_DEG, axis=1)
+                               | (area < MIN_TRIANGLE_AREA))
+        _projection_cache[key] = triangulation
+    return _projection_cache[key]
 
-from matplotlib.colors import LinearSegmentedColormap
-from matplotlib import pyplot as plt
-from matplotlib.image import imread
-from io import BytesIO
-import base64
 
-def plot_focus_grid(focus_plot_data, metric_settings, colormap=None, dpi=150):
+def draw_scalar_map(ax, values, cloud_points, title=None, colorbar_label=None, clim_range=None, cmap=None, colorbar=True):
     """
-    Display scalar map comparisons across focus groups and metrics using plot_scalar_map().
+    Draws one value per cloud point onto ax, in place of rendering plot_scalar_map to an image.
+
+    Args:
+        ax (matplotlib.axes.Axes): Axes to draw on.
+        values (np.ndarray): One value per point of the cloud.
+        cloud_points: Cloud with a cart() method, or its (points, 3) Cartesian array.
+        title (str): Axes title.
+        colorbar_label (str): Label of the colorbar.
+        clim_range (tuple): (min, max) of the color scale.
+        cmap (Colormap): Matplotlib colormap or its name.
+        colorbar (bool): Add a colorbar next to the axes.
+
+    Returns:
+        The drawn mesh, e.g. for a shared colorbar.
+    """
+    vmin, vmax  = clim_range if clim_range is not None else (None, None)
+    mesh        = ax.tripcolor(cloud_projection(cloud_points),
+                               np.asarray(values, dtype=np.float64).ravel(),
+                               shading="gouraud",
+                               cmap=cmap,
+                               vmin=vmin,
+                               vmax=vmax)
+    ax.set_xlim(-180, 180)
+    ax.set_ylim(-90, 90)
+    ax.set_xlabel("Azimuth (deg)")
+    ax.set_ylabel("Elevation (deg)")
+    if title:
+        ax.set_title(title)
+    if colorbar:
+        ax.figure.colorbar(mesh, ax=ax, label=colorbar_label)
+    return mesh
+
+
+def draw_focus_grid(fig, focus_plot_data, metric_settings, colormap=None):
+    focus_labels    = list(focus_plot_data.keys())
+    num_rows        = len(metric_settings)
+    num_cols        = len(focus_labels)
+    axs             = fig.subplots(num_rows, num_cols, squeeze=False)
+
+    for row_idx, metric in enumerate(metric_settings):
+        for col_idx, focus in enumerate(focus_labels):
+            data    = focus_plot_data[focus]
+            ax      = axs[row_idx][col_idx]
+            mesh    = draw_scalar_map(ax,
+                                      values=data[metric["key"]],
+                                      cloud_points=data["cloud"],
+                                      clim_range=metric["clim"],
+                                      cmap=colormap,
+                                      colorbar=False)
+
+            # Column titles at the top; every axes keeps its azimuth / elevation labels
+            if row_idx == 0:
+                ax.set_title(focus.capitalize(), fontsize=14)
+
+        # The cells of a row share the metric's color scale, so they share one colorbar
+        fig.colorbar(mesh, ax=list(axs[row_idx]), label=metric["label"])
+    return axs
+
+
+def plot_focus_grid(focus_plot_data, metric_settings, colormap=None, dpi=150, save_path=None, show=True):
+    """
+    Display scalar map comparisons across focus groups and metrics, drawn directly on a grid of axes.
 
     Args:
         focus_plot_data (dict): Dict with keys "low", "mid", "high", each containing metric arrays and cloud.
@@ -111,58 +509,71 @@ def plot_focus_grid(focus_plot_data, metric_settings, colormap=None, dpi=150):
             - 'label': label for colorbar
             - 'clim': tuple (min, max)
         colormap (Colormap): Matplotlib colormap to use (LinearSegmentedColormap or str).
-        dpi (int): DPI used for plot_scalar_map.
+        dpi (int): DPI of the figure.
+        save_path (str): Also save the figure here (optional).
+        show (bool): Show the figure.
     """
+    from matplotlib import pyplot as plt
 
-    # Focus labels and metric list
-    focus_labels    = list(focus_plot_data.keys())
-    num_rows        = len(metric_settings)
-    num_cols        = len(focus_labels)
+    num_rows, num_cols = len(metric_settings), len(focus_plot_data)
+    fig = plt.figure(figsize=(5 * num_cols, 4 * num_rows), dpi=dpi, layout="constrained")
+    draw_focus_grid(fig, focus_plot_data, metric_settings, colormap)
 
-    fig, axs = plt.subplots(num_rows, num_cols, figsize=(5 * num_cols, 4 * num_rows))
+    if save_path:
+        fig.savefig(save_path, dpi=dpi, bbox_inches="tight")
+    if show:
+        plt.show()
+    return fig
 
-    if num_rows == 1:
-        axs = [axs]
-    if num_cols == 1:
-        axs = [[ax] for ax in axs]
 
-    for row_idx, metric in enumerate(metric_settings):
-        metric_key = metric["key"]
-        label = metric["label"]
-        clim = metric["clim"]
+def _render_focus_grid(args):
+    # Runs in a worker: a bare Figure needs no pyplot state or GUI backend
+    from matplotlib.figure import Figure
 
-        for col_idx, focus in enumerate(focus_labels):
-            data = focus_plot_data[focus]
-            cloud = data["cloud"]
-
-            title_text = f"{metric_key.capitalize()} ({focus})"
-
-            img_b64 = plot_scalar_map(
-                values=data[metric_key],
-                cloud_points=cloud,
-                title=label,
-                colorbar_label=label,
-                clim_range=clim,
-                cmap=colormap,
-                dpi=dpi,
-                return_base64=True
-            )
-
-            img_bytes = base64.b64decode(img_b64)
-            img_array = imread(BytesIO(img_bytes), format='png')
-
-            ax = axs[row_idx][col_idx]
-            ax.imshow(img_array)
-            ax.axis('off')
-
-            # Add row labels on the left
-            if col_idx == 0:
-                ax.set_ylabel(label, fontsize=14)
-
-            # Add column titles at the top
-            if row_idx == 0:
-                ax.set_title(focus.capitalize(), fontsize=14)
+    path, focus_plot_data, metric_settings, colormap, dpi = args
+    num_rows, num_cols  = len(metric_settings), len(focus_plot_data)
+    fig                 = Figure(figsize=(5 * num_cols, 4 * num_rows), dpi=dpi, layout="constrained")
+    draw_focus_grid(fig, focus_plot_data, metric_settings, colormap)
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    return path
+
+
+def export_focus_grids(grids, output_dir, metric_settings, colormap=None, dpi=150, file_format="png",
+                       num_workers=None):
+    """
+    Saves one focus grid per entry of grids on a process pool, e.g. for hundreds of exemplars.
+    A single decoding's plots are a grid with one focus column.
+
+    Args:
+        grids (dict): Name -> focus_plot_data as taken by plot_focus_grid; the name becomes the file name.
+        output_dir (str): Directory for the image files.
+        metric_settings (list): As for plot_focus_grid.
+        colormap (Colormap): Matplotlib colormap to use.
+        dpi (int): Resolution of the saved images.
+        file_format (str): Image format understood by matplotlib.
+        num_workers (int): Worker processes, 1 renders in-process. Defaults to the CPU count.
+
+    Returns:
+        list: Paths of the saved images, in the order of grids.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Clouds travel as plain arrays, and grids sharing a cloud are sent together to reuse its triangulation
+    tasks = []
+    for name, focus_plot_data in grids.items():
+        data = {focus: {**values, "cloud": _cloud_cart(values["cloud"])} for focus, values in focus_plot_data.items()}
+        tasks.append((os.path.join(output_dir, f"{name}.{file_format}"), data, metric_settings, colormap, dpi))
+    order = sorted(range(len(tasks)),
+                   key=lambda i: [hashlib.sha1(values["cloud"].tobytes()).hexdigest() for values in tasks[i][1].values()])
 
-    plt.tight_layout()
-    plt.show()
+    if num_workers == 1 or len(tasks) <= 1:
+        for i in tqdm(order, desc="Exporting plots"):
+            _render_focus_grid(tasks[i])
+    else:
+        num_workers = num_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            list(tqdm(executor.map(_render_focus_grid, [tasks[i] for i in order],
+                                   chunksize=max(1, len(tasks) // (4 * num_workers))),
+                      total=len(tasks), desc="Exporting plots"))
 
+    return [task[0] for task in tasks]
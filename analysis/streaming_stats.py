@@ -0,0 +1,354 @@
+import copy
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from typing import Optional
+from usat_designer.processing.constants import *
+from sampling_utils import PARAMETERS_COLUMN, compute_quality_metrics, find_results_dir, list_load_units, load_unit
+from dataset_index import DATASET_INDEX_TABLE, flatten_parameters
+
+METRIC_COLUMNS      = (DSN_SMPL_QUALITY_SCORE, DSN_SMPL_P, "ae_mean", "ae_90", "ae_under_15", "sw_median", "e_std")
+DEFAULT_HISTOGRAMS  = {DSN_SMPL_QUALITY_SCORE: (100, (0, 100)),
+                       DSN_SMPL_P: (90, (0, 90))}
+DEFAULT_QUANTILES   = (0.05, 0.25, 0.5, 0.75, 0.95)
+SKETCH_CAPACITY     = 2048
+
+
+class RunningMoments:
+    """
+    Count, means and co-moments of several columns, updated a chunk at a time and merged
+    pairwise (Chan et al.), so partial results of separate workers combine exactly. Rows with
+    a missing value in any column are skipped, so every statistic covers the same rows.
+    """
+
+    def __init__(self, columns):
+        self.columns    = list(columns)
+        self.count      = 0
+        self.mean       = np.zeros(len(self.columns))
+        self.comoment   = np.zeros((len(self.columns), len(self.columns)))
+
+    def _combine(self, count, mean, comoment):
+        if count == 0:
+            return
+        total           = self.count + count
+        delta           = mean - self.mean
+        self.comoment   = self.comoment + comoment + np.outer(delta, delta) * self.count * count / total
+        self.mean       = self.mean + delta * count / total
+        self.count      = total
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values).all(axis=1)]
+        if not len(values):
+            return
+        mean        = values.mean(axis=0)
+        centered    = values - mean
+        self._combine(len(values), mean, centered.T @ centered)
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError(f"Cannot merge moments of {other.columns} into {self.columns}")
+        self._combine(other.count, other.mean, other.comoment)
+        return self
+
+    def covariance(self, ddof=1):
+        scale = self.count - ddof if self.count > ddof else np.nan
+        return pd.DataFrame(self.comoment / scale, index=self.columns, columns=self.columns)
+
+    def variance(self, ddof=1):
+        return pd.Series(np.diag(self.covariance(ddof).values), index=self.columns)
+
+    def correlation(self):
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = self.comoment / np.outer(std, std)
+        return pd.DataFrame(correlation, index=self.columns, columns=self.columns)
+
+
+class FixedHistogram:
+    """Counts over fixed bins, plus the values below and above the range."""
+
+    def __init__(self, bins, value_range):
+        self.edges      = np.linspace(value_range[0], value_range[1], bins + 1)
+        self.counts     = np.zeros(bins, dtype=np.int64)
+        self.underflow  = 0
+        self.overflow   = 0
+
+    def update(self, values):
+        values          = np.asarray(values, dtype=np.float64)
+        values          = values[np.isfinite(values)]
+        self.counts     += np.histogram(values, self.edges)[0]
+        self.underflow  += int((values < self.edges[0]).sum())
+        self.overflow   += int((values > self.edges[-1]).sum())
+
+    def merge(self, other):
+        if not np.array_equal(other.edges, self.edges):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts     += other.counts
+        self.underflow  += other.underflow
+        self.overflow   += other.overflow
+        return self
+
+    def to_frame(self):
+        return pd.DataFrame({"left": self.edges[:-1], "right": self.edges[1:], "count": self.counts})
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles in bounded memory, in the manner of a KLL sketch: a stack of
+    compactors where level i holds items of weight 2**i. A full level is sorted and every other
+    item, from a random offset, moves up a level. Memory grows with capacity * log2(n / capacity);
+    the rank error shrinks as capacity grows.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY, seed=None):
+        self.capacity   = capacity
+        self.count      = 0
+        self.levels     = [np.empty(0)]
+        self._rng       = np.random.default_rng(seed)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity:
+                items               = np.sort(self.levels[level])
+                # An odd item out stays behind, so the total weight is preserved
+                cut                 = len(items) - len(items) % 2
+                self.levels[level]  = items[cut:]
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[:cut][self._rng.integers(2)::2]])
+            level += 1
+
+    def update(self, values):
+        values          = np.asarray(values, dtype=np.float64)
+        values          = values[np.isfinite(values)]
+        self.count      += len(values)
+        self.levels[0]  = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantiles(self, quantiles=DEFAULT_QUANTILES):
+        values  = np.concatenate(self.levels)
+        if not len(values):
+            return np.full(len(quantiles), np.nan)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order   = np.argsort(values)
+        ranks   = np.cumsum(weights[order])
+        index   = np.searchsorted(ranks, np.asarray(quantiles) * ranks[-1], side="left")
+        return values[order][np.clip(index, 0, len(values) - 1)]
+
+
+class StreamingStats:
+    """
+    Summary statistics of a dataset streamed chunk by chunk in constant memory: running moments,
+    covariances and correlations of columns, fixed-bin histograms and approximate quantiles.
+    Partial results of workers merge into the same statistics as one pass would give, up to the
+    sketch's approximation of quantiles.
+
+    Args:
+        columns (iterable): Numeric columns tracked by the moments and, by default, the sketches.
+        histograms (dict): Column -> (bins, (min, max)). Defaults to quality score and P.
+        quantile_columns (iterable): Columns with a quantile sketch. Defaults to columns.
+        sketch_capacity (int): Items per sketch level.
+    """
+
+    def __init__(self, columns=METRIC_COLUMNS, histograms=None, quantile_columns=None, sketch_capacity=SKETCH_CAPACITY):
+        histograms              = DEFAULT_HISTOGRAMS if histograms is None else histograms
+        self.columns            = list(columns)
+        self.moments            = RunningMoments(self.columns)
+        self.histograms         = {column: FixedHistogram(bins, value_range)
+                                   for column, (bins, value_range) in histograms.items()}
+        self.sketches           = {column: QuantileSketch(sketch_capacity)
+                                   for column in (self.columns if quantile_columns is None else quantile_columns)}
+        self.num_seen           = 0
+        self.num_selected       = 0
+
+    def update(self, df, query=None):
+        """Adds the rows of df, or only those matching a DataFrame.query expression."""
+        self.num_seen += len(df)
+        if query:
+            df = df.query(query)
+        self.num_selected += len(df)
+
+        missing = set(self.columns) | set(self.histograms) | set(self.sketches)
+        missing -= set(df.columns)
+        if missing:
+            raise KeyError(f"Columns {sorted(missing)} are not in the data")
+
+        self.moments.update(df[self.columns].to_numpy(dtype=np.float64))
+        for column, histogram in self.histograms.items():
+            histogram.update(df[column].to_numpy(dtype=np.float64))
+        for column, sketch in self.sketches.items():
+            sketch.update(df[column].to_numpy(dtype=np.float64))
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        for column, histogram in self.histograms.items():
+            histogram.merge(other.histograms[column])
+        for column, sketch in self.sketches.items():
+            sketch.merge(other.sketches[column])
+        self.num_seen       += other.num_seen
+        self.num_selected   += other.num_selected
+        return self
+
+    def correlation_with(self, column=DSN_SMPL_P):
+        return self.moments.correlation()[column].drop(column)
+
+    def describe(self, quantiles=DEFAULT_QUANTILES):
+        """Per-column count, mean, standard deviation and approximate quantiles, like DataFrame.describe."""
+        table = pd.DataFrame({"count": self.moments.count,
+                              "mean": self.moments.mean,
+                              "std": np.sqrt(self.moments.variance().values)},
+                             index=self.columns)
+        for column, sketch in self.sketches.items():
+            for q, value in zip(quantiles, sketch.quantiles(quantiles)):
+                table.loc[column, f"{q:.0%}"] = value
+        return table
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        return {
+            "num_seen": self.num_seen,
+            "num_selected": self.num_selected,
+            "describe": self.describe(quantiles),
+            "covariance": self.moments.covariance(),
+            "correlation": self.moments.correlation(),
+            "histograms": {column: histogram.to_frame() for column, histogram in self.histograms.items()},
+        }
+
+
+def _iter_entry_chunks(units, chunk_size):
+    # Units are loaded lazily, so a shard contributes LazyMatrix references to its rows rather than
+    # its matrices, and chunks hold chunk_size decodings however the run was saved
+    entries = []
+    for unit in units:
+        for entry in load_unit(unit):
+            entries.append(entry)
+            if len(entries) == chunk_size:
+                yield entries
+                entries = []
+    if entries:
+        yield entries
+
+
+def _run_metric_chunks(units, chunk_size, with_parameters):
+    # Metrics of chunk_size decodings at a time; matrices are read as they are scored and dropped afterwards
+    for entries in _iter_entry_chunks(units, chunk_size):
+        df = compute_quality_metrics(pd.DataFrame(entries), num_workers=1)
+        if with_parameters:
+            parameters  = pd.DataFrame([flatten_parameters(y) if isinstance(y, dict) else {}
+                                        for y in df[PARAMETERS_COLUMN]], index=df.index)
+            df          = pd.concat([df, parameters], axis=1)
+        yield df.drop(columns=[DSN_OUT_SPEAKER_MATRIX, DSN_OUT_CLOUD, DSN_OUT_OUTPUT_LAYOUT, PARAMETERS_COLUMN],
+                      errors="ignore")
+
+
+def _aggregate_run_partition(args):
+    units, stats, query, chunk_size, with_parameters = args
+    for df in _run_metric_chunks(units, chunk_size, with_parameters):
+        stats.update(df, query)
+    return stats
+
+
+def _empty_copy(stats):
+    # Partials start from copies of the caller's statistics, which therefore must be empty
+    if stats.num_seen:
+        raise ValueError("Pass empty statistics; merge previously computed ones afterwards")
+    return copy.deepcopy(stats)
+
+
+def _merge_partials(stats, partials):
+    for partial in partials:
+        stats.merge(partial)
+    return stats
+
+
+def stream_run_stats(base_dir: str,
+                     stats: Optional[StreamingStats] = None,
+                     query: Optional[str] = None,
+                     num_workers: Optional[int] = None,
+                     chunk_size: int = 256,
+                     max_folders: Optional[int] = None,
+                     with_parameters: bool = False) -> StreamingStats:
+    """
+    Statistics of a run's quality metrics, scored chunk by chunk from the saved matrices. Every
+    worker aggregates its own share of the folders and shards; the partials are merged at the end.
+
+    Args:
+        base_dir (str): Run directory containing outputs/<config>/.
+        stats (StreamingStats): Empty statistics to fill, defaults to StreamingStats(). Fill several and
+                                merge them to combine runs.
+        query (str): DataFrame.query filter, e.g. "quality_score > 75".
+        num_workers (int): Worker processes, 1 runs in-process. Defaults to the CPU count.
+        chunk_size (int): Decodings scored at a time per worker.
+        max_folders (int): Consider at most this many folders and shards.
+        with_parameters (bool): Also provide the flattened coefficients (coef_*) to stats and query.
+    """
+    stats       = stats if stats is not None else StreamingStats()
+    columns     = (DSN_OUT_SPEAKER_MATRIX, DSN_OUT_CLOUD, DSN_OUT_OUTPUT_LAYOUT) + ((PARAMETERS_COLUMN,) if with_parameters else ())
+    units       = list_load_units(find_results_dir(base_dir), columns, lazy=True, max_folders=max_folders)
+    num_workers = num_workers or os.cpu_count() or 1
+
+    partitions  = [units[i::num_workers] for i in range(num_workers) if units[i::num_workers]]
+    tasks       = [(partition, _empty_copy(stats), query, chunk_size, with_parameters) for partition in partitions]
+
+    if num_workers == 1 or len(tasks) <= 1:
+        return _merge_partials(stats, [_aggregate_run_partition(task) for task in tasks])
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        partials = list(tqdm(executor.map(_aggregate_run_partition, tasks), total=len(tasks), desc="Aggregating partitions"))
+    return _merge_partials(stats, partials)
+
+
+def _aggregate_index_partition(args):
+    index_path, low, high, stats, query, where, params, chunk_size = args
+    sql = f"SELECT * FROM {DATASET_INDEX_TABLE} WHERE rowid > ? AND rowid <= ?"
+    if where:
+        sql += f" AND ({where})"
+
+    with sqlite3.connect(index_path) as connection:
+        for df in pd.read_sql_query(sql, connection, params=[low, high, *params], chunksize=chunk_size):
+            stats.update(df, query)
+    return stats
+
+
+def stream_index_stats(index_path: str,
+                       stats: Optional[StreamingStats] = None,
+                       query: Optional[str] = None,
+                       where: Optional[str] = None,
+                       params=(),
+                       num_workers: Optional[int] = None,
+                       chunk_size: int = 50000) -> StreamingStats:
+    """
+    Statistics of the rows of a dataset index built by dataset_index.build_index, read in chunks
+    of rowid ranges on a process pool. where (SQL, with ? params) filters in SQLite, query filters
+    each chunk with DataFrame.query.
+    """
+    stats = stats if stats is not None else StreamingStats()
+    with sqlite3.connect(index_path) as connection:
+        max_rowid = connection.execute(f"SELECT MAX(rowid) FROM {DATASET_INDEX_TABLE}").fetchone()[0] or 0
+
+    num_workers = num_workers or os.cpu_count() or 1
+    bounds      = np.linspace(0, max_rowid, num_workers + 1).astype(np.int64)
+    tasks       = []
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        if high > low:
+            tasks.append((index_path, int(low), int(high), _empty_copy(stats), query, where, tuple(params), chunk_size))
+
+    if num_workers == 1 or len(tasks) <= 1:
+        return _merge_partials(stats, [_aggregate_index_partition(task) for task in tasks])
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        partials = list(executor.map(_aggregate_index_partition, tasks))
+    return _merge_partials(stats, partials)
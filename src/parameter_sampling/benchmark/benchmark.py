@@ -0,0 +1,258 @@
+import sys
+import os
+
+TOP_LEVEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if TOP_LEVEL_DIR not in sys.path:
+    sys.path.insert(0, TOP_LEVEL_DIR)
+
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import numpy as np
+import xml.etree.ElementTree as ET
+from parameter_sampling.generate.generate import (build_xml_config, configure_worker, iter_decodings,
+                                                  parse_from_config, serialize_xml_config,
+                                                  write_decoding_result, write_decoding_result_to_shard)
+from parameter_sampling.generate.pipeline import Pipeline
+from parameter_sampling.generate.sampler import derive_seeds
+from parameter_sampling.benchmark.fake_optimizer import FakeOptimizer
+from parameter_sampling.utils import dataset
+from parameter_sampling.utils import matrix_codecs
+from parameter_sampling.utils.uploader import LocalBackend, Uploader, report_failures
+
+BENCHMARK_CONFIG_NAME   = "benchmark"
+DEFAULT_BASELINE_PATH   = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PERCENTILES             = (50, 90, 99)
+
+
+class StageTimer:
+    def __init__(self):
+        self.latencies = {}
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        yield
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        stages = {}
+        for name, latencies in self.latencies.items():
+            values          = np.asarray(latencies)
+            stages[name]    = {
+                "count": len(values),
+                "total": float(values.sum()),
+                "mean": float(values.mean()),
+                **{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES},
+            }
+        return stages
+
+
+def run_stage_benchmarks(yaml_path, num_samples, optimizer, work_dir, timer):
+    """Times every stage of one decoding in isolation, sample by sample."""
+    results_dir     = os.path.join(work_dir, "outputs", BENCHMARK_CONFIG_NAME)
+    backend         = LocalBackend(os.path.join(work_dir, "bucket"))
+    shard_writer    = dataset.ShardWriter(os.path.join(work_dir, "shards"), "benchmark", max_rows=max(1, num_samples // 4))
+
+    with Uploader(backend) as uploader:
+        for seed in derive_seeds(0, np.arange(num_samples)):
+            seed = int(seed)
+
+            with timer.time("sampling"):
+                np.random.seed(seed)
+                usat_state_parameters = parse_from_config(yaml_path)
+
+            with timer.time("xml_build"):
+                usat_state_parameters_xml = build_xml_config(usat_state_parameters)
+
+            with timer.time("xml_serialize"):
+                xml = serialize_xml_config(usat_state_parameters_xml)
+
+            with timer.time("xml_round_trip"):
+                ET.fromstring(xml)
+
+            with timer.time("xml_pretty"):
+                serialize_xml_config(usat_state_parameters_xml, pretty=True)
+
+            with timer.time("optimizer"):
+                output_dict = optimizer(usat_state_parameters_xml)
+
+            with timer.time("save"):
+                saved_dir = write_decoding_result((yaml_path, seed), xml, output_dict, results_dir)
+
+            with timer.time("shard_save"):
+                write_decoding_result_to_shard((yaml_path, seed), xml, output_dict, shard_writer)
+
+            with timer.time("upload"):
+                report_failures(uploader.upload_directory(saved_dir, f"{BENCHMARK_CONFIG_NAME}/seed_{seed}"))
+
+    with timer.time("shard_close"):
+        shard_writer.close()
+
+
+def run_load_benchmark(work_dir, timer):
+    """Times reading back every matrix the stage benchmarks wrote, per seed directory and per shard."""
+    results_dir = os.path.join(work_dir, "outputs", BENCHMARK_CONFIG_NAME)
+
+    for folder_name in sorted(os.listdir(results_dir)):
+        seed = int(folder_name.split("_")[-1])
+        with timer.time("load_seed_dir"):
+            matrix_codecs.read_npz(dataset.seed_dir_files(os.path.join(results_dir, folder_name), seed)[0])
+
+    for path_base in dataset.list_shards(os.path.join(work_dir, "shards")):
+        with timer.time("load_shard"):
+            reader = dataset.ShardReader(path_base)
+            for key in reader.keys:
+                reader.matrices(key)
+
+
+def run_end_to_end_benchmark(yaml_path, num_samples, num_workers, optimizer, work_dir, queue_size=4):
+    """Samples per second through the worker pool and the save/upload pipeline."""
+    output_dir  = os.path.join(work_dir, "end_to_end")
+    backend     = LocalBackend(os.path.join(work_dir, "end_to_end_bucket"))
+    tasks       = [(yaml_path, int(seed)) for seed in derive_seeds(1, np.arange(num_samples))]
+
+    with Uploader(backend) as uploader:
+        def write_result(item):
+            return write_decoding_result(*item, output_dir)
+
+        def upload_result(item, saved_dir):
+            return report_failures(uploader.upload_directory(saved_dir, f"{BENCHMARK_CONFIG_NAME}/seed_{item[0][1]}"))
+
+        start = time.perf_counter()
+        with Pipeline(write_result, upload_result, queue_size=queue_size) as pipeline:
+            for task, xml, output_dict in iter_decodings(tasks,
+                                                         num_workers=num_workers,
+                                                         initializer=configure_worker,
+                                                         initargs=(None, None, False, None, None, None, optimizer)):
+                if "error_message" in output_dict:
+                    raise RuntimeError(f"Benchmark decoding failed: {output_dict['error_message']}")
+                pipeline.submit((task, xml, output_dict))
+
+    return num_samples / (time.perf_counter() - start)
+
+
+def run_benchmark(yaml_path, num_samples=100, num_workers=1, optimizer=None, work_dir=None):
+    optimizer   = optimizer if optimizer is not None else FakeOptimizer()
+    cleanup     = work_dir is None
+    work_dir    = work_dir or tempfile.mkdtemp(prefix="usat_benchmark_")
+    timer       = StageTimer()
+
+    try:
+        run_stage_benchmarks(yaml_path, num_samples, optimizer, work_dir, timer)
+        run_load_benchmark(work_dir, timer)
+        end_to_end = run_end_to_end_benchmark(yaml_path, num_samples, num_workers, optimizer, work_dir)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    stages          = timer.summary()
+    per_sample      = sum(stats["total"] for name, stats in stages.items() if not name.startswith("load"))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {
+            "config": os.path.basename(yaml_path),
+            "num_samples": num_samples,
+            "num_workers": num_workers,
+            "optimizer": vars(optimizer) if isinstance(optimizer, FakeOptimizer) else repr(optimizer),
+        },
+        "stages": stages,
+        "samples_per_second": {
+            "sequential": num_samples / per_sample if per_sample > 0 else 0.0,
+            "end_to_end": end_to_end,
+        },
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """Stages whose median latency grew, or throughputs that dropped, by more than tolerance."""
+    if results["parameters"] != baseline.get("parameters"):
+        print("Warning: benchmark parameters differ from the baseline, comparison may not be meaningful")
+
+    regressions = []
+    for name, stats in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base and stats["p50"] > base["p50"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {stats['p50'] * 1e3:.2f} ms vs baseline {base['p50'] * 1e3:.2f} ms")
+
+    for name, value in results["samples_per_second"].items():
+        base = baseline.get("samples_per_second", {}).get(name)
+        if base and value < base * (1 - tolerance):
+            regressions.append(f"{name}: {value:.2f} samples/s vs baseline {base:.2f} samples/s")
+
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'stage':<18}{'count':>7}" + "".join(f"{f'p{p} (ms)':>12}" for p in PERCENTILES)
+          + (f"{'baseline p50':>14}" if baseline else ""))
+
+    for name, stats in results["stages"].items():
+        line = f"{name:<18}{stats['count']:>7}" + "".join(f"{stats[f'p{p}'] * 1e3:>12.3f}" for p in PERCENTILES)
+        if baseline:
+            base = baseline.get("stages", {}).get(name)
+            line += f"{base['p50'] * 1e3:>14.3f}" if base else f"{'-':>14}"
+        print(line)
+
+    for name, value in results["samples_per_second"].items():
+        base = (baseline or {}).get("samples_per_second", {}).get(name)
+        print(f"{name} samples/s: {value:.2f}" + (f" (baseline {base:.2f})" if base else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline with a stand-in optimizer and local storage.")
+    parser.add_argument("-c", "--config", type=str, required=True, help="Path to YAML config")
+    parser.add_argument("-n", "--num", type=int, default=100, help="Number of samples per benchmark")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes for end-to-end runs")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in optimizer latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the latency in seconds")
+    parser.add_argument("--busy", action="store_true", help="Spend the optimizer latency on the CPU instead of sleeping")
+    parser.add_argument("--points", type=int, default=1000, help="Cloud points in the stand-in matrices")
+    parser.add_argument("--speakers", type=int, default=12, help="Output speakers in the stand-in matrices")
+    parser.add_argument("--channels", type=int, default=36, help="Input channels in the stand-in matrices")
+    parser.add_argument("--work_dir", type=str, default=None, help="Keep benchmark files here instead of a temporary directory")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE_PATH, help="Baseline results to compare against")
+    parser.add_argument("--save_baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before reporting a regression")
+    parser.add_argument("--output", type=str, default=None, help="Also write the results as JSON to this path")
+
+    args = parser.parse_args()
+
+    optimizer = FakeOptimizer(latency=args.latency,
+                              jitter=args.jitter,
+                              num_points=args.points,
+                              num_speakers=args.speakers,
+                              num_channels=args.channels,
+                              busy=args.busy)
+
+    results = run_benchmark(args.config, args.num, args.workers, optimizer, args.work_dir)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    elif baseline is not None:
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
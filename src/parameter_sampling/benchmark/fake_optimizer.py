@@ -0,0 +1,74 @@
+import functools
+import time
+import zlib
+import numpy as np
+import xml.etree.ElementTree as ET
+from usat_designer.processing.constants import *
+
+
+@functools.lru_cache(maxsize=None)
+def fake_coordinates(num_points):
+    """Evenly spread unit-sphere points as the coordinates type the optimizer returns, built once per size."""
+    from universal_transcoder.auxiliars.my_coordinates import MyCoordinates
+
+    index       = np.arange(num_points) + 0.5
+    elevation   = np.arcsin(1 - 2 * index / num_points)
+    azimuth     = np.mod(np.pi * (1 + 5 ** 0.5) * index, 2 * np.pi) - np.pi
+    return MyCoordinates.mult_points(np.column_stack([azimuth, elevation, np.ones(num_points)]))
+
+
+class FakeOptimizer:
+    """
+    Stand-in for decode_usat_state_parameters with a fixed latency and matrix sizes. Outputs are
+    deterministic per parameter set and hold the same keys as the real optimizer's, so they go
+    through the real writers. With busy=True the latency is spent spinning on the CPU, like the
+    real optimizer, instead of sleeping.
+    """
+
+    # Warm starts replace the drawn transcoding matrix with the given one
+    accepts_initial_transcoding = True
+
+    def __init__(self,
+                 latency=0.05,
+                 jitter=0.0,
+                 num_points=1000,
+                 num_speakers=12,
+                 num_channels=36,
+                 busy=False):
+
+        self.latency        = latency
+        self.jitter         = jitter
+        self.num_points     = num_points
+        self.num_speakers   = num_speakers
+        self.num_channels   = num_channels
+        self.busy           = busy
+
+    def _wait(self, rng):
+        duration = max(0.0, self.latency + self.jitter * rng.standard_normal())
+        if not self.busy:
+            time.sleep(duration)
+            return
+
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            pass
+
+    def __call__(self, usat_state_parameters_xml, initial_transcoding=None):
+        digest  = zlib.crc32(ET.tostring(usat_state_parameters_xml))
+        rng     = np.random.default_rng(digest)
+        self._wait(rng)
+
+        G = rng.standard_normal((self.num_points, self.num_channels))
+        T = rng.standard_normal((self.num_speakers, self.num_channels)) if initial_transcoding is None \
+            else np.asarray(initial_transcoding)
+        D = T.copy()
+        S = G @ T.T
+
+        return {
+            DSN_OUT_SPEAKER_MATRIX: S,
+            DSN_OUT_DECODING_MATRIX: D,
+            DSN_OUT_ENCODING_MATRIX: G,
+            DSN_OUT_TRANSCODING_MATRIX: T,
+            DSN_OUT_CLOUD: fake_coordinates(self.num_points),
+            DSN_OUT_OUTPUT_LAYOUT: fake_coordinates(self.num_speakers),
+        }
@@ -2,4 +2,6 @@
 DSN_SMPL_UNIFORM     = "uniform"
 DSN_SMPL_NORMAL      = "normal"
 DSN_SMPL_CHOICE      = "choice"
-DSN_SMPL_BETA        = "beta"
\ No newline at end of file
+DSN_SMPL_BETA        = "beta"
+DSN_SMPL_NONE        = "none"
+DSN_SMPL_LOGNORMAL   = "lognormal"
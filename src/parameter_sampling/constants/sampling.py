@@ -9,4 +9,24 @@ DSN_SMPL_OUTPUT_LAYOUT_DESC     = "OutputLayoutDescription"
 DSN_SMPL_QUALITY_SCORE          = "quality_score"
 DSN_SMPL_APPARENT_SOURCE_WIDTH  = "median_source_width"
 DSN_SMPL_SEED                   = "seed"
-DSN_SMPL_P                      = "P"
\ No newline at end of file
+DSN_SMPL_P                      = "P"
+
+# Sampling Methods
+DSN_SMPL_SAMPLING               = "Sampling"
+DSN_SMPL_METHOD                 = "Method"
+DSN_SMPL_SCRAMBLE               = "Scramble"
+DSN_SMPL_METHOD_RANDOM          = "random"
+DSN_SMPL_METHOD_SOBOL           = "sobol"
+DSN_SMPL_METHOD_LHS             = "lhs"
+
+# Supervision
+DSN_SMPL_SUPERVISION            = "Supervision"
+DSN_SMPL_TIMEOUT                = "Timeout"
+DSN_SMPL_MAX_MEMORY_GB          = "MaxMemoryGB"
+
+# Sweeps
+DSN_SWEEP_CONFIGS               = "Configs"
+DSN_SWEEP_CONFIG                = "Config"
+DSN_SWEEP_NUM                   = "Num"
+DSN_SWEEP_WEIGHT                = "Weight"
+DSN_SWEEP_PRIORITY              = "Priority"
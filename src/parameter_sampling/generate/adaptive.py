@@ -0,0 +1,156 @@
+import numpy as np
+from usat_designer.processing.constants import *
+from parameter_sampling.generate.sampler import build_state_parameters
+from parameter_sampling.utils.metrics import compute_decoding_metrics
+
+
+def score_output(output_dict):
+    # Same quality score and focus P as the analysis notebook, None for failed decodings
+    if "error_message" in output_dict:
+        return None
+
+    return compute_decoding_metrics(output_dict[DSN_OUT_CLOUD],
+                                    output_dict[DSN_OUT_SPEAKER_MATRIX],
+                                    output_dict[DSN_OUT_OUTPUT_LAYOUT])
+
+
+def _coefficient_spread(distribution, args):
+    # Prior scale used to size perturbations of each coefficient
+    if distribution == DSN_SMPL_UNIFORM:
+        low, high = args
+        return (high - low) / np.sqrt(12)
+    if distribution == DSN_SMPL_NORMAL:
+        return args[1]
+    if distribution == DSN_SMPL_LOGNORMAL:
+        mean, sigma = args
+        return np.exp(mean) * sigma
+    if distribution == DSN_SMPL_BETA:
+        a, b = args
+        return np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+    if distribution == DSN_SMPL_CHOICE:
+        return float(np.std(np.asarray(args, dtype=float)))
+    return 0.0
+
+
+def _clip_to_support(value, distribution, args):
+    if distribution == DSN_SMPL_UNIFORM:
+        return float(np.clip(value, *args))
+    if distribution in (DSN_SMPL_NORMAL, DSN_SMPL_LOGNORMAL):
+        return max(value, 0.0)
+    if distribution == DSN_SMPL_BETA:
+        return float(np.clip(value, 0.0, 1.0))
+    if distribution == DSN_SMPL_CHOICE:
+        choices = np.asarray(args, dtype=float)
+        return float(choices[np.argmin(np.abs(choices - value))])
+    return value
+
+
+def _format_choice(usat_state_parameters, is_input):
+    settings    = usat_state_parameters[DSN_XML_SETTINGS]
+    fmt         = settings[DSN_XML_INPUT_TYPE if is_input else DSN_XML_OUTPUT_TYPE]
+
+    if fmt == DSN_XML_AMBISONICS:
+        if is_input:
+            return fmt, usat_state_parameters[DSN_XML_INPUT_AMBISONICS][DSN_XML_AMBISONICS_ORDER_IN]
+        return fmt, usat_state_parameters[DSN_XML_OUTPUT_AMBISONICS][DSN_XML_AMBISONICS_ORDER_OUT]
+
+    if is_input:
+        return fmt, usat_state_parameters[DSN_SMPL_INPUT_LAYOUT_DESC]
+    return fmt, usat_state_parameters[DSN_SMPL_OUTPUT_LAYOUT_DESC]
+
+
+class AdaptiveProposer:
+    """
+    Proposes coefficient sets round by round. A share of every round is drawn from the
+    configured prior; the rest perturbs completed samples that passed the quality threshold,
+    favouring those whose focus P falls in sparsely covered bins. Perturbation steps shrink
+    every round.
+    """
+
+    def __init__(self,
+                 sampler,
+                 quality_threshold=75,
+                 explore_fraction=0.3,
+                 num_p_bins=20,
+                 step_scale=0.5,
+                 step_decay=0.7):
+
+        self.sampler            = sampler
+        self.quality_threshold  = quality_threshold
+        self.explore_fraction   = explore_fraction
+        self.num_p_bins         = num_p_bins
+        self.step_scale         = step_scale
+        self.step_decay         = step_decay
+        self.round              = 0
+        self.history            = []  # (usat_state_parameters, quality score, P)
+
+    def record(self, usat_state_parameters, metrics):
+        if metrics is None:
+            return
+        self.history.append((usat_state_parameters,
+                             metrics[DSN_SMPL_QUALITY_SCORE],
+                             metrics[DSN_SMPL_P]))
+
+    def useful(self):
+        return [entry for entry in self.history if entry[1] > self.quality_threshold]
+
+    def _parent_weights(self, parents):
+        qualities   = np.maximum([quality for _, quality, _ in parents], 1e-6)
+        p_values    = np.array([p for _, _, p in parents])
+        useful      = self.useful()
+
+        # Coverage of P among useful samples, so sparse bins get more proposals
+        useful_p    = np.array([p for _, _, p in useful]) if useful else p_values
+        low, high   = min(useful_p.min(), p_values.min()), max(useful_p.max(), p_values.max())
+        edges       = np.linspace(low, high + 1e-9, self.num_p_bins + 1)
+        counts, _   = np.histogram(useful_p, bins=edges)
+        bins        = np.clip(np.searchsorted(edges, p_values, side="right") - 1, 0, self.num_p_bins - 1)
+
+        weights = (qualities / 100.0) / (1.0 + counts[bins])
+        return weights / weights.sum()
+
+    def _perturb(self, parent, step, rng):
+        coeffs = dict(parent[DSN_XML_COEFFICIENTS])
+        for name, distribution, args in self.sampler.coefficients:
+            if distribution == DSN_SMPL_NONE:
+                continue
+            value           = coeffs[name] + rng.normal(0.0, step * _coefficient_spread(distribution, args))
+            coeffs[name]    = round(_clip_to_support(value, distribution, args))
+
+        return build_state_parameters(coeffs,
+                                      *_format_choice(parent, is_input=True),
+                                      *_format_choice(parent, is_input=False))
+
+    def propose(self, num_samples, rng):
+        proposals = []
+        if self.history:
+            parents = self.useful()
+            if not parents:
+                # Nothing above threshold yet, climb from the best tenth
+                ranked  = sorted(self.history, key=lambda entry: entry[1], reverse=True)
+                parents = ranked[:max(1, len(ranked) // 10)]
+
+            num_exploit = int(round(num_samples * (1 - self.explore_fraction)))
+            weights     = self._parent_weights(parents)
+            step        = self.step_scale * self.step_decay ** self.round
+
+            for index in rng.choice(len(parents), size=num_exploit, p=weights):
+                proposals.append(self._perturb(parents[index][0], step, rng))
+
+        while len(proposals) < num_samples:
+            proposals.append(self.sampler.sample(rng))
+
+        self.round += 1
+        return proposals
+
+    def summary(self):
+        useful = self.useful()
+        if not self.history:
+            return "no completed samples"
+
+        p_values = [p for _, _, p in useful]
+        coverage = ""
+        if p_values:
+            coverage = f", P range [{min(p_values):.2f}, {max(p_values):.2f}]"
+        return (f"{len(useful)}/{len(self.history)} samples above quality "
+                f"{self.quality_threshold}{coverage}")
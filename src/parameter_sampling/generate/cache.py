@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import pickle
+from usat_designer.processing.constants import *
+
+# Bump when the optimizer or the stored output format changes, so old entries stop matching
+CACHE_VERSION           = 1
+EVICTION_LOW_WATERMARK  = 0.9
+
+
+def canonical_parameters(usat_state_parameters):
+    """
+    Reduces sampled parameters to plain JSON types with a stable key order. Speaker layouts
+    are identified by their description, since they are resolved from sl.SPEAKER_LAYOUTS by name.
+    """
+    def plain(value):
+        if hasattr(value, "item"):
+            value = value.item()
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return value if isinstance(value, (int, float)) else str(value)
+
+    def section(name):
+        return {str(key): plain(val) for key, val in usat_state_parameters.get(name, {}).items()}
+
+    return {
+        "version": CACHE_VERSION,
+        DSN_XML_SETTINGS: section(DSN_XML_SETTINGS),
+        DSN_XML_INPUT_AMBISONICS: section(DSN_XML_INPUT_AMBISONICS),
+        DSN_XML_OUTPUT_AMBISONICS: section(DSN_XML_OUTPUT_AMBISONICS),
+        DSN_SMPL_INPUT_LAYOUT_DESC: str(usat_state_parameters.get(DSN_SMPL_INPUT_LAYOUT_DESC, "")),
+        DSN_SMPL_OUTPUT_LAYOUT_DESC: str(usat_state_parameters.get(DSN_SMPL_OUTPUT_LAYOUT_DESC, "")),
+        DSN_XML_COEFFICIENTS: section(DSN_XML_COEFFICIENTS),
+    }
+
+
+def parameters_cache_key(usat_state_parameters):
+    canonical = json.dumps(canonical_parameters(usat_state_parameters), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Local-directory cache of optimizer outputs keyed by parameters_cache_key. Entries are
+    pickled output dicts; the least recently used ones are evicted once max_bytes is exceeded.
+    Safe to share between worker processes: writes are atomic renames.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir  = cache_dir
+        self.max_bytes  = max_bytes
+        self._size      = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                if not file_name.endswith(".pkl"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                output_dict = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError) as e:
+            print(f"Dropping corrupt cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return output_dict
+
+    def put(self, key, output_dict):
+        path        = self._path(key)
+        tmp_path    = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(tmp_path, "wb") as f:
+            pickle.dump(output_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self._size = self.size() + os.path.getsize(path)
+        if self.max_bytes is not None and self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        entries     = sorted(self._entries())
+        total       = sum(size for _, size, _ in entries)
+        target      = self.max_bytes * EVICTION_LOW_WATERMARK
+        num_evicted = 0
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            if self._remove(path):
+                total       -= size
+                num_evicted += 1
+
+        self._size = total
+        print(f"Evicted {num_evicted} cache entries, cache size now {total / 1e9:.2f} GB")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+_result_cache = None
+
+def configure_result_cache(cache_dir, max_bytes=None):
+    global _result_cache
+    _result_cache = ResultCache(cache_dir, max_bytes) if cache_dir else None
+    return _result_cache
+
+def get_result_cache():
+    return _result_cache
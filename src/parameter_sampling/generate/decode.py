@@ -1,15 +1,32 @@
 import xml.etree.ElementTree as ET
 from usat_designer.processing.constants import *
+from usat_designer.processing.launch_usat import parse_encoding_settings
 from usat_designer.processing.optimize_usat_designer import optimize_for_usat_designer
 
-def decode_for_random_parameter_generation(xml_string: str) -> dict:
+# Optimization dict entry holding the starting transcoding matrix of a warm-started run
+INITIAL_TRANSCODING_KEY = "T_initial"
+
+def decode_for_random_parameter_generation(xml_string: str, initial_transcoding=None) -> dict:
     usat_state_parameters_xml   = ET.fromstring(xml_string)
+    return decode_usat_state_parameters(usat_state_parameters_xml, initial_transcoding)
+
+def decode_usat_state_parameters(usat_state_parameters_xml: ET.Element, initial_transcoding=None) -> dict:
+    # In-memory entry point: takes the element built by build_xml_config without a serialise/parse round trip
     optimization_dict           = parse_encoding_settings(usat_state_parameters_xml)
     
     optimization_dict["show_results"]       = False
     optimization_dict["save_results"]       = False
     optimization_dict["results_file_name"]  = None
+
+    # Start from a nearby solved decoding instead of the optimizer's default guess
+    if initial_transcoding is not None:
+        optimization_dict[INITIAL_TRANSCODING_KEY] = initial_transcoding
     
     output_data = optimize_for_usat_designer(optimization_dict) 
-    print(output_data.keys())
-    return output_data
\ No newline at end of file
+    return output_data
+
+# Warm starts are only passed on when the optimizer declares that it reads INITIAL_TRANSCODING_KEY,
+# through the same attribute stand-in decoders set
+decode_usat_state_parameters.accepts_initial_transcoding = bool(getattr(optimize_for_usat_designer,
+                                                                        "accepts_initial_transcoding",
+                                                                        False))
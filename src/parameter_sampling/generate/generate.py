@@ -1,95 +1,65 @@
 import sys
 import os
+import time
+
+# Measured from here, recorded as the "import" stage of every run
+_IMPORT_START = time.perf_counter()
 
 TOP_LEVEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if TOP_LEVEL_DIR not in sys.path:
     sys.path.insert(0, TOP_LEVEL_DIR)
 
 import numpy as np
-import usat_designer.processing.speaker_layouts as sl
 import xml.etree.ElementTree as ET
 import xml.dom.minidom as minidom
-import yaml
 from usat_designer.processing.constants import *
-from usat_designer.processing.launch_usat import decode_for_random_parameter_generation
 from usat_designer.utils import parameter_utils as pu
-import usat_designer.utils.directory_utils as dir_utils
-import time
+from parameter_sampling.generate.pipeline import Pipeline
+from parameter_sampling.generate.parallel import imap_bounded, imap_supervised, sigterm_as_interrupt
+from parameter_sampling.generate.sampler import load_sampler, to_structured, derive_seeds
+from parameter_sampling.generate import sharding
+from parameter_sampling.generate.cache import configure_result_cache, get_result_cache, parameters_cache_key
+from parameter_sampling.generate.warm_start import WARM_START_LOG_FILE_NAME, configure_warm_start, get_warm_start_index
+from parameter_sampling.generate import instrumentation as instr
+from parameter_sampling.utils.uploader import Uploader, make_backend, report_failures
+from parameter_sampling.utils import dataset
+from parameter_sampling.utils import artifacts
+from parameter_sampling.utils import matrix_codecs
+import json
+import threading
 import traceback
 import argparse
 import warnings
 import tempfile
 import secrets
 
+IMPORT_SECONDS      = time.perf_counter() - _IMPORT_START
+_imports_recorded   = False
 
-def parse_from_config(yaml_file):
-
-    with open(yaml_file, "r") as file:
-        config = yaml.safe_load(file)
-    
-    # COEFFICIENTS
-    coeff_config = config.get(DSN_XML_COEFFICIENTS, {})
-    coeffs = {}
-
-    for coeff_name, coeff_data in coeff_config.items():
-        coeff_distribution = coeff_data.get(DSN_SMPL_DISTRIBUTION)
-        coeff_range        = coeff_data.get(DSN_SMPL_DISTRIBUTION_ARGS)
-        coeff_value        = round(get_y_i(coeff_distribution, coeff_range))
-        coeffs[coeff_name] = coeff_value
-
-    # FORMATS
-    default_ambisonics_order = 1
-    
-    input_data  = get_random_x_lambda(config[DSN_SMPL_INPUT_FORMAT])
-    output_data = get_random_x_lambda(config[DSN_SMPL_OUTPUT_FORMAT])
-
-    encoding_settings = {
-        DSN_XML_INPUT_TYPE: input_data[0],
-        DSN_XML_OUTPUT_TYPE: output_data[0]
-    }
-
-    input_ambisonics    = {DSN_XML_AMBISONICS_ORDER_IN: default_ambisonics_order}
-    output_ambisonics   = {DSN_XML_AMBISONICS_ORDER_OUT: default_ambisonics_order}
 
-    input_speaker_layout    = []
-    output_speaker_layout   = []
-    input_layout_desc       = ""
-    output_layout_desc      = ""
+# Optimizer entry point used by generate_decoding_data, replaceable by a stand-in for benchmarks.
+# The optimizer stack is only imported when the first decoding needs it
+_decoder = None
 
-    if input_data[0] == DSN_XML_AMBISONICS:
-        input_ambisonics[DSN_XML_AMBISONICS_ORDER_IN] = input_data[1]
+def configure_decoder(decoder=None):
+    global _decoder
+    _decoder = decoder
+    return _decoder
 
-    elif input_data[0] == DSN_XML_SPEAKER_LAYOUT:
-        input_layout_desc = input_data[1]
-        input_speaker_layout = sl.SPEAKER_LAYOUTS.get(input_layout_desc)
-        if input_speaker_layout is None:
-            print(f"Warning: input layout '{input_layout_desc}' not found!")
-    else:
-        raise ValueError("Input format not supported.")
+def get_decoder():
+    global _decoder
+    if _decoder is None:
+        from parameter_sampling.generate.decode import decode_usat_state_parameters
+        _decoder = decode_usat_state_parameters
+    return _decoder
 
-    if output_data[0] == DSN_XML_AMBISONICS:
-        output_ambisonics[DSN_XML_AMBISONICS_ORDER_OUT] = output_data[1]
+def decoder_accepts_initial_transcoding():
+    # Decoders declare whether they use a starting point, see decode.py
+    return bool(getattr(get_decoder(), "accepts_initial_transcoding", False))
 
-    elif output_data[0] == DSN_XML_SPEAKER_LAYOUT:
-        output_layout_desc      = output_data[1]
-        output_speaker_layout   = sl.SPEAKER_LAYOUTS.get(output_layout_desc)
-        
-        if output_speaker_layout is None:
-            print(f"Warning: output layout '{output_layout_desc}' not found!")
 
-    else:
-        raise ValueError("Output format not supported.")
-    
-    return {
-        DSN_XML_SETTINGS: encoding_settings,
-        DSN_XML_INPUT_AMBISONICS: input_ambisonics,
-        DSN_XML_OUTPUT_AMBISONICS: output_ambisonics,
-        DSN_XML_INPUT_SPEAKER_LAYOUT: input_speaker_layout,
-        DSN_XML_OUTPUT_SPEAKER_LAYOUT: output_speaker_layout,
-        DSN_SMPL_INPUT_LAYOUT_DESC: input_layout_desc,
-        DSN_SMPL_OUTPUT_LAYOUT_DESC: output_layout_desc,
-        DSN_XML_COEFFICIENTS: coeffs
-    }
+def parse_from_config(yaml_file):
+    return load_sampler(yaml_file).sample(np.random)
 
 def get_random_x_lambda(config_section):
     formats         = config_section.get(DSN_SMPL_FORMAT_CHOICES)
@@ -180,28 +150,69 @@ def build_xml_config(usat_state_parameters):
     return state_params_xml
     
 
+def serialize_xml_config(usat_state_parameters_xml, pretty=False):
+    xml_string = ET.tostring(usat_state_parameters_xml, encoding="unicode", method="xml")
+    if not pretty:
+        return xml_string
+    
+    return str(minidom.parseString(xml_string).toprettyxml(indent="  "))
+    
+
 def generate_decoding_data(args):
 
-    yaml_file, seed = args
+    # Tasks are (yaml_file, seed) or (yaml_file, seed, pre-sampled parameters)
+    yaml_file, seed, *planned_parameters = args
     if seed is not None:
         np.random.seed(seed)
 
-    pretty_xml = None 
+    usat_state_parameters_xml = None
 
     print(f"Running in PID {os.getpid()} with seed {seed}")
     
     try:
-        usat_state_parameters_dict  = parse_from_config(yaml_file)
-        usat_state_parameters_xml   = build_xml_config(usat_state_parameters_dict)
+        with instr.stage(instr.STAGE_SAMPLING, seed):
+            if planned_parameters:
+                usat_state_parameters_dict = planned_parameters[0]
+            else:
+                usat_state_parameters_dict = parse_from_config(yaml_file)
         
-        xml_bytes   = ET.tostring(usat_state_parameters_xml, encoding="utf-8", method="xml")
-        parsed_xml  = minidom.parseString(xml_bytes)
-        pretty_xml  = str(parsed_xml.toprettyxml(indent="  "))
+        # The element goes straight to the optimizer, XML text is only produced for the saved artifact
+        with instr.stage(instr.STAGE_XML_BUILD, seed):
+            usat_state_parameters_xml = build_xml_config(usat_state_parameters_dict)
         
+        # Identical parameter sets reuse a previous optimizer result
+        result_cache    = get_result_cache()
+        cache_key       = None
+        if result_cache is not None:
+            cache_key   = parameters_cache_key(usat_state_parameters_dict)
+            output_dict = result_cache.get(cache_key)
+            if output_dict is not None:
+                print(f"Cache hit for seed {seed} ({cache_key[:12]})")
+                return serialize_xml_config(usat_state_parameters_xml), output_dict
+
+        # Seed the optimizer with the closest solved decoding of the same format pair
+        warm_start                      = get_warm_start_index()
+        initial_transcoding, distance   = None, None
+        if warm_start is not None:
+            initial_transcoding, distance = warm_start.nearest(usat_state_parameters_dict)
+
         warnings.filterwarnings("ignore")
-        output_dict = decode_for_random_parameter_generation(pretty_xml)
+        optimize_start  = time.perf_counter()
+        with instr.stage(instr.STAGE_OPTIMIZER, seed):
+            output_dict = get_decoder()(usat_state_parameters_xml, initial_transcoding=initial_transcoding)
+
+        if warm_start is not None:
+            warm_start.log(seed, initial_transcoding is not None, distance, time.perf_counter() - optimize_start, output_dict)
+            warm_start.record(usat_state_parameters_dict, output_dict)
+
+        if cache_key is not None:
+            result_cache.put(cache_key, output_dict)
+
+        with instr.stage(instr.STAGE_XML_SERIALIZE, seed) as info:
+            xml_string      = serialize_xml_config(usat_state_parameters_xml)
+            info["bytes"]   = len(xml_string)
     
-        return pretty_xml, output_dict
+        return xml_string, output_dict
     
     except Exception as e:
         tb_str = traceback.format_exc()
@@ -211,54 +222,488 @@ def generate_decoding_data(args):
             "error_message": e,
             "traceback": tb_str 
         }
-        return pretty_xml, output_dict
+        
+        xml = None
+        if usat_state_parameters_xml is not None:
+            xml = serialize_xml_config(usat_state_parameters_xml)
+        return xml, output_dict
+
+
+def configure_worker(cache_dir=None, 
+                     cache_max_bytes=None, 
+                     warm_start=False, 
+                     warm_start_dir=None, 
+                     warm_start_log_path=None, 
+                     stage_log_path=None, 
+                     decoder=None):
+    # Per-process state, set up once in every worker (or in-process for a single worker)
+    configure_decoder(decoder)
+    configure_result_cache(cache_dir, cache_max_bytes)
+
+    # Starting points are only looked up when the optimizer would use them
+    warm_start = warm_start or bool(warm_start_dir)
+    if warm_start and not decoder_accepts_initial_transcoding():
+        print("The optimizer does not declare accepts_initial_transcoding, running without warm start")
+        warm_start, warm_start_dir = False, None
+    configure_warm_start(warm_start_dir, enabled=warm_start, log_path=warm_start_log_path)
+    instr.configure_instrumentation(stage_log_path)
+
+
+def run_decoding_task(task):
+    xml, output_dict = generate_decoding_data(task)
+    return task, xml, output_dict
+
+
+def supervised_failure_result(task, failure):
+    # The worker was killed, so the parameters are redrawn here from the task's seed. Nothing is
+    # saved for the seed (the XML is None), the failure is only listed in failures.jsonl
+    yaml_file, seed, *planned_parameters = task
+    parameters = None
+    try:
+        if planned_parameters:
+            parameters = planned_parameters[0]
+        else:
+            np.random.seed(seed)
+            parameters = parse_from_config(yaml_file)
+    except Exception as e:
+        print(f"Could not rebuild the parameters of seed {seed}: {e}")
+
+    output_dict = {
+        "error_message": str(failure),
+        "traceback": "",
+        "failure": {
+            "seed": None if seed is None else int(seed),
+            "reason": failure.reason,
+            "elapsed": failure.elapsed,
+            "detail": failure.detail,
+            "parameters": parameters,
+        },
+    }
+    return task, None, output_dict
 
 
-def main(num_decodings_targeted, yaml_path, bucket_name):
+def iter_decodings(tasks, 
+                   num_workers=1, 
+                   max_in_flight=None, 
+                   ordered=True, 
+                   initializer=None, 
+                   initargs=(),
+                   timeout=None,
+                   max_memory_bytes=None):
+    
+    # Limits can only be enforced on a child process, so supervised runs never decode in-process
+    if timeout or max_memory_bytes:
+        yield from imap_supervised(run_decoding_task,
+                                   tasks,
+                                   num_workers=max(1, num_workers),
+                                   on_failure=supervised_failure_result,
+                                   timeout=timeout,
+                                   max_memory_bytes=max_memory_bytes,
+                                   ordered=ordered,
+                                   initializer=initializer,
+                                   initargs=initargs)
+        return
+
+    if num_workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+
+        for task in tasks:
+            yield run_decoding_task(task)
+        return
+
+    yield from imap_bounded(run_decoding_task,
+                            tasks,
+                            num_workers=num_workers,
+                            max_in_flight=max_in_flight,
+                            ordered=ordered,
+                            initializer=initializer,
+                            initargs=initargs)
+
+
+def plan_decodings(yaml_file, output_dir, num_decodings_targeted, job_seed=None, task_index=0, task_count=1):
+    if job_seed is None:
+        job_seed = secrets.randbits(32)
+
+    # The plan is drawn for the whole job with one stream per task; each task draws only its own
+    # stream, which holds its rows of sharding.shard_indices
+    sampler     = load_sampler(yaml_file)
+    table       = sampler.sample_stream(num_decodings_targeted * task_count, job_seed, task_index, task_count)
+    plan_path   = os.path.join(output_dir, f"parameter_plan_{job_seed}_task_{task_index}_of_{task_count}.npy")
+    
+    np.save(plan_path, to_structured(table))
+    print(f"Pre-generated {num_decodings_targeted} parameter sets (job seed {job_seed}) to: {plan_path}")
+
+    return [(yaml_file, int(table[DSN_SMPL_SEED][i]), sampler.parameters_from_row(table, i))
+            for i in range(num_decodings_targeted)]
+
+
+def write_decoding_result(task, xml, output_dict, output_dir, artifact_store=None, codec=None):
+    seed = task[1]
+
+    # Create directory for results
+    results_dir = os.path.join(output_dir, f"seed_{seed}")
+    assert(isinstance(xml, str))
+
+    # Parameters and metadata are serialised by the designer; the matrices are written once below,
+    # already encoded and without the shared ones, instead of being rewritten after saving
+    matrices    = {key: output_dict[key] for key in artifacts.SEED_MATRIX_KEYS if key in output_dict}
+    saved_dir   = pu.save_output_data(xml, {key: value for key, value in output_dict.items() if key not in matrices},
+                                      seed, results_dir)
+    references  = artifacts.write_seed_matrices(saved_dir, seed, matrices, artifact_store, codec)
+    print(f"Saved output files to: {saved_dir}")
+
+    # Cloud, layout and encoding matrix are stored once per run and referenced from the seed
+    if artifact_store is not None:
+        artifacts.deduplicate_seed_dir(saved_dir, seed, artifact_store, references)
+    return saved_dir
+
+
+def upload_decoding_result(task, saved_dir, config_base_name, uploader):
+    print("Uploading to GCS...")
+    gcs_dir = f"{config_base_name}/seed_{task[1]}"
+    results = uploader.upload_directory(saved_dir, gcs_dir)
+    report_failures(results)
+    return results
+
+
+def write_decoding_result_to_shard(task, xml, output_dict, shard_writer, artifact_store=None):
+    # Reuse the per-seed serialisation, then pack the files into the current shard
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        saved_dir = write_decoding_result(task, xml, output_dict, tmp_dir, artifact_store)
+        return shard_writer.add_seed_dir(task[1], saved_dir)
+
+
+def upload_shard(flush, config_base_name, uploader):
+    if flush is None:
+        return []
+
+    print("Uploading shard to GCS...")
+    files   = [(path, f"{config_base_name}/{dataset.SHARD_DIR_NAME}/{os.path.basename(path)}")
+               for path in flush.paths]
+    results = uploader.upload_files(files)
+    report_failures(results)
+    return results
+
+
+_upload_artifacts_lock = threading.Lock()
+
+def upload_artifacts(artifact_store, config_base_name, uploader, uploaded):
+    # Artifacts are immutable, so each one is uploaded once per run. Uploads run on the upload
+    # thread and again on exit, the lock keeps callers from sharing the uploaded set mid-update
+    with _upload_artifacts_lock:
+        names = [name for name in artifact_store.names() if name not in uploaded]
+        if not names:
+            return []
+        results = uploader.upload_files([(artifact_store.path(name), f"{config_base_name}/{dataset.ARTIFACT_DIR_NAME}/{name}")
+                                         for name in names])
+        report_failures(results)
+        uploaded.update(name for name, result in zip(names, results) if result.ok)
+    return results
+
+
+def run_adaptive(yaml_file, 
+                 num_decodings_targeted, 
+                 num_rounds, 
+                 job_seed, 
+                 quality_threshold, 
+                 run_round, 
+                 save_result):
+    
+    # Imported here so that plain runs do not pull in the analysis metrics stack
+    from parameter_sampling.generate.adaptive import AdaptiveProposer, score_output
+
+    proposer        = AdaptiveProposer(load_sampler(yaml_file), quality_threshold=quality_threshold)
+    rng             = np.random.default_rng(job_seed)
+    round_size      = -(-num_decodings_targeted // num_rounds)
+    num_submitted   = 0
+
+    for round_index in range(num_rounds):
+        num_round = min(round_size, num_decodings_targeted - num_submitted)
+        if num_round <= 0:
+            break
+        
+        proposals       = proposer.propose(num_round, rng)
+        seeds           = derive_seeds(job_seed, np.arange(num_submitted, num_submitted + num_round))
+        tasks           = [(yaml_file, int(seed), params) for seed, params in zip(seeds, proposals)]
+        num_submitted   += num_round
+
+        for task, xml, output_dict in run_round(tasks):
+            save_result(task, xml, output_dict)
+            proposer.record(task[2], score_output(output_dict))
+
+        print(f"Adaptive round {round_index + 1}/{num_rounds}: {proposer.summary()}")
+
+
+def main(num_decodings_targeted, 
+         yaml_path, 
+         bucket_name, 
+         num_workers=1, 
+         max_in_flight=None, 
+         ordered=True,
+         job_seed=None,
+         pregenerate=False,
+         cache_dir=None,
+         cache_max_bytes=None,
+         adaptive_rounds=0,
+         quality_threshold=75,
+         sharded=False,
+         task_index=None,
+         task_count=None,
+         upload_workers=8,
+         queue_size=4,
+         output_format=dataset.OUTPUT_FORMAT_DIRS,
+         shard_size=1000,
+         warm_start=False,
+         warm_start_dir=None,
+         timeout=None,
+         max_memory_bytes=None,
+         shared_artifacts=False,
+         matrix_dtype=matrix_codecs.DTYPE_FLOAT64,
+         compression=matrix_codecs.COMPRESSION_NONE,
+         matrix_tolerance=matrix_codecs.DEFAULT_TOLERANCE,
+         write_chunk_bytes=matrix_codecs.DEFAULT_CHUNK_BYTES):
+
     start_time = time.time()
 
     if not yaml_path:
         print("No config file specified...")
         return
 
+    # Imported here: the directory helpers pull in the storage client
+    import usat_designer.utils.directory_utils as dir_utils
+
     # Create initial working directories
     dirs                = dir_utils.prepare_output_dir(yaml_path, bucket_name)
     config_base_name    = dirs[0] # Config name
     output_dir          = dirs[1] # Directory for this config file
     local_yaml_path     = dirs[2] # Path to yaml
 
-    # Upload YAML to GC bucket if applicable 
-    if bucket_name:
-            yaml_blob = f"{config_base_name}/{config_base_name}.yaml"
-            if not dir_utils.blob_exists(bucket_name, yaml_blob):
-                dir_utils.upload_blob_to_gcs(local_file_path=local_yaml_path,
-                                             bucket_name=bucket_name,
-                                             destination_blob_name=yaml_blob)
-
-    for i in range(1, num_decodings_targeted + 1):    
-        print(f"Starting iteration {i}...")
-
-        # Create directory for results
-        seed        = secrets.randbits(32)
-        results_dir = os.path.join(output_dir, f"seed_{seed}")
+    # Every process of the run appends its stage timings to one log
+    run_id          = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+    stage_log_path  = os.path.join(output_dir, "instrumentation", f"stages_{run_id}.jsonl")
+    instr.configure_instrumentation(stage_log_path)
 
-        # Generate data
-        xml, output_dict = generate_decoding_data((local_yaml_path, seed))
-        assert(isinstance(xml, str))
+    # Only the first run of a process paid for the imports
+    global _imports_recorded
+    if not _imports_recorded:
+        instr.record(instr.STAGE_IMPORT, IMPORT_SECONDS, module=__name__)
+        _imports_recorded = True
 
-        # Save and serialise output data
-        saved_dir = pu.save_output_data(xml, output_dict, seed, results_dir)
-        print(f"Saved output files to: {saved_dir}")
+    # Upload YAML to GC bucket if applicable 
+    backend     = None
+    uploader    = None
+    if bucket_name:
+        backend     = make_backend(bucket_name)
+        uploader    = Uploader(backend, max_workers=upload_workers)
+        yaml_blob   = f"{config_base_name}/{config_base_name}.yaml"
+        if not backend.exists(yaml_blob):
+            backend.upload_file(local_yaml_path, yaml_blob)
+            print(f"Uploaded file {local_yaml_path} to {backend.uri(yaml_blob)}")
+
+    # Sharded runs derive their seeds from the job, and resume from the manifest of completed seeds
+    manifest = None
+    if sharded:
+        if adaptive_rounds > 0:
+            raise ValueError("Adaptive rounds cannot be combined with sharded runs")
+
+        job_seed                = sharding.resolve_job_seed(job_seed)
+        task_index, task_count  = sharding.resolve_task_shard(task_index, task_count)
+        manifest_file           = sharding.manifest_name(job_seed, task_index, task_count)
+        manifest                = sharding.RunManifest(os.path.join(output_dir, "manifests", manifest_file),
+                                                       backend=backend,
+                                                       blob_name=f"{config_base_name}/manifests/{manifest_file}")
+        manifest.load()
+        print(f"Task {task_index}/{task_count} of job {job_seed}: {len(manifest.completed)} seeds already completed")
+    else:
+        task_index, task_count = 0, 1
+
+    if adaptive_rounds > 0 and job_seed is None:
+        job_seed = secrets.randbits(32)
+
+    sampler = load_sampler(local_yaml_path)
+
+    # Low-discrepancy designs only exist for the whole job, not per seed
+    if not pregenerate and not adaptive_rounds and sampler.method != DSN_SMPL_METHOD_RANDOM:
+        print("Low-discrepancy sampling method configured, pre-generating the parameter plan...")
+        pregenerate = True
+
+    # Command line limits take precedence over the config's Supervision section
+    timeout             = timeout if timeout is not None else sampler.timeout
+    max_memory_bytes    = max_memory_bytes if max_memory_bytes is not None else sampler.max_memory_bytes
+    if timeout or max_memory_bytes:
+        print(f"Supervising decodings: timeout {timeout or 'none'}s, "
+              f"memory ceiling {max_memory_bytes / 1e9 if max_memory_bytes else 'none'} GB")
+
+    failures_path       = os.path.join(output_dir, "failures.jsonl")
+    warm_start_log_path = os.path.join(warm_start_dir or os.path.join(output_dir, "instrumentation"),
+                                       WARM_START_LOG_FILE_NAME)
+
+    def run_round(round_tasks):
+        return iter_decodings(round_tasks, 
+                              num_workers, 
+                              max_in_flight, 
+                              ordered,
+                              initializer=configure_worker,
+                              initargs=(cache_dir, cache_max_bytes, warm_start, warm_start_dir, 
+                                        warm_start_log_path, stage_log_path),
+                              timeout=timeout,
+                              max_memory_bytes=max_memory_bytes)
+
+    codec = matrix_codecs.MatrixCodec(matrix_dtype, compression, matrix_tolerance, write_chunk_bytes)
+
+    # Shards roll over every shard_size decodings; the writer id keeps restarted tasks from overwriting shards
+    shard_writer = None
+    if output_format == dataset.OUTPUT_FORMAT_SHARDS:
+        shard_writer = dataset.ShardWriter(os.path.join(output_dir, dataset.SHARD_DIR_NAME),
+                                           writer_id=f"task_{task_index}_{secrets.token_hex(4)}",
+                                           max_rows=shard_size,
+                                           codec=codec)
+
+    artifact_store      = artifacts.store_for_results_dir(output_dir, codec) if shared_artifacts else None
+    uploaded_artifacts  = set()
+
+    num_completed   = 0
+    num_succeeded   = 0  # Decodings of this run that produced a result, for the throughput summary
+    failed_seeds    = set()
+
+    def uploaded(upload_results):
+        # Without a bucket there is nothing left to wait for once the files are written
+        return upload_results is None or all(result.ok for result in upload_results)
+
+    def mark_shard_completed(flush, upload_results=None):
+        # Seeds in a shard only count as done once the shard is written and uploaded, so a restart
+        # redoes the rest. Failed decodings are left out so that a restart retries them
+        if manifest is None or flush is None or not uploaded(upload_results):
+            return
+        for seed in flush.seeds:
+            if seed not in failed_seeds:
+                manifest.mark_completed(seed, shard=os.path.basename(flush.paths[0]))
+
+    def on_complete(item, written, upload_results):
+        nonlocal num_completed, num_succeeded
+        task, _, output_dict = item
+        num_completed += 1
+        print(f"Finished iteration {num_completed}/{num_decodings_targeted} (seed {task[1]})...")
+
+        # Timed out or killed decodings are listed with their parameters for a later retry
+        if "failure" in output_dict:
+            with open(failures_path, "a") as f:
+                f.write(json.dumps(output_dict["failure"], default=str) + "\n")
+
+        failed = "error_message" in output_dict
+        if failed:
+            failed_seeds.add(int(task[1]))
+        else:
+            num_succeeded += 1
+
+        if shard_writer is not None:
+            mark_shard_completed(written, upload_results)
+        elif manifest is not None and not failed and uploaded(upload_results):
+            manifest.mark_completed(task[1])
+
+    def write_result(item):
+        # Killed decodings, and errors raised before the XML was built, have nothing to save
+        if item[1] is None:
+            print(f"Nothing to save for seed {item[0][1]}: {item[2].get('error_message')}")
+            return None
+
+        with instr.stage(instr.STAGE_SAVE, item[0][1]) as info:
+            if shard_writer is not None:
+                flush           = write_decoding_result_to_shard(*item, shard_writer, artifact_store)
+                info["bytes"]   = sum(os.path.getsize(path) for path in flush.paths) if flush else 0
+                return flush
+
+            saved_dir       = write_decoding_result(*item, output_dir, artifact_store, codec)
+            info["bytes"]   = instr.directory_bytes(saved_dir)
+            return saved_dir
+
+    def upload_result(item, written):
+        with instr.stage(instr.STAGE_UPLOAD, item[0][1]) as info:
+            # Artifacts the seed refers to go first; failed ones are retried with every later
+            # upload, and their results count towards the seed being marked completed
+            results = []
+            if artifact_store is not None:
+                results = upload_artifacts(artifact_store, config_base_name, uploader, uploaded_artifacts)
+            if shard_writer is not None:
+                results = results + upload_shard(written, config_base_name, uploader)
+            elif written is not None:
+                results = results + upload_decoding_result(item[0], written, config_base_name, uploader)
+            info["bytes"] = sum(result.num_bytes for result in results)
+            return results
+
+    # Saving and uploading run on their own threads while the next decodings are optimized
+    pipeline = Pipeline(write_fn=write_result,
+                        upload_fn=upload_result if uploader is not None else None,
+                        on_complete=on_complete,
+                        queue_size=queue_size)
+
+    def save_result(task, xml, output_dict):
+        pipeline.submit((task, xml, output_dict))
 
-        # Upload to GCS
-        if bucket_name:
-            print("Uploading to GCS...")
-            gcs_dir = f"{config_base_name}/seed_{seed}"
-            dir_utils.upload_directory_to_gcs(saved_dir, bucket_name, gcs_dir)
+    try:
+        with sigterm_as_interrupt():
+            if adaptive_rounds > 0:
+                run_adaptive(local_yaml_path, 
+                             num_decodings_targeted, 
+                             adaptive_rounds, 
+                             job_seed,
+                             quality_threshold,
+                             run_round,
+                             save_result)
+            else:
+                # Each task carries its own seed, so results do not depend on which worker runs it
+                if pregenerate:
+                    tasks = plan_decodings(local_yaml_path, 
+                                           output_dir, 
+                                           num_decodings_targeted, 
+                                           job_seed, 
+                                           task_index, 
+                                           task_count)
+                elif sharded:
+                    seeds = sharding.shard_seeds(job_seed, task_index, task_count, num_decodings_targeted)
+                    tasks = [(local_yaml_path, int(seed)) for seed in seeds]
+                else:
+                    seeds = [secrets.randbits(32) for _ in range(num_decodings_targeted)]
+                    tasks = [(local_yaml_path, seed) for seed in seeds]
+
+                if manifest is not None:
+                    tasks           = [task for task in tasks if not manifest.is_completed(task[1])]
+                    num_completed   = num_decodings_targeted - len(tasks)
+
+                for task, xml, output_dict in run_round(tasks):
+                    save_result(task, xml, output_dict)
+
+    except KeyboardInterrupt:
+        print(f"Interrupted after {num_completed}/{num_decodings_targeted} decodings, stopping...")
+
+    finally:
+        # A failed stage is raised by close() only after the shard, manifest and uploads are finished
+        try:
+            pipeline.close()
+        finally:
+            upload_results = None
+            if artifact_store is not None and uploader is not None:
+                upload_results = upload_artifacts(artifact_store, config_base_name, uploader, uploaded_artifacts)
+            if shard_writer is not None:
+                # The last, partially filled shard
+                flush = shard_writer.close()
+                if uploader is not None:
+                    upload_results = (upload_results or []) + upload_shard(flush, config_base_name, uploader)
+                mark_shard_completed(flush, upload_results)
+            if manifest is not None:
+                manifest.sync()
+            if uploader is not None:
+                uploader.close()
 
     elapsed = time.time() - start_time
     print(f"Elapsed time: {elapsed}")
 
+    summary = instr.summarize_stage_log(stage_log_path, elapsed, num_succeeded)
+    instr.print_stage_summary(summary)
+    with open(stage_log_path.replace(".jsonl", "_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate random decoding data.")
@@ -278,8 +723,187 @@ if __name__ == "__main__":
         "-b", "--bucket_name",
         type=str,
         default=None,
-        help="GCS bucket to upload results to (optional)"
+        help="GCS bucket to upload results to, or file:///path for a local stand-in (optional)"
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes running decodings (1 runs in-process)"
+    )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=None,
+        help="Maximum number of queued decodings (defaults to 2 * workers)"
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Collect results as they complete instead of in seed order"
+    )
+    parser.add_argument(
+        "--job_seed",
+        type=int,
+        default=None,
+        help="Seed for the pre-generated parameter plan (random if omitted)"
+    )
+    parser.add_argument(
+        "--pregenerate",
+        action="store_true",
+        help="Draw all parameter sets up front in one vectorized batch and save the plan"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Directory of cached optimizer results, reused for identical parameter sets (optional)"
+    )
+    parser.add_argument(
+        "--cache_max_gb",
+        type=float,
+        default=None,
+        help="Evict least recently used cache entries above this size"
+    )
+    parser.add_argument(
+        "--adaptive_rounds",
+        type=int,
+        default=0,
+        help="Split the run into rounds that steer proposals towards high-quality, under-covered focus values"
+    )
+    parser.add_argument(
+        "--quality_threshold",
+        type=float,
+        default=75,
+        help="Quality score counted as useful by the adaptive mode"
+    )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Derive seeds from the job seed and task index, and resume from the task manifest "
+             "(implied when running as a Cloud Batch task)"
+    )
+    parser.add_argument(
+        "--task_index",
+        type=int,
+        default=None,
+        help=f"Index of this task in the job (defaults to ${sharding.BATCH_TASK_INDEX_ENV})"
+    )
+    parser.add_argument(
+        "--task_count",
+        type=int,
+        default=None,
+        help=f"Number of tasks in the job (defaults to ${sharding.BATCH_TASK_COUNT_ENV})"
+    )
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        default=8,
+        help="Number of concurrent file uploads"
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=4,
+        help="Capacity of the save and upload queues (bounds results held in memory)"
+    )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=dataset.OUTPUT_FORMATS,
+        default=dataset.OUTPUT_FORMAT_DIRS,
+        help="Save one directory per seed, or pack decodings into rolling shards"
+    )
+    parser.add_argument(
+        "--shard_size",
+        type=int,
+        default=1000,
+        help="Decodings per shard when saving shards"
+    )
+    parser.add_argument(
+        "--warm_start",
+        action="store_true",
+        help="Start each optimization from the closest solved decoding of the same format pair, "
+             "if the optimizer declares accepts_initial_transcoding"
+    )
+    parser.add_argument(
+        "--warm_start_dir",
+        type=str,
+        default=None,
+        help="Directory of solved decodings shared between workers and runs, also holding the "
+             "iterations-to-converge log, which otherwise goes to instrumentation/ (implies --warm_start)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Kill a decoding after this many seconds and record it as failed (overrides the config, 0 disables)"
+    )
+    parser.add_argument(
+        "--max_memory_gb",
+        type=float,
+        default=None,
+        help="Kill a decoding whose worker exceeds this resident memory (overrides the config, 0 disables)"
+    )
+    parser.add_argument(
+        "--shared_artifacts",
+        action="store_true",
+        help="Store the cloud, output layout and encoding matrix once per run in shared/ instead of "
+             "keeping a copy in every seed"
+    )
+    parser.add_argument(
+        "--matrix_dtype",
+        type=str,
+        choices=matrix_codecs.DTYPES,
+        default=matrix_codecs.DTYPE_FLOAT64,
+        help="Store output matrices in this precision, where the error stays within --matrix_tolerance"
+    )
+    parser.add_argument(
+        "--matrix_tolerance",
+        type=float,
+        default=matrix_codecs.DEFAULT_TOLERANCE,
+        help="Largest downcast error relative to the largest absolute value; matrices above it keep full precision"
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=tuple(matrix_codecs.COMPRESSIONS),
+        default=matrix_codecs.COMPRESSION_NONE,
+        help="Compress saved matrix archives (compressed members cannot be memory-mapped when loading)"
+    )
+    parser.add_argument(
+        "--write_chunk_mb",
+        type=float,
+        default=matrix_codecs.DEFAULT_CHUNK_BYTES / 2**20,
+        help="Matrices are converted and written in chunks of this size"
     )
 
     args = parser.parse_args()
-    main(args.num, args.config, args.bucket_name)
\ No newline at end of file
+    main(args.num, 
+         args.config, 
+         args.bucket_name, 
+         num_workers=args.workers, 
+         max_in_flight=args.max_in_flight, 
+         ordered=not args.unordered,
+         job_seed=args.job_seed,
+         pregenerate=args.pregenerate,
+         cache_dir=args.cache_dir,
+         cache_max_bytes=None if args.cache_max_gb is None else int(args.cache_max_gb * 1e9),
+         adaptive_rounds=args.adaptive_rounds,
+         quality_threshold=args.quality_threshold,
+         sharded=args.sharded or sharding.is_batch_task(),
+         task_index=args.task_index,
+         task_count=args.task_count,
+         upload_workers=args.upload_workers,
+         queue_size=args.queue_size,
+         output_format=args.output_format,
+         shard_size=args.shard_size,
+         warm_start=args.warm_start,
+         warm_start_dir=args.warm_start_dir,
+         timeout=args.timeout,
+         max_memory_bytes=None if args.max_memory_gb is None else int(args.max_memory_gb * 1e9),
+         shared_artifacts=args.shared_artifacts,
+         matrix_dtype=args.matrix_dtype,
+         compression=args.compression,
+         matrix_tolerance=args.matrix_tolerance,
+         write_chunk_bytes=int(args.write_chunk_mb * 2**20))
@@ -0,0 +1,160 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+STAGE_SAMPLING          = "sampling"
+STAGE_XML_BUILD         = "xml_build"
+STAGE_XML_SERIALIZE     = "xml_serialize"
+STAGE_OPTIMIZER         = "optimizer"
+STAGE_SAVE              = "save"
+STAGE_UPLOAD            = "upload"
+STAGE_IMPORT            = "import"
+STAGE_WARMUP            = "warmup"
+
+SUMMARY_PERCENTILES     = (50, 90, 99)
+
+
+def peak_rss_bytes():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                continue
+    return total
+
+
+class StageRecorder:
+    """
+    Appends one JSON line per stage run: wall time, CPU time of the running thread, peak RSS
+    of the process and bytes written or uploaded. Worker processes share the log file; every
+    record is a single short append.
+    """
+
+    def __init__(self, log_path):
+        self.log_path   = log_path
+        self._lock      = threading.Lock()
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+
+    @contextmanager
+    def stage(self, name, seed=None):
+        # Callers put the bytes they wrote or uploaded into the yielded dict
+        info        = {"bytes": 0}
+        wall_start  = time.perf_counter()
+        cpu_start   = time.thread_time()
+        ok          = False
+        try:
+            yield info
+            ok = True
+        finally:
+            self.record(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start,
+                        seed=seed, num_bytes=info["bytes"], ok=ok)
+
+    def record(self, name, wall, cpu=0.0, seed=None, num_bytes=0, ok=True, **extra):
+        """Appends one record for work timed elsewhere, e.g. module imports."""
+        record = {
+            "stage": name,
+            "seed": None if seed is None else int(seed),
+            "pid": os.getpid(),
+            "time": time.time(),
+            "wall": wall,
+            "cpu": cpu,
+            "peak_rss": peak_rss_bytes(),
+            "bytes": int(num_bytes),
+            "ok": ok,
+            **extra,
+        }
+        with self._lock, open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+_recorder = None
+
+def configure_instrumentation(log_path=None):
+    global _recorder
+    _recorder = StageRecorder(log_path) if log_path else None
+    return _recorder
+
+def get_recorder():
+    return _recorder
+
+@contextmanager
+def stage(name, seed=None):
+    if _recorder is None:
+        yield {"bytes": 0}
+        return
+    with _recorder.stage(name, seed) as info:
+        yield info
+
+def record(name, wall, **kwargs):
+    if _recorder is not None:
+        _recorder.record(name, wall, **kwargs)
+
+
+def read_stage_log(log_path):
+    records = []
+    if not os.path.exists(log_path):
+        return records
+    with open(log_path, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize_stage_log(log_path, elapsed, num_decodings):
+    """Per-stage totals and percentiles from a run's log, plus overall throughput."""
+    by_stage = {}
+    for record in read_stage_log(log_path):
+        by_stage.setdefault(record["stage"], []).append(record)
+
+    stages = {}
+    for name, records in by_stage.items():
+        wall            = np.array([record["wall"] for record in records])
+        num_bytes       = sum(record["bytes"] for record in records)
+        stages[name]    = {
+            "count": len(records),
+            "failed": sum(not record["ok"] for record in records),
+            "wall_total": float(wall.sum()),
+            "wall_mean": float(wall.mean()),
+            **{f"wall_p{p}": float(np.percentile(wall, p)) for p in SUMMARY_PERCENTILES},
+            "cpu_total": float(sum(record["cpu"] for record in records)),
+            "peak_rss": max(record["peak_rss"] for record in records),
+            "bytes": num_bytes,
+            "bytes_per_second": num_bytes / wall.sum() if wall.sum() > 0 else 0.0,
+        }
+
+    return {
+        "elapsed": elapsed,
+        "num_decodings": num_decodings,
+        "decodings_per_second": num_decodings / elapsed if elapsed > 0 else 0.0,
+        "stages": stages,
+    }
+
+
+def print_stage_summary(summary):
+    print(f"Completed {summary['num_decodings']} decodings in {summary['elapsed']:.1f}s "
+          f"({summary['decodings_per_second']:.3f}/s)")
+
+    percentile_header = "".join(f"{f'p{p} (s)':>10}" for p in SUMMARY_PERCENTILES)
+    print(f"{'stage':<15}{'count':>7}{'total (s)':>12}{'mean (s)':>10}{percentile_header}"
+          f"{'cpu (s)':>10}{'peak RSS (MB)':>15}{'MB':>10}")
+
+    for name, stats in summary["stages"].items():
+        percentiles = "".join(f"{stats[f'wall_p{p}']:>10.3f}" for p in SUMMARY_PERCENTILES)
+        print(f"{name:<15}{stats['count']:>7}{stats['wall_total']:>12.2f}{stats['wall_mean']:>10.3f}{percentiles}"
+              f"{stats['cpu_total']:>10.2f}{stats['peak_rss'] / 2**20:>15.1f}{stats['bytes'] / 2**20:>10.2f}")
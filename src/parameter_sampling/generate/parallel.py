@@ -0,0 +1,312 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import signal
+import time
+from collections import deque
+from contextlib import contextmanager
+
+FAILURE_TIMEOUT = "timeout"
+FAILURE_MEMORY  = "memory"
+FAILURE_CRASH   = "crash"
+
+SUPERVISOR_POLL_INTERVAL = 0.5
+
+
+def _ignore_interrupts(initializer=None, initargs=()):
+    # Ctrl-C is delivered to the whole process group, only the parent should react to it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt(f"Received signal {signum}")
+
+
+@contextmanager
+def sigterm_as_interrupt():
+    """Turns SIGTERM (Cloud Batch preemption, docker stop) into a KeyboardInterrupt."""
+    previous = signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+def imap_bounded(func,
+                 tasks,
+                 num_workers,
+                 max_in_flight=None,
+                 ordered=True,
+                 initializer=None,
+                 initargs=()):
+    """
+    Lazily maps func over tasks on a process pool, keeping at most max_in_flight tasks submitted.
+
+    Args:
+        func (callable): Picklable function applied to each task.
+        tasks (iterable): Tasks, consumed only as slots become free.
+        num_workers (int): Number of worker processes.
+        max_in_flight (int): Upper bound on submitted but uncollected tasks. Defaults to 2 * num_workers.
+        ordered (bool): Yield results in task order (True) or completion order (False).
+        initializer (callable): Optional per-worker initializer.
+        initargs (tuple): Arguments for initializer.
+
+    Yields:
+        The return value of func for each task.
+    """
+    max_in_flight   = max_in_flight or 2 * num_workers
+    tasks           = iter(tasks)
+    completed       = queue.Queue()
+    in_flight       = deque()
+    num_in_flight   = 0
+    exhausted       = False
+
+    pool = multiprocessing.Pool(processes=num_workers,
+                                initializer=_ignore_interrupts,
+                                initargs=(initializer, initargs))
+    try:
+        while True:
+            while not exhausted and num_in_flight < max_in_flight:
+                try:
+                    task = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                if ordered:
+                    in_flight.append(pool.apply_async(func, (task,)))
+                else:
+                    pool.apply_async(func, (task,),
+                                     callback=completed.put,
+                                     error_callback=completed.put)
+                num_in_flight += 1
+
+            if num_in_flight == 0:
+                break
+
+            if ordered:
+                value = in_flight.popleft().get()
+            else:
+                value = completed.get()
+                if isinstance(value, BaseException):
+                    raise value
+
+            num_in_flight -= 1
+            yield value
+
+        pool.close()
+        pool.join()
+
+    except BaseException:
+        print("Shutting down worker pool...")
+        pool.terminate()
+        pool.join()
+        raise
+
+
+class TaskFailure(Exception):
+    """A task stopped by the supervisor: over its time budget, over its memory ceiling, or its worker died."""
+
+    def __init__(self, reason, elapsed, detail=""):
+        super().__init__(f"{reason} after {elapsed:.1f}s{f': {detail}' if detail else ''}")
+        self.reason     = reason
+        self.elapsed    = elapsed
+        self.detail     = detail
+
+
+def process_rss_bytes(pid):
+    # Linux only, other platforms go through psutil when it is installed
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def _supervised_worker(func, connection, initializer, initargs):
+    _ignore_interrupts(initializer, initargs)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+
+        index, task = message
+        try:
+            result = func(task)
+        except Exception as e:
+            result = e
+        try:
+            connection.send((index, result))
+        except Exception as e:
+            # Unpicklable results or exceptions are reported by their text
+            connection.send((index, RuntimeError(f"Could not return result: {e}")))
+
+
+class _SupervisedWorker:
+    """One child process with a private pipe, so killing it cannot corrupt a queue shared with others."""
+
+    def __init__(self, func, initializer, initargs):
+        self.connection, child_connection   = multiprocessing.Pipe()
+        self.process                        = multiprocessing.Process(target=_supervised_worker,
+                                                                      args=(func, child_connection, initializer, initargs),
+                                                                      daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.index  = None
+        self.task   = None
+        self.start  = None
+
+    def assign(self, index, task):
+        self.index, self.task, self.start = index, task, time.perf_counter()
+        self.connection.send((index, task))
+
+    def release(self):
+        self.index, self.task, self.start = None, None, None
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def stop(self, timeout=5):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def imap_supervised(func,
+                    tasks,
+                    num_workers,
+                    on_failure,
+                    timeout=None,
+                    max_memory_bytes=None,
+                    ordered=True,
+                    initializer=None,
+                    initargs=(),
+                    poll_interval=SUPERVISOR_POLL_INTERVAL):
+    """
+    Like imap_bounded, but every task runs alone on a supervised child process. A task that
+    exceeds timeout seconds or max_memory_bytes of RSS, or whose worker dies, has its worker
+    killed and replaced, and yields on_failure(task, TaskFailure) in place of its result.
+
+    Args:
+        func (callable): Picklable function applied to each task.
+        tasks (iterable): Tasks, consumed only as workers become free.
+        num_workers (int): Number of worker processes.
+        on_failure (callable): Builds the result yielded for a failed task.
+        timeout (float): Wall-clock budget per task in seconds, None for no limit.
+        max_memory_bytes (int): RSS ceiling per worker, None for no limit.
+        ordered (bool): Yield results in task order (True) or completion order (False).
+        initializer (callable): Optional per-worker initializer, rerun in replacement workers.
+        initargs (tuple): Arguments for initializer.
+        poll_interval (float): Seconds between watchdog checks.
+
+    Yields:
+        The return value of func, or of on_failure, for each task.
+    """
+    tasks           = enumerate(tasks)
+    workers         = [_SupervisedWorker(func, initializer, initargs) for _ in range(max(1, num_workers))]
+    finished        = {}
+    next_index      = 0
+    exhausted       = False
+    max_buffered    = 2 * len(workers)
+
+    def fail(worker, reason, detail=""):
+        failure = TaskFailure(reason, worker.elapsed(), detail)
+        print(f"Stopping worker {worker.process.pid} on task #{worker.index}: {failure}")
+        result  = (worker.index, on_failure(worker.task, failure))
+        worker.kill()
+        return result
+
+    try:
+        while True:
+            # Hand out tasks to idle workers, unless results are piling up behind a slow task
+            for worker in workers:
+                if worker.index is None and not exhausted and len(finished) < max_buffered:
+                    try:
+                        worker.assign(*next(tasks))
+                    except StopIteration:
+                        exhausted = True
+
+            busy = [worker for worker in workers if worker.index is not None]
+            if not busy and not finished:
+                break
+
+            completed = []
+            ready     = multiprocessing.connection.wait([worker.connection for worker in busy], timeout=poll_interval) if busy else []
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        index, value = worker.connection.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(1)
+                        completed.append((worker, fail(worker, FAILURE_CRASH, f"exit code {worker.process.exitcode}")))
+                        continue
+                    completed.append((worker, (index, value)))
+
+                elif not worker.process.is_alive():
+                    completed.append((worker, fail(worker, FAILURE_CRASH, f"exit code {worker.process.exitcode}")))
+
+                elif timeout is not None and worker.elapsed() > timeout:
+                    completed.append((worker, fail(worker, FAILURE_TIMEOUT, f"limit {timeout:.0f}s")))
+
+                elif max_memory_bytes is not None:
+                    rss = process_rss_bytes(worker.process.pid)
+                    if rss is not None and rss > max_memory_bytes:
+                        completed.append((worker, fail(worker, FAILURE_MEMORY,
+                                                       f"RSS {rss / 1e9:.2f} GB over {max_memory_bytes / 1e9:.2f} GB")))
+
+            for worker, (index, value) in completed:
+                if not worker.process.is_alive():
+                    # Replace a killed or crashed worker in place
+                    workers[workers.index(worker)] = _SupervisedWorker(func, initializer, initargs)
+                else:
+                    worker.release()
+                finished[index] = value
+
+            # Yield what is ready, in task order if requested
+            if ordered:
+                while next_index in finished:
+                    value = finished.pop(next_index)
+                    next_index += 1
+                    if isinstance(value, BaseException):
+                        raise value
+                    yield value
+            else:
+                for index in sorted(finished):
+                    value = finished.pop(index)
+                    if isinstance(value, BaseException):
+                        raise value
+                    yield value
+
+    except BaseException:
+        print("Shutting down supervised workers...")
+        for worker in workers:
+            worker.kill()
+        raise
+
+    for worker in workers:
+        worker.stop()
@@ -0,0 +1,134 @@
+import queue
+import threading
+import traceback
+
+_STOP = object()
+
+
+class Pipeline:
+    """
+    Overlaps saving and uploading with optimization. Items submitted by the producer go
+    through a bounded queue to writer threads, then through a second bounded queue to
+    uploader threads. A full queue blocks submit(), so at most about
+    2 * queue_size + num_writers + num_uploaders results are held in memory.
+
+    Args:
+        write_fn (callable): write_fn(item) -> written, runs on a writer thread.
+        upload_fn (callable): upload_fn(item, written) -> uploaded, runs on an uploader thread.
+                              If None, items complete right after writing.
+        on_complete (callable): on_complete(item, written, uploaded), called one at a time.
+        queue_size (int): Capacity of each stage queue.
+        num_writers (int): Writer threads.
+        num_uploaders (int): Uploader threads.
+    """
+
+    def __init__(self,
+                 write_fn,
+                 upload_fn=None,
+                 on_complete=None,
+                 queue_size=4,
+                 num_writers=1,
+                 num_uploaders=2):
+
+        self.write_fn       = write_fn
+        self.upload_fn      = upload_fn
+        self.on_complete    = on_complete
+        self.write_queue    = queue.Queue(maxsize=queue_size)
+        self.upload_queue   = queue.Queue(maxsize=queue_size)
+        self.error          = None
+
+        self._complete_lock = threading.Lock()
+        self._writers       = [threading.Thread(target=self._write_loop, name=f"writer-{i}", daemon=True)
+                               for i in range(num_writers)]
+        self._uploaders     = []
+        if upload_fn is not None:
+            self._uploaders = [threading.Thread(target=self._upload_loop, name=f"uploader-{i}", daemon=True)
+                               for i in range(num_uploaders)]
+        self._started       = False
+        self._closed        = False
+
+    def start(self):
+        for thread in self._writers + self._uploaders:
+            thread.start()
+        self._started = True
+        return self
+
+    def _fail(self, e):
+        if self.error is None:
+            self.error = e
+            print(f"Pipeline stage failed: {e}\n{traceback.format_exc()}")
+
+    def _complete(self, item, written, uploaded):
+        if self.on_complete is None:
+            return
+        with self._complete_lock:
+            self.on_complete(item, written, uploaded)
+
+    def _write_loop(self):
+        while True:
+            item = self.write_queue.get()
+            if item is _STOP:
+                return
+            # After a failure, keep draining so the producer never blocks
+            if self.error is not None:
+                continue
+            try:
+                written = self.write_fn(item)
+                if self.upload_fn is not None:
+                    self.upload_queue.put((item, written))
+                else:
+                    self._complete(item, written, None)
+            except Exception as e:
+                self._fail(e)
+
+    def _upload_loop(self):
+        while True:
+            entry = self.upload_queue.get()
+            if entry is _STOP:
+                return
+            if self.error is not None:
+                continue
+            item, written = entry
+            try:
+                uploaded = self.upload_fn(item, written)
+                self._complete(item, written, uploaded)
+            except Exception as e:
+                self._fail(e)
+
+    def submit(self, item):
+        if not self._started:
+            self.start()
+        if self.error is not None:
+            raise RuntimeError("Pipeline stopped after a stage failure") from self.error
+        self.write_queue.put(item)
+
+    def close(self):
+        """Drains both stages and waits for them. Raises the first stage failure, if any."""
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._started:
+            for _ in self._writers:
+                self.write_queue.put(_STOP)
+            for thread in self._writers:
+                thread.join()
+
+            for _ in self._uploaders:
+                self.upload_queue.put(_STOP)
+            for thread in self._uploaders:
+                thread.join()
+
+        if self.error is not None:
+            raise RuntimeError("Pipeline stage failed") from self.error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except RuntimeError:
+            # Do not mask an exception already propagating from the producer
+            if exc_type is None:
+                raise
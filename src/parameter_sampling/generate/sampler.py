@@ -0,0 +1,497 @@
+import functools
+import numbers
+import numpy as np
+import yaml
+import usat_designer.processing.speaker_layouts as sl
+from usat_designer.processing.constants import *
+
+
+def _draw_none(rng, value):
+    return value
+
+def _draw_uniform(rng, low, high):
+    return rng.uniform(low, high)
+
+def _draw_normal(rng, mean, std):
+    # Rejection loop kept for per-seed reproducibility with the original get_y_i
+    sample = -1
+    while sample < 0:
+        sample = round(rng.normal(mean, std), 2)
+    return sample
+
+def _draw_lognormal(rng, mean, sigma):
+    return rng.lognormal(mean, sigma)
+
+def _draw_beta(rng, a, b):
+    return rng.beta(a, b)
+
+def _draw_choice(rng, *choices):
+    return rng.choice(list(choices))
+
+
+def _draw_none_batch(rng, size, value):
+    return np.full(size, value)
+
+def _draw_uniform_batch(rng, size, low, high):
+    return rng.uniform(low, high, size)
+
+def _draw_normal_batch(rng, size, mean, std):
+    # Inverse-CDF draw of the normal truncated at zero: one uniform per sample, however little
+    # of the distribution lies above zero
+    return _ppf_normal(rng.random(size), mean, std)
+
+def _draw_lognormal_batch(rng, size, mean, sigma):
+    return rng.lognormal(mean, sigma, size)
+
+def _draw_beta_batch(rng, size, a, b):
+    return rng.beta(a, b, size)
+
+def _draw_choice_batch(rng, size, *choices):
+    return rng.choice(np.asarray(choices), size)
+
+
+_DISTRIBUTION_DRAWS = {
+    DSN_SMPL_NONE:      _draw_none,
+    DSN_SMPL_UNIFORM:   _draw_uniform,
+    DSN_SMPL_NORMAL:    _draw_normal,
+    DSN_SMPL_LOGNORMAL: _draw_lognormal,
+    DSN_SMPL_BETA:      _draw_beta,
+    DSN_SMPL_CHOICE:    _draw_choice,
+}
+
+_DISTRIBUTION_BATCH_DRAWS = {
+    DSN_SMPL_NONE:      _draw_none_batch,
+    DSN_SMPL_UNIFORM:   _draw_uniform_batch,
+    DSN_SMPL_NORMAL:    _draw_normal_batch,
+    DSN_SMPL_LOGNORMAL: _draw_lognormal_batch,
+    DSN_SMPL_BETA:      _draw_beta_batch,
+    DSN_SMPL_CHOICE:    _draw_choice_batch,
+}
+
+def _scipy_special():
+    try:
+        import scipy.special
+    except ImportError as e:
+        raise ImportError("Sobol sampling, batched normal draws and lognormal/beta marginals for "
+                          "low-discrepancy designs require scipy") from e
+    return scipy.special
+
+def _ppf_none(u, value):
+    return np.full(len(u), value)
+
+def _ppf_uniform(u, low, high):
+    return low + u * (high - low)
+
+def _ppf_normal(u, mean, std):
+    # Inverse CDF of the normal truncated at zero, the continuous counterpart of _draw_normal.
+    # Inverted from the upper tail in log space, so a mean far below zero stays finite
+    special = _scipy_special()
+    if std == 0:
+        return np.full(len(u), mean)
+    log_upper = special.log_ndtr(mean / std)
+    samples   = mean - std * special.ndtri_exp(np.log1p(-np.asarray(u)) + log_upper)
+    return np.maximum(np.round(samples, 2), 0)
+
+def _ppf_lognormal(u, mean, sigma):
+    return np.exp(mean + sigma * _scipy_special().ndtri(u))
+
+def _ppf_beta(u, a, b):
+    return _scipy_special().betaincinv(a, b, u)
+
+def _ppf_choice(u, *choices):
+    index = np.minimum((u * len(choices)).astype(int), len(choices) - 1)
+    return np.asarray(choices)[index]
+
+
+_DISTRIBUTION_PPFS = {
+    DSN_SMPL_NONE:      _ppf_none,
+    DSN_SMPL_UNIFORM:   _ppf_uniform,
+    DSN_SMPL_NORMAL:    _ppf_normal,
+    DSN_SMPL_LOGNORMAL: _ppf_lognormal,
+    DSN_SMPL_BETA:      _ppf_beta,
+    DSN_SMPL_CHOICE:    _ppf_choice,
+}
+
+_SAMPLING_METHODS = (DSN_SMPL_METHOD_RANDOM, DSN_SMPL_METHOD_SOBOL, DSN_SMPL_METHOD_LHS)
+
+
+def latin_hypercube(num_samples, num_dims, rng, scramble=True):
+    # One independent permutation of the strata per dimension
+    offsets     = rng.random((num_samples, num_dims)) if scramble else 0.5
+    strata      = np.argsort(rng.random((num_samples, num_dims)), axis=0)
+    return (strata + offsets) / num_samples
+
+
+def sobol(num_samples, num_dims, rng, scramble=True):
+    try:
+        from scipy.stats import qmc
+    except ImportError as e:
+        raise ImportError("Sobol sampling requires scipy") from e
+    return qmc.Sobol(d=num_dims, scramble=scramble, seed=rng).random(num_samples)
+
+
+# Odd multiplier, so (job_seed + index) -> seed is a bijection on 32 bit integers
+_SEED_MULTIPLIER    = 0x9E3779B1
+_SEED_MASK          = 0xFFFFFFFF
+_LAYOUT_NAME_DTYPE  = "U64"
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _validate_distribution_args(name, distribution, args):
+    if distribution not in _DISTRIBUTION_DRAWS:
+        raise ValueError(f"Coefficient '{name}': unsupported distribution '{distribution}'")
+
+    if distribution == DSN_SMPL_NONE:
+        if not _is_number(args):
+            raise ValueError(f"Coefficient '{name}': distribution 'none' expects a single number, got {args!r}")
+        return (args,)
+
+    if distribution == DSN_SMPL_CHOICE:
+        if not isinstance(args, (list, tuple)) or len(args) == 0:
+            raise ValueError(f"Coefficient '{name}': distribution 'choice' expects a non-empty list, got {args!r}")
+        return tuple(args)
+
+    if not isinstance(args, (list, tuple)) or len(args) != 2 or not all(_is_number(a) for a in args):
+        raise ValueError(f"Coefficient '{name}': distribution '{distribution}' expects two numbers, got {args!r}")
+
+    first, second = args
+
+    if distribution == DSN_SMPL_UNIFORM and first > second:
+        raise ValueError(f"Coefficient '{name}': uniform bounds must satisfy low <= high, got {args!r}")
+
+    if distribution == DSN_SMPL_NORMAL:
+        first, second = round(first, 2), round(second, 2)
+        if second < 0:
+            raise ValueError(f"Coefficient '{name}': normal std must be non-negative, got {args!r}")
+        if second == 0 and first < 0:
+            raise ValueError(f"Coefficient '{name}': normal with std 0 and negative mean can never be accepted")
+
+    if distribution == DSN_SMPL_LOGNORMAL and second < 0:
+        raise ValueError(f"Coefficient '{name}': lognormal sigma must be non-negative, got {args!r}")
+
+    if distribution == DSN_SMPL_BETA and (first <= 0 or second <= 0):
+        raise ValueError(f"Coefficient '{name}': beta parameters must be positive, got {args!r}")
+
+    return (first, second)
+
+
+def _compile_format_section(section_name, config_section):
+    if not isinstance(config_section, dict):
+        raise ValueError(f"Missing '{section_name}' section in config")
+
+    formats = config_section.get(DSN_SMPL_FORMAT_CHOICES)
+    if not formats:
+        raise ValueError(f"'{section_name}' has no {DSN_SMPL_FORMAT_CHOICES}")
+
+    values = {}
+    for selected_format in formats:
+        if selected_format not in (DSN_XML_AMBISONICS, DSN_XML_SPEAKER_LAYOUT):
+            raise ValueError(f"'{section_name}': unsupported format '{selected_format}'")
+
+        choices = (config_section.get(selected_format) or {}).get(DSN_SMPL_DISTRIBUTION_ARGS)
+        if not choices:
+            raise ValueError(f"'{section_name}': no {DSN_SMPL_DISTRIBUTION_ARGS} given for format '{selected_format}'")
+
+        if selected_format == DSN_XML_SPEAKER_LAYOUT:
+            unknown = [name for name in choices if name not in sl.SPEAKER_LAYOUTS]
+            if unknown:
+                raise ValueError(f"'{section_name}': unknown speaker layouts {unknown}")
+
+        values[selected_format] = list(choices)
+
+    return list(formats), values
+
+
+class ParameterSampler:
+    """
+    Sampling config compiled once from YAML. Distributions, arguments and layouts are
+    validated up front so that sample() only draws random numbers.
+    """
+
+    def __init__(self, config):
+        coeff_config        = config.get(DSN_XML_COEFFICIENTS) or {}
+        self.coefficients   = []
+
+        for coeff_name, coeff_data in coeff_config.items():
+            distribution    = str(coeff_data.get(DSN_SMPL_DISTRIBUTION)).lower()
+            args            = _validate_distribution_args(coeff_name,
+                                                          distribution,
+                                                          coeff_data.get(DSN_SMPL_DISTRIBUTION_ARGS))
+            self.coefficients.append((coeff_name, distribution, args))
+
+        self._coefficient_draws = [
+            (name, functools.partial(_DISTRIBUTION_DRAWS[distribution], *args))
+            for name, distribution, args in self.coefficients
+        ]
+
+        sampling_config = config.get(DSN_SMPL_SAMPLING) or {}
+        self.method     = str(sampling_config.get(DSN_SMPL_METHOD, DSN_SMPL_METHOD_RANDOM)).lower()
+        self.scramble   = bool(sampling_config.get(DSN_SMPL_SCRAMBLE, True))
+
+        # Per-decoding limits of the supervised mode, missing or 0 disables them
+        supervision_config      = config.get(DSN_SMPL_SUPERVISION) or {}
+        self.timeout            = float(supervision_config.get(DSN_SMPL_TIMEOUT) or 0) or None
+        self.max_memory_bytes   = int(float(supervision_config.get(DSN_SMPL_MAX_MEMORY_GB) or 0) * 1e9) or None
+
+        if self.method not in _SAMPLING_METHODS:
+            raise ValueError(f"Unsupported sampling method '{self.method}', expected one of {_SAMPLING_METHODS}")
+
+        # Dimensions of the low-discrepancy design, fixed coefficients take none
+        self.design_coefficients = [
+            (name, distribution, args) for name, distribution, args in self.coefficients
+            if distribution != DSN_SMPL_NONE
+        ]
+
+        needs_scipy = self.method == DSN_SMPL_METHOD_SOBOL or (
+            self.method == DSN_SMPL_METHOD_LHS and any(
+                distribution in (DSN_SMPL_NORMAL, DSN_SMPL_LOGNORMAL, DSN_SMPL_BETA)
+                for _, distribution, _ in self.design_coefficients))
+        if needs_scipy:
+            _scipy_special()
+
+        self.input_formats, self.input_values   = _compile_format_section(DSN_SMPL_INPUT_FORMAT,
+                                                                          config.get(DSN_SMPL_INPUT_FORMAT))
+        self.output_formats, self.output_values = _compile_format_section(DSN_SMPL_OUTPUT_FORMAT,
+                                                                          config.get(DSN_SMPL_OUTPUT_FORMAT))
+
+    @classmethod
+    def from_yaml(cls, yaml_file):
+        with open(yaml_file, "r") as file:
+            config = yaml.safe_load(file)
+        return cls(config)
+
+    def sample(self, rng=np.random):
+        """
+        Draws one set of USAT state parameters.
+
+        Args:
+            rng: np.random, a RandomState or a Generator. With the seeded global np.random
+                 state the draws match the original parse_from_config.
+        
+        Coefficients are always drawn independently here; the Sobol and LHS methods only
+        apply to sample_batch / sample_job, which see the whole design.
+        """
+        coeffs = {name: round(draw(rng)) for name, draw in self._coefficient_draws}
+
+        input_format    = rng.choice(self.input_formats)
+        input_value     = rng.choice(self.input_values[input_format])
+        output_format   = rng.choice(self.output_formats)
+        output_value    = rng.choice(self.output_values[output_format])
+
+        return build_state_parameters(coeffs, input_format, input_value, output_format, output_value)
+
+    def sample_batch(self, num_samples, rng):
+        """
+        Draws num_samples parameter sets at once.
+
+        Args:
+            num_samples (int): Number of parameter sets.
+            rng (np.random.Generator): Stream the whole batch is drawn from.
+
+        Returns:
+            dict: Column name -> array of length num_samples. Coefficients are rounded to
+                  integers like sample(); format columns follow the XML attribute names.
+        """
+        table = {}
+        if self.method == DSN_SMPL_METHOD_RANDOM:
+            for name, distribution, args in self.coefficients:
+                values      = _DISTRIBUTION_BATCH_DRAWS[distribution](rng, num_samples, *args)
+                table[name] = np.rint(values).astype(np.int64)
+        else:
+            table.update(self._sample_design(num_samples, rng))
+
+        table.update(self._sample_formats(num_samples, rng))
+        return table
+
+    def _sample_formats(self, num_samples, rng):
+        table = _sample_format_columns(rng, num_samples,
+                                       self.input_formats, self.input_values,
+                                       DSN_XML_INPUT_TYPE,
+                                       DSN_XML_AMBISONICS_ORDER_IN,
+                                       DSN_SMPL_INPUT_LAYOUT_DESC)
+        table.update(_sample_format_columns(rng, num_samples,
+                                            self.output_formats, self.output_values,
+                                            DSN_XML_OUTPUT_TYPE,
+                                            DSN_XML_AMBISONICS_ORDER_OUT,
+                                            DSN_SMPL_OUTPUT_LAYOUT_DESC))
+        return table
+
+    def _sample_design(self, num_samples, rng):
+        # Space-filling design on the unit cube, mapped through each coefficient's marginal
+        num_dims = len(self.design_coefficients)
+        if num_dims == 0:
+            unit = np.empty((num_samples, 0))
+        elif self.method == DSN_SMPL_METHOD_SOBOL:
+            unit = sobol(num_samples, num_dims, rng, self.scramble)
+        else:
+            unit = latin_hypercube(num_samples, num_dims, rng, self.scramble)
+
+        columns     = {}
+        design_dims = {name: dim for dim, (name, _, _) in enumerate(self.design_coefficients)}
+        
+        for name, distribution, args in self.coefficients:
+            u               = unit[:, design_dims[name]] if name in design_dims else np.zeros(num_samples)
+            values          = _DISTRIBUTION_PPFS[distribution](u, *args)
+            columns[name]   = np.rint(values).astype(np.int64)
+        return columns
+
+    def sample_job(self, num_samples, job_seed, num_streams=1):
+        """
+        Pre-generates a job's parameter matrix from independent Generator streams spawned from job_seed.
+        Row i comes from stream i % num_streams, the interleaving of sharding.shard_indices, so with
+        one stream per task shard every task can draw its own rows alone through sample_stream.
+        The same (job_seed, num_samples, num_streams) always reproduces the same table.
+        """
+        generators  = spawn_generators(job_seed, num_streams + 1)
+        design      = self._job_design(num_samples, generators[num_streams])
+        blocks      = [self._sample_stream_rows(num_samples, job_seed, stream, num_streams, generators[stream], design)
+                       for stream in range(num_streams)]
+
+        # Scatter the interleaved blocks back into job order
+        order = np.concatenate([np.arange(stream, num_samples, num_streams) for stream in range(num_streams)])
+        table = {}
+        for name in blocks[0]:
+            column              = np.concatenate([block[name] for block in blocks])
+            table[name]         = np.empty_like(column)
+            table[name][order]  = column
+        return table
+
+    def sample_stream(self, num_samples, job_seed, stream=0, num_streams=1):
+        """
+        Rows stream, stream + num_streams, ... of sample_job(num_samples, job_seed, num_streams),
+        drawn without the other streams' rows.
+        """
+        generators  = spawn_generators(job_seed, num_streams + 1)
+        design      = self._job_design(num_samples, generators[num_streams])
+        return self._sample_stream_rows(num_samples, job_seed, stream, num_streams, generators[stream], design)
+
+    def _job_design(self, num_samples, rng):
+        # Low-discrepancy designs only exist for the whole job, so they get a stream of their own
+        # and every stream keeps its rows of the one design
+        if self.method == DSN_SMPL_METHOD_RANDOM:
+            return None
+        return self._sample_design(num_samples, rng)
+
+    def _sample_stream_rows(self, num_samples, job_seed, stream, num_streams, rng, design):
+        rows = np.arange(stream, num_samples, num_streams)
+        if design is None:
+            table = self.sample_batch(len(rows), rng)
+        else:
+            table = {name: column[rows] for name, column in design.items()}
+            table.update(self._sample_formats(len(rows), rng))
+
+        table["stream"]         = np.full(len(rows), stream, dtype=np.int64)
+        table[DSN_SMPL_SEED]    = derive_seeds(job_seed, rows)
+        return table
+
+    def parameters_from_row(self, table, index):
+        coeffs = {name: int(table[name][index]) for name, _, _ in self.coefficients}
+
+        input_format    = str(table[DSN_XML_INPUT_TYPE][index])
+        output_format   = str(table[DSN_XML_OUTPUT_TYPE][index])
+
+        if input_format == DSN_XML_AMBISONICS:
+            input_value = int(table[DSN_XML_AMBISONICS_ORDER_IN][index])
+        else:
+            input_value = str(table[DSN_SMPL_INPUT_LAYOUT_DESC][index])
+
+        if output_format == DSN_XML_AMBISONICS:
+            output_value = int(table[DSN_XML_AMBISONICS_ORDER_OUT][index])
+        else:
+            output_value = str(table[DSN_SMPL_OUTPUT_LAYOUT_DESC][index])
+
+        return build_state_parameters(coeffs, input_format, input_value, output_format, output_value)
+
+
+def _sample_format_columns(rng, num_samples, formats, values, type_column, order_column, layout_column):
+    default_ambisonics_order = 1
+
+    format_index    = rng.integers(len(formats), size=num_samples)
+    format_column   = np.asarray(formats, dtype=_LAYOUT_NAME_DTYPE)[format_index]
+    orders          = np.full(num_samples, default_ambisonics_order, dtype=np.int64)
+    layouts         = np.full(num_samples, "", dtype=_LAYOUT_NAME_DTYPE)
+
+    if DSN_XML_AMBISONICS in values:
+        selected            = format_column == DSN_XML_AMBISONICS
+        drawn               = rng.choice(np.asarray(values[DSN_XML_AMBISONICS], dtype=np.int64), num_samples)
+        orders[selected]    = drawn[selected]
+
+    if DSN_XML_SPEAKER_LAYOUT in values:
+        selected            = format_column == DSN_XML_SPEAKER_LAYOUT
+        drawn               = rng.choice(np.asarray(values[DSN_XML_SPEAKER_LAYOUT], dtype=_LAYOUT_NAME_DTYPE), num_samples)
+        layouts[selected]   = drawn[selected]
+
+    return {
+        type_column: format_column,
+        order_column: orders,
+        layout_column: layouts
+    }
+
+
+def spawn_generators(seed, num_streams):
+    children = np.random.SeedSequence(seed).spawn(num_streams)
+    return [np.random.default_rng(child) for child in children]
+
+
+def derive_seeds(job_seed, indices):
+    # Unique per index within a job, usable with np.random.seed
+    indices = np.asarray(indices, dtype=np.uint64)
+    offset  = np.uint64(job_seed & _SEED_MASK)
+    seeds   = ((indices + offset) & np.uint64(_SEED_MASK)) * np.uint64(_SEED_MULTIPLIER)
+    return (seeds & np.uint64(_SEED_MASK)).astype(np.int64)
+
+
+def to_structured(table):
+    """Packs a columnar table from sample_batch / sample_job into a numpy structured array."""
+    dtype = [(name, column.dtype) for name, column in table.items()]
+    array = np.empty(len(next(iter(table.values()))), dtype=dtype)
+    for name, column in table.items():
+        array[name] = column
+    return array
+
+
+def build_state_parameters(coeffs, input_format, input_value, output_format, output_value):
+    default_ambisonics_order = 1
+
+    input_ambisonics    = {DSN_XML_AMBISONICS_ORDER_IN: default_ambisonics_order}
+    output_ambisonics   = {DSN_XML_AMBISONICS_ORDER_OUT: default_ambisonics_order}
+
+    input_speaker_layout    = []
+    output_speaker_layout   = []
+    input_layout_desc       = ""
+    output_layout_desc      = ""
+
+    if input_format == DSN_XML_AMBISONICS:
+        input_ambisonics[DSN_XML_AMBISONICS_ORDER_IN] = input_value
+    else:
+        input_layout_desc       = input_value
+        input_speaker_layout    = sl.SPEAKER_LAYOUTS[input_layout_desc]
+
+    if output_format == DSN_XML_AMBISONICS:
+        output_ambisonics[DSN_XML_AMBISONICS_ORDER_OUT] = output_value
+    else:
+        output_layout_desc      = output_value
+        output_speaker_layout   = sl.SPEAKER_LAYOUTS[output_layout_desc]
+
+    return {
+        DSN_XML_SETTINGS: {
+            DSN_XML_INPUT_TYPE: input_format,
+            DSN_XML_OUTPUT_TYPE: output_format
+        },
+        DSN_XML_INPUT_AMBISONICS: input_ambisonics,
+        DSN_XML_OUTPUT_AMBISONICS: output_ambisonics,
+        DSN_XML_INPUT_SPEAKER_LAYOUT: input_speaker_layout,
+        DSN_XML_OUTPUT_SPEAKER_LAYOUT: output_speaker_layout,
+        DSN_SMPL_INPUT_LAYOUT_DESC: input_layout_desc,
+        DSN_SMPL_OUTPUT_LAYOUT_DESC: output_layout_desc,
+        DSN_XML_COEFFICIENTS: coeffs
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def load_sampler(yaml_file):
+    # One compiled sampler per config and process
+    return ParameterSampler.from_yaml(yaml_file)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from parameter_sampling.generate.sampler import derive_seeds
+
+# Environment set by Cloud Batch on every task of a job
+BATCH_TASK_INDEX_ENV    = "BATCH_TASK_INDEX"
+BATCH_TASK_COUNT_ENV    = "BATCH_TASK_COUNT"
+BATCH_JOB_ID_ENV        = "BATCH_JOB_ID"
+JOB_SEED_ENV            = "USAT_JOB_SEED"
+
+
+def is_batch_task():
+    return BATCH_TASK_INDEX_ENV in os.environ
+
+
+def resolve_job_seed(job_seed=None):
+    # Every task of a job must agree on the seed: CLI, then USAT_JOB_SEED, then the Batch job id
+    if job_seed is not None:
+        return int(job_seed)
+
+    if os.environ.get(JOB_SEED_ENV):
+        return int(os.environ[JOB_SEED_ENV])
+
+    if os.environ.get(BATCH_JOB_ID_ENV):
+        digest = hashlib.sha256(os.environ[BATCH_JOB_ID_ENV].encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "little")
+
+    raise ValueError(f"Sharded runs need a job seed: pass --job_seed or set {JOB_SEED_ENV}")
+
+
+def resolve_task_shard(task_index=None, task_count=None):
+    if task_index is None:
+        task_index = int(os.environ.get(BATCH_TASK_INDEX_ENV, 0))
+    if task_count is None:
+        task_count = int(os.environ.get(BATCH_TASK_COUNT_ENV, 1))
+
+    if task_count < 1 or not 0 <= task_index < task_count:
+        raise ValueError(f"Invalid shard: task index {task_index} of {task_count} tasks")
+    return task_index, task_count
+
+
+def shard_indices(task_index, task_count, num_per_task):
+    # Interleaved, so the first k decodings of every task cover job indices [0, k * task_count)
+    return np.arange(num_per_task, dtype=np.int64) * task_count + task_index
+
+
+def shard_seeds(job_seed, task_index, task_count, num_per_task):
+    return derive_seeds(job_seed, shard_indices(task_index, task_count, num_per_task))
+
+
+def manifest_name(job_seed, task_index, task_count):
+    return f"job_{job_seed}_task_{task_index}_of_{task_count}.jsonl"
+
+
+class RunManifest:
+    """
+    Append-only JSON-lines record of the seeds a task has finished. Each line is flushed
+    to disk when a seed completes and the file is copied to the bucket every upload_every
+    seeds, so a preempted task can resume on another VM.
+    """
+
+    def __init__(self, local_path, backend=None, blob_name=None, upload_every=10):
+        self.local_path     = local_path
+        self.backend        = backend
+        self.blob_name      = blob_name
+        self.upload_every   = upload_every
+        self.completed      = set()
+        self._pending       = 0
+
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+
+    def load(self):
+        if not os.path.exists(self.local_path) and self.backend is not None:
+            if self.backend.download_file(self.blob_name, self.local_path):
+                print(f"Restored manifest from {self.backend.uri(self.blob_name)}")
+
+        if os.path.exists(self.local_path):
+            with open(self.local_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        self.completed.add(int(json.loads(line)["seed"]))
+                    except (ValueError, KeyError):
+                        # A torn last line from a killed VM
+                        continue
+
+        return self.completed
+
+    def is_completed(self, seed):
+        return int(seed) in self.completed
+
+    def mark_completed(self, seed, **info):
+        record = {"seed": int(seed), "time": time.time(), **info}
+        with open(self.local_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.completed.add(int(seed))
+        self._pending += 1
+        if self._pending >= self.upload_every:
+            self.sync()
+
+    def sync(self):
+        self._pending = 0
+        if self.backend is None or not os.path.exists(self.local_path):
+            return
+        try:
+            self.backend.upload_file(self.local_path, self.blob_name)
+        except Exception as e:
+            print(f"Failed to upload manifest {self.local_path}: {e}")
@@ -0,0 +1,358 @@
+import sys
+import os
+
+TOP_LEVEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if TOP_LEVEL_DIR not in sys.path:
+    sys.path.insert(0, TOP_LEVEL_DIR)
+
+import argparse
+import json
+import secrets
+import time
+import yaml
+from usat_designer.processing.constants import *
+from parameter_sampling.generate.generate import (configure_worker, iter_decodings, plan_decodings,
+                                                  upload_artifacts, upload_decoding_result, write_decoding_result)
+from parameter_sampling.generate.parallel import sigterm_as_interrupt
+from parameter_sampling.generate.pipeline import Pipeline
+from parameter_sampling.generate.sampler import load_sampler
+from parameter_sampling.generate.warm_start import WARM_START_LOG_FILE_NAME
+from parameter_sampling.generate import instrumentation as instr
+from parameter_sampling.utils.uploader import Uploader, make_backend
+from parameter_sampling.utils import artifacts
+from parameter_sampling.utils import matrix_codecs
+
+POLICY_FAIR_SHARE   = "fair"
+POLICY_PRIORITY     = "priority"
+POLICIES            = (POLICY_FAIR_SHARE, POLICY_PRIORITY)
+
+YAML_SUFFIXES       = (".yaml", ".yml")
+
+
+class SweepEntry:
+    """One config of a sweep: its target, scheduling weight and priority, and progress."""
+
+    def __init__(self, yaml_path, num_decodings_targeted, weight=1.0, priority=0):
+        if weight <= 0:
+            raise ValueError(f"Weight of {yaml_path} must be positive, got {weight}")
+
+        self.yaml_path              = yaml_path
+        self.num_decodings_targeted = int(num_decodings_targeted)
+        self.weight                 = float(weight)
+        self.priority               = priority
+        self.dispatched             = 0
+        self.completed              = 0
+        self.failed                 = 0
+        self.tasks                  = None
+
+        # Set by prepare_entry
+        self.config_base_name       = None
+        self.output_dir             = None
+        self.local_yaml_path        = None
+        self.artifact_store         = None
+
+
+def is_sweep_spec(yaml_path):
+    with open(yaml_path, "r") as f:
+        content = yaml.safe_load(f)
+    return isinstance(content, dict) and DSN_SWEEP_CONFIGS in content
+
+
+def load_sweep_spec(spec_path, num_decodings_targeted=10, weight=1.0):
+    """
+    Entries of a sweep file:
+        Configs:
+          - Config: config/5OA_7_0_4.yaml
+            Num: 1000
+            Weight: 2
+            Priority: 1
+    Relative config paths are resolved against the sweep file.
+    """
+    with open(spec_path, "r") as f:
+        spec = yaml.safe_load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(spec_path))
+    entries  = []
+    for item in spec[DSN_SWEEP_CONFIGS]:
+        yaml_path = item[DSN_SWEEP_CONFIG]
+        if not os.path.isabs(yaml_path) and not os.path.exists(yaml_path):
+            yaml_path = os.path.join(base_dir, yaml_path)
+        entries.append(SweepEntry(yaml_path,
+                                  item.get(DSN_SWEEP_NUM, num_decodings_targeted),
+                                  item.get(DSN_SWEEP_WEIGHT, weight),
+                                  item.get(DSN_SWEEP_PRIORITY, 0)))
+    return entries
+
+
+def collect_entries(paths, num_decodings_targeted=10, weight=1.0):
+    # Config files, directories of config files, and sweep files, in the order given
+    entries = []
+    for path in paths:
+        if os.path.isdir(path):
+            for file_name in sorted(os.listdir(path)):
+                file_path = os.path.join(path, file_name)
+                if file_name.endswith(YAML_SUFFIXES) and not is_sweep_spec(file_path):
+                    entries.append(SweepEntry(file_path, num_decodings_targeted, weight))
+        elif is_sweep_spec(path):
+            entries.extend(load_sweep_spec(path, num_decodings_targeted, weight))
+        else:
+            entries.append(SweepEntry(path, num_decodings_targeted, weight))
+
+    # prepare_output_dir names the output directory after the config file
+    names = [os.path.splitext(os.path.basename(entry.yaml_path))[0] for entry in entries]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Configs would share an output directory: {duplicates}")
+    return entries
+
+
+def prepare_entry(entry, bucket_name=None, backend=None, job_seed=None):
+    import usat_designer.utils.directory_utils as dir_utils
+
+    dirs                    = dir_utils.prepare_output_dir(entry.yaml_path, bucket_name)
+    entry.config_base_name  = dirs[0]
+    entry.output_dir        = dirs[1]
+    entry.local_yaml_path   = dirs[2]
+
+    if backend is not None:
+        yaml_blob = f"{entry.config_base_name}/{entry.config_base_name}.yaml"
+        if not backend.exists(yaml_blob):
+            backend.upload_file(entry.local_yaml_path, yaml_blob)
+            print(f"Uploaded file {entry.local_yaml_path} to {backend.uri(yaml_blob)}")
+
+    # Low-discrepancy designs are planned for the whole config, random seeds are drawn as tasks are scheduled
+    sampler = load_sampler(entry.local_yaml_path)
+    if sampler.method != DSN_SMPL_METHOD_RANDOM:
+        entry.tasks = iter(plan_decodings(entry.local_yaml_path, entry.output_dir, entry.num_decodings_targeted, job_seed))
+    else:
+        entry.tasks = ((entry.local_yaml_path, secrets.randbits(32)) for _ in range(entry.num_decodings_targeted))
+    return sampler
+
+
+def loosest_limit(limits):
+    # A config without a limit (None) runs unlimited, so the shared pool does too
+    if any(limit is None for limit in limits):
+        return None
+    return max(limits, default=None)
+
+
+def schedule_tasks(entries, policy=POLICY_FAIR_SHARE):
+    """
+    Interleaves the tasks of all entries. Fair share hands out tasks in proportion to the
+    weights (stride scheduling on dispatched / weight); priority drains higher priorities
+    first and shares fairly between entries of equal priority. Tasks are drawn lazily, so
+    the order follows the pool as it frees up.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {policy}, expected one of {POLICIES}")
+
+    active = list(enumerate(entries))
+    while active:
+        index, entry = min(active, key=lambda item: (-item[1].priority if policy == POLICY_PRIORITY else 0,
+                                                     item[1].dispatched / item[1].weight,
+                                                     item[0]))
+        task = next(entry.tasks, None)
+        if task is None:
+            active.remove((index, entry))
+            continue
+
+        entry.dispatched += 1
+        yield task
+
+
+def run_sweep(entries,
+              bucket_name=None,
+              policy=POLICY_FAIR_SHARE,
+              num_workers=1,
+              max_in_flight=None,
+              job_seed=None,
+              cache_dir=None,
+              cache_max_bytes=None,
+              warm_start=False,
+              warm_start_dir=None,
+              timeout=None,
+              max_memory_bytes=None,
+              upload_workers=8,
+              queue_size=4,
+              shared_artifacts=False,
+              matrix_dtype=matrix_codecs.DTYPE_FLOAT64,
+              compression=matrix_codecs.COMPRESSION_NONE,
+              matrix_tolerance=matrix_codecs.DEFAULT_TOLERANCE,
+              write_chunk_bytes=matrix_codecs.DEFAULT_CHUNK_BYTES):
+    """
+    Runs the decodings of every entry on one worker pool. Each config keeps the output
+    directory and bucket prefix a single-config run of generate.py would use.
+    """
+    start_time = time.time()
+
+    run_id              = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+    stage_log_path      = os.path.join("sweeps", f"stages_{run_id}.jsonl")
+    warm_start_log_path = os.path.join(warm_start_dir or "sweeps", WARM_START_LOG_FILE_NAME)
+    instr.configure_instrumentation(stage_log_path)
+
+    codec       = matrix_codecs.MatrixCodec(matrix_dtype, compression, matrix_tolerance, write_chunk_bytes)
+    backend     = None
+    uploader    = None
+    if bucket_name:
+        backend     = make_backend(bucket_name)
+        uploader    = Uploader(backend, max_workers=upload_workers)
+
+    # Results are routed back to their config by the local YAML path every task carries
+    by_yaml     = {}
+    samplers    = []
+    for entry in entries:
+        samplers.append(prepare_entry(entry, bucket_name, backend, job_seed))
+        if shared_artifacts:
+            entry.artifact_store = artifacts.store_for_results_dir(entry.output_dir, codec)
+        by_yaml[entry.local_yaml_path] = entry
+
+    # One pool serves every config, so it runs with the loosest limit any of them sets
+    if timeout is None:
+        timeout = loosest_limit([sampler.timeout for sampler in samplers])
+    if max_memory_bytes is None:
+        max_memory_bytes = loosest_limit([sampler.max_memory_bytes for sampler in samplers])
+
+    num_targeted        = sum(entry.num_decodings_targeted for entry in entries)
+    num_completed       = 0
+    uploaded_artifacts  = {entry.config_base_name: set() for entry in entries}
+
+    def on_complete(item, written, upload_results):
+        nonlocal num_completed
+        task, _, output_dict = item
+        entry           = by_yaml[task[0]]
+        num_completed   += 1
+        entry.completed += 1
+        if "error_message" in output_dict:
+            entry.failed += 1
+        if "failure" in output_dict:
+            with open(os.path.join(entry.output_dir, "failures.jsonl"), "a") as f:
+                f.write(json.dumps(output_dict["failure"], default=str) + "\n")
+        print(f"Finished iteration {num_completed}/{num_targeted} ({entry.config_base_name}, seed {task[1]})...")
+
+    def write_result(item):
+        entry = by_yaml[item[0][0]]
+        # Killed decodings, and errors raised before the XML was built, have nothing to save
+        if item[1] is None:
+            print(f"Nothing to save for seed {item[0][1]}: {item[2].get('error_message')}")
+            return None
+
+        with instr.stage(instr.STAGE_SAVE, item[0][1]) as info:
+            saved_dir       = write_decoding_result(*item, entry.output_dir, entry.artifact_store, codec)
+            info["bytes"]   = instr.directory_bytes(saved_dir)
+            return saved_dir
+
+    def upload_result(item, saved_dir):
+        entry = by_yaml[item[0][0]]
+        if saved_dir is None:
+            return []
+
+        with instr.stage(instr.STAGE_UPLOAD, item[0][1]) as info:
+            # Artifacts the seed refers to go before its own files
+            results = []
+            if entry.artifact_store is not None:
+                results = upload_artifacts(entry.artifact_store, entry.config_base_name, uploader,
+                                           uploaded_artifacts[entry.config_base_name])
+            results = results + upload_decoding_result(item[0], saved_dir, entry.config_base_name, uploader)
+            info["bytes"] = sum(result.num_bytes for result in results)
+            return results
+
+    pipeline = Pipeline(write_fn=write_result,
+                        upload_fn=upload_result if uploader is not None else None,
+                        on_complete=on_complete,
+                        queue_size=queue_size)
+
+    try:
+        with sigterm_as_interrupt():
+            # Completion order, so a slow config never holds back results of the others
+            for task, xml, output_dict in iter_decodings(schedule_tasks(entries, policy),
+                                                         num_workers,
+                                                         max_in_flight,
+                                                         ordered=False,
+                                                         initializer=configure_worker,
+                                                         initargs=(cache_dir, cache_max_bytes, warm_start,
+                                                                   warm_start_dir, warm_start_log_path,
+                                                                   stage_log_path),
+                                                         timeout=timeout,
+                                                         max_memory_bytes=max_memory_bytes):
+                pipeline.submit((task, xml, output_dict))
+
+    except KeyboardInterrupt:
+        print(f"Interrupted after {num_completed}/{num_targeted} decodings, stopping...")
+
+    finally:
+        # Upload threads are shut down even when close() raises a failed stage
+        try:
+            pipeline.close()
+        finally:
+            if uploader is not None:
+                uploader.close()
+
+    elapsed = time.time() - start_time
+    print(f"Elapsed time: {elapsed}")
+    for entry in entries:
+        print(f"{entry.config_base_name}: {entry.completed}/{entry.num_decodings_targeted} decodings "
+              f"({entry.failed} failed), weight {entry.weight:g}, priority {entry.priority}")
+
+    summary = instr.summarize_stage_log(stage_log_path, elapsed, num_completed)
+    summary["configs"] = {entry.config_base_name: {"targeted": entry.num_decodings_targeted,
+                                                   "completed": entry.completed,
+                                                   "failed": entry.failed,
+                                                   "weight": entry.weight,
+                                                   "priority": entry.priority} for entry in entries}
+    instr.print_stage_summary(summary)
+    with open(stage_log_path.replace(".jsonl", "_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate decodings for several configs on one shared worker pool.")
+    parser.add_argument("configs", nargs="+", help="Config files, directories of configs, or sweep files listing "
+                                                   "configs with their Num, Weight and Priority")
+    parser.add_argument("-n", "--num", type=int, default=10, help="Decodings per config unless the sweep file sets Num")
+    parser.add_argument("--weight", type=float, default=1.0, help="Fair-share weight unless the sweep file sets Weight")
+    parser.add_argument("--policy", type=str, choices=POLICIES, default=POLICY_FAIR_SHARE,
+                        help="Share the pool in proportion to the weights, or drain higher priorities first")
+    parser.add_argument("-b", "--bucket_name", type=str, default=None,
+                        help="GCS bucket to upload results to, or file:///path for a local stand-in (optional)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes shared by all configs")
+    parser.add_argument("--max_in_flight", type=int, default=None, help="Maximum number of queued decodings (defaults to 2 * workers)")
+    parser.add_argument("--job_seed", type=int, default=None, help="Seed for pre-generated parameter plans (random if omitted)")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory of cached optimizer results (optional)")
+    parser.add_argument("--cache_max_gb", type=float, default=None, help="Evict least recently used cache entries above this size")
+    parser.add_argument("--warm_start", action="store_true", help="Start each optimization from the closest solved decoding")
+    parser.add_argument("--warm_start_dir", type=str, default=None, help="Directory of solved decodings shared between workers and runs")
+    parser.add_argument("--timeout", type=float, default=None, help="Kill a decoding after this many seconds (defaults to the configs)")
+    parser.add_argument("--max_memory_gb", type=float, default=None, help="Kill a decoding above this resident memory (defaults to the configs)")
+    parser.add_argument("--upload_workers", type=int, default=8, help="Number of concurrent file uploads")
+    parser.add_argument("--queue_size", type=int, default=4, help="Capacity of the save and upload queues")
+    parser.add_argument("--shared_artifacts", action="store_true", help="Store shared outputs once per config in shared/ instead of in every seed")
+    parser.add_argument("--matrix_dtype", type=str, choices=matrix_codecs.DTYPES, default=matrix_codecs.DTYPE_FLOAT64,
+                        help="Store output matrices in this precision, where the error stays within --matrix_tolerance")
+    parser.add_argument("--matrix_tolerance", type=float, default=matrix_codecs.DEFAULT_TOLERANCE,
+                        help="Largest downcast error relative to the largest absolute value")
+    parser.add_argument("--compression", type=str, choices=tuple(matrix_codecs.COMPRESSIONS),
+                        default=matrix_codecs.COMPRESSION_NONE, help="Compress saved matrix archives")
+    parser.add_argument("--write_chunk_mb", type=float, default=matrix_codecs.DEFAULT_CHUNK_BYTES / 2**20,
+                        help="Matrices are converted and written in chunks of this size")
+
+    args = parser.parse_args()
+    run_sweep(collect_entries(args.configs, args.num, args.weight),
+              bucket_name=args.bucket_name,
+              policy=args.policy,
+              num_workers=args.workers,
+              max_in_flight=args.max_in_flight,
+              job_seed=args.job_seed,
+              cache_dir=args.cache_dir,
+              cache_max_bytes=None if args.cache_max_gb is None else int(args.cache_max_gb * 1e9),
+              warm_start=args.warm_start,
+              warm_start_dir=args.warm_start_dir,
+              timeout=args.timeout,
+              max_memory_bytes=None if args.max_memory_gb is None else int(args.max_memory_gb * 1e9),
+              upload_workers=args.upload_workers,
+              queue_size=args.queue_size,
+              shared_artifacts=args.shared_artifacts,
+              matrix_dtype=args.matrix_dtype,
+              compression=args.compression,
+              matrix_tolerance=args.matrix_tolerance,
+              write_chunk_bytes=int(args.write_chunk_mb * 2**20))
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from usat_designer.processing.constants import *
+
+WARM_START_LOG_FILE_NAME    = "warm_start_log.jsonl"
+REFRESH_EVERY               = 50
+INITIAL_CAPACITY            = 64
+
+# Iteration counts reported by the optimizer, under whichever name it uses
+ITERATION_KEYS = ("nit", "iterations", "num_iterations", "n_iterations")
+
+
+def format_pair(usat_state_parameters):
+    settings = usat_state_parameters[DSN_XML_SETTINGS]
+
+    def side(type_key, ambisonics_tag, order_key, layout_key):
+        fmt = settings[type_key]
+        if fmt == DSN_XML_AMBISONICS:
+            return f"{fmt}:{usat_state_parameters[ambisonics_tag][order_key]}"
+        return f"{fmt}:{usat_state_parameters[layout_key]}"
+
+    return (side(DSN_XML_INPUT_TYPE, DSN_XML_INPUT_AMBISONICS, DSN_XML_AMBISONICS_ORDER_IN, DSN_SMPL_INPUT_LAYOUT_DESC),
+            side(DSN_XML_OUTPUT_TYPE, DSN_XML_OUTPUT_AMBISONICS, DSN_XML_AMBISONICS_ORDER_OUT, DSN_SMPL_OUTPUT_LAYOUT_DESC))
+
+
+def coefficient_vector(usat_state_parameters):
+    coefficients = usat_state_parameters[DSN_XML_COEFFICIENTS]
+    names        = sorted(coefficients)
+    return tuple(names), np.array([float(coefficients[name]) for name in names])
+
+
+def iterations_to_converge(output_dict):
+    for key in ITERATION_KEYS:
+        if key in output_dict:
+            return int(output_dict[key])
+    return None
+
+
+class SolvedPair:
+    """
+    Coefficient vectors and transcoding matrices solved for one format pair. Vectors are kept in
+    one array that doubles when full, so lookups search a view instead of stacking every vector.
+    """
+
+    def __init__(self, names):
+        self.names          = names
+        self.transcodings   = []
+        self._vectors       = np.empty((INITIAL_CAPACITY, len(names)))
+
+    def __len__(self):
+        return len(self.transcodings)
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self)]
+
+    def add(self, vector, transcoding):
+        size = len(self)
+        if size == len(self._vectors):
+            grown           = np.empty((2 * size, len(self.names)))
+            grown[:size]    = self._vectors
+            self._vectors   = grown
+
+        self._vectors[size] = vector
+        self.transcodings.append(np.asarray(transcoding))
+
+    def nearest(self, vector):
+        """Index of the closest vector and its distance, each coefficient scaled by its spread."""
+        solved              = self.vectors
+        scale               = solved.std(axis=0)
+        scale[scale == 0]   = 1.0
+        distances           = np.linalg.norm((solved - vector) / scale, axis=1)
+        best                = int(np.argmin(distances))
+        return best, float(distances[best])
+
+
+class WarmStartIndex:
+    """
+    Solved decodings grouped by input/output format pair, searched for the coefficient vector
+    closest to a new one. Distances are taken after scaling every coefficient by its spread
+    among the solutions of that pair.
+
+    With a store_dir, solutions are also written there as one small NPZ per decoding and new
+    files from other workers or earlier runs are picked up every REFRESH_EVERY lookups.
+    Optimizations are logged to log_path, by default the log in store_dir.
+    """
+
+    def __init__(self, store_dir=None, max_distance=None, log_path=None):
+        self.store_dir      = store_dir
+        self.max_distance   = max_distance
+        self.log_path       = log_path
+        if log_path is None and store_dir is not None:
+            self.log_path   = os.path.join(store_dir, WARM_START_LOG_FILE_NAME)
+        self.entries        = {}  # format pair -> SolvedPair
+        self._known_files   = set()
+        self._num_lookups   = 0
+
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+            self.refresh()
+
+    def _add(self, pair, names, vector, transcoding):
+        if pair not in self.entries:
+            self.entries[pair] = SolvedPair(names)
+        solved = self.entries[pair]
+        if solved.names == names:
+            solved.add(vector, transcoding)
+
+    def refresh(self):
+        if self.store_dir is None:
+            return
+
+        for file_name in os.listdir(self.store_dir):
+            # Temporary files of entries still being written end in .tmp.npz
+            if not file_name.endswith(".npz") or ".tmp" in file_name or file_name in self._known_files:
+                continue
+            self._known_files.add(file_name)
+            try:
+                with np.load(os.path.join(self.store_dir, file_name)) as data:
+                    pair    = tuple(str(side) for side in data["pair"])
+                    names   = tuple(str(name) for name in data["names"])
+                    self._add(pair, names, data["vector"], data["transcoding"])
+            except Exception as e:
+                print(f"Skipping unreadable warm-start entry {file_name}: {e}")
+
+    def nearest(self, usat_state_parameters):
+        """Returns (T_optimized, distance) of the closest solved decoding, or (None, None)."""
+        self._num_lookups += 1
+        if self._num_lookups % REFRESH_EVERY == 0:
+            self.refresh()
+
+        pair            = format_pair(usat_state_parameters)
+        names, vector   = coefficient_vector(usat_state_parameters)
+        solved          = self.entries.get(pair)
+        if solved is None or solved.names != names or not len(solved):
+            return None, None
+
+        best, distance = solved.nearest(vector)
+        if self.max_distance is not None and distance > self.max_distance:
+            return None, None
+        return solved.transcodings[best], distance
+
+    def record(self, usat_state_parameters, output_dict):
+        if "error_message" in output_dict or DSN_OUT_TRANSCODING_MATRIX not in output_dict:
+            return
+
+        pair            = format_pair(usat_state_parameters)
+        names, vector   = coefficient_vector(usat_state_parameters)
+        transcoding     = np.asarray(output_dict[DSN_OUT_TRANSCODING_MATRIX])
+        self._add(pair, names, vector, transcoding)
+
+        if self.store_dir is None:
+            return
+
+        digest      = hashlib.sha1(json.dumps([pair, names, vector.tolist()]).encode("utf-8")).hexdigest()
+        file_name   = f"{digest}.npz"
+        tmp_path    = os.path.join(self.store_dir, f"{digest}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, pair=np.array(pair), names=np.array(names), vector=vector, transcoding=transcoding)
+        os.replace(tmp_path, os.path.join(self.store_dir, file_name))
+        self._known_files.add(file_name)
+
+    def log(self, seed, warm_started, distance, elapsed, output_dict):
+        """Appends one line per optimization so cold and warm runs can be compared afterwards."""
+        if self.log_path is None:
+            return
+
+        record = {
+            "seed": seed,
+            "time": time.time(),
+            "warm_started": warm_started,
+            "distance": distance,
+            "elapsed": elapsed,
+            "iterations": iterations_to_converge(output_dict),
+            "failed": "error_message" in output_dict,
+        }
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+_warm_start_index = None
+
+def configure_warm_start(store_dir=None, enabled=False, max_distance=None, log_path=None):
+    global _warm_start_index
+    _warm_start_index = WarmStartIndex(store_dir, max_distance, log_path) if (enabled or store_dir) else None
+    return _warm_start_index
+
+def get_warm_start_index():
+    return _warm_start_index
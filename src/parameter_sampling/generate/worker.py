@@ -0,0 +1,168 @@
+import sys
+import os
+
+TOP_LEVEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if TOP_LEVEL_DIR not in sys.path:
+    sys.path.insert(0, TOP_LEVEL_DIR)
+
+import argparse
+import importlib
+import json
+import time
+import traceback
+
+# Imported one after the other, so each time is what that module adds on top of the previous ones
+WARM_IMPORTS        = ("numpy",
+                       "yaml",
+                       "usat_designer.processing.constants",
+                       "usat_designer.utils.parameter_utils",
+                       "parameter_sampling.generate.generate",
+                       "parameter_sampling.generate.decode")
+STORAGE_IMPORTS     = ("google.cloud.storage",
+                       "usat_designer.utils.directory_utils")
+
+# Job keys accepted as shorthands for the arguments of generate.main
+JOB_ALIASES         = {"num": "num_decodings_targeted",
+                       "config": "yaml_path"}
+
+
+def time_imports(modules, recorder=None):
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            ok = True
+        except ImportError as e:
+            print(f"Could not import {name}: {e}")
+            ok = False
+        timings[name] = time.perf_counter() - start
+        if recorder is not None:
+            recorder.record(f"import:{name}", timings[name], ok=ok)
+    return timings
+
+
+def warm_up(yaml_path, seed=0, recorder=None):
+    """Runs one throwaway decoding so that the optimizer's first-call costs are paid up front."""
+    import numpy as np
+    from parameter_sampling.generate.generate import build_xml_config, get_decoder, parse_from_config
+
+    start = time.perf_counter()
+    np.random.seed(seed)
+    get_decoder()(build_xml_config(parse_from_config(yaml_path)))
+    elapsed = time.perf_counter() - start
+
+    if recorder is not None:
+        recorder.record("warmup", elapsed)
+    return elapsed
+
+
+def read_jobs(path):
+    # One JSON object of generate.main arguments per line; "-" reads stdin until it is closed
+    stream = sys.stdin if path == "-" else open(path, "r")
+    try:
+        for line in stream:
+            if line.strip():
+                job = json.loads(line)
+                yield {JOB_ALIASES.get(key, key): value for key, value in job.items()}
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def shard_jobs(num_decodings_targeted, yaml_path, bucket_name, task_indices, task_count, job_seed):
+    for task_index in task_indices:
+        yield {"num_decodings_targeted": num_decodings_targeted,
+               "yaml_path": yaml_path,
+               "bucket_name": bucket_name,
+               "sharded": True,
+               "task_index": task_index,
+               "task_count": task_count,
+               "job_seed": job_seed}
+
+
+def parse_task_indices(spec):
+    # "0-3,7" -> [0, 1, 2, 3, 7]
+    indices = []
+    for part in spec.split(","):
+        start, _, end = part.partition("-")
+        indices.extend(range(int(start), int(end or start) + 1))
+    return indices
+
+
+def run_worker(jobs, log_path, warmup_config=None, storage=False, defaults=None):
+    """
+    Imports the generation stack and warms the optimizer once, then runs every job through
+    generate.main in this process. Worker pools of later jobs are forked from the warm process.
+    Import times, the warm-up and each job's wall time are appended to log_path.
+    """
+    from parameter_sampling.generate.instrumentation import StageRecorder
+
+    recorder    = StageRecorder(log_path)
+    timings     = time_imports(WARM_IMPORTS + (STORAGE_IMPORTS if storage else ()), recorder)
+    print("Import times: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()))
+
+    from parameter_sampling.generate import generate
+
+    if warmup_config:
+        print(f"Warmed up the optimizer in {warm_up(warmup_config, recorder=recorder):.2f}s")
+
+    num_jobs, num_failed = 0, 0
+    for job in jobs:
+        job     = {**(defaults or {}), **job}
+        start   = time.perf_counter()
+        ok      = False
+        try:
+            generate.main(**job)
+            ok = True
+        except Exception as e:
+            num_failed += 1
+            print(f"Job {num_jobs} failed: {e}\n{traceback.format_exc()}")
+
+        recorder.record("job", time.perf_counter() - start, ok=ok, job=num_jobs)
+        num_jobs += 1
+
+    print(f"Worker finished {num_jobs} jobs ({num_failed} failed), timings in {log_path}")
+    return num_failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived generation worker: import and warm up once, then run many jobs.")
+    parser.add_argument("--jobs", type=str, default=None,
+                        help="File of JSON lines with generate.main arguments per job, or - to read them from stdin")
+    parser.add_argument("-n", "--num", type=int, default=10, help="Decodings per task when running task shards")
+    parser.add_argument("-c", "--config", type=str, default=None, help="Path to YAML config, used for task shards and the warm-up")
+    parser.add_argument("-b", "--bucket_name", type=str, default=None, help="Bucket for task shards")
+    parser.add_argument("--task_indices", type=str, default=None, help="Task shards to run one after the other, e.g. 0-3,7")
+    parser.add_argument("--task_count", type=int, default=None, help="Number of tasks in the job")
+    parser.add_argument("--job_seed", type=int, default=None, help="Seed shared by all tasks of the job")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes per job")
+    parser.add_argument("--no_warmup", action="store_true", help="Skip the throwaway warm-up decoding")
+    parser.add_argument("--log_path", type=str, default=None, help="Import and job timings (JSON lines)")
+
+    args = parser.parse_args()
+
+    if args.jobs:
+        jobs = read_jobs(args.jobs)
+    elif args.config and args.task_indices:
+        if args.task_count is None or args.job_seed is None:
+            parser.error("--task_indices needs --task_count and --job_seed, so that tasks share one plan")
+        jobs = shard_jobs(args.num, args.config, args.bucket_name, parse_task_indices(args.task_indices),
+                          args.task_count, args.job_seed)
+    elif args.config:
+        jobs = iter([{"num_decodings_targeted": args.num, "yaml_path": args.config, "bucket_name": args.bucket_name}])
+    else:
+        parser.error("Give --jobs, or --config with optional --task_indices")
+
+    # The warm-up parses the config itself, which only works for local files
+    warmup_config = None
+    if not args.no_warmup and args.config and os.path.exists(args.config):
+        warmup_config = args.config
+
+    log_path = args.log_path or os.path.join("worker_logs", f"worker_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}.jsonl")
+    num_failed = run_worker(jobs,
+                            log_path,
+                            warmup_config=warmup_config,
+                            storage=bool(args.bucket_name) and not args.bucket_name.startswith("file://"),
+                            defaults={"num_workers": args.workers})
+    sys.exit(1 if num_failed else 0)
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import threading
+import zipfile
+import numpy as np
+from usat_designer.processing.constants import *
+from parameter_sampling.utils import dataset
+from parameter_sampling.utils import matrix_codecs
+
+ARTIFACTS_KEY           = "shared_artifacts"  # Metadata entry mapping output keys to artifact names
+
+# Matrices of a decoding kept in its NPZ, and the outputs among them and in the metadata that
+# only depend on the input and output format or layout, not on the seed
+SEED_MATRIX_KEYS        = (DSN_OUT_SPEAKER_MATRIX,
+                           DSN_OUT_ENCODING_MATRIX,
+                           DSN_OUT_TRANSCODING_MATRIX,
+                           DSN_OUT_DECODING_MATRIX)
+SHARED_MATRIX_KEYS      = (DSN_OUT_ENCODING_MATRIX,)
+SHARED_METADATA_KEYS    = (DSN_OUT_CLOUD, DSN_OUT_OUTPUT_LAYOUT)
+
+ARRAY_SUFFIX            = ".npy"
+MATRIX_SUFFIX           = ".npz"  # Arrays written through a MatrixCodec, as an NPZ holding one member named after the key
+JSON_SUFFIX             = ".json"
+
+
+def array_digest(array):
+    array   = np.ascontiguousarray(array)
+    digest  = hashlib.sha1(f"{array.dtype.str}{array.shape}".encode())
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def json_digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class ArtifactStore:
+    """
+    Content-addressed directory of outputs shared between seeds. Every artifact is written once
+    as <key>_<sha1>.npy (matrices), <key>_<sha1>.npz (matrices stored with a non-default
+    MatrixCodec) or <key>_<sha1>.json (metadata entries); writers racing on the same artifact
+    produce identical files, so the last atomic rename wins harmlessly. The digest is taken
+    before encoding. Reads are cached for the lifetime of the store.
+    """
+
+    def __init__(self, store_dir, codec=None):
+        self.store_dir  = store_dir
+        self.codec      = codec
+        self._known     = set()
+        self._cache     = {}
+        self._lock      = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def _put(self, name, write):
+        with self._lock:
+            if name in self._known:
+                return name
+            path = self.path(name)
+            if not os.path.exists(path):
+                os.makedirs(self.store_dir, exist_ok=True)
+                # Hidden and without an artifact suffix, so names() never lists a partial write
+                tmp_path = self.path(f".{name}.{os.getpid()}.tmp")
+                write(tmp_path)
+                os.replace(tmp_path, path)
+            self._known.add(name)
+        return name
+
+    def put_array(self, key, array):
+        array = np.asarray(array)
+        if self.codec is not None and not self.codec.is_default:
+            return self._put(f"{key}_{array_digest(array)}{MATRIX_SUFFIX}",
+                             lambda tmp_path: self.codec.write_npz(tmp_path, {key: array}))
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+        return self._put(f"{key}_{array_digest(array)}{ARRAY_SUFFIX}", write)
+
+    def put_json(self, key, value):
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+        return self._put(f"{key}_{json_digest(value)}{JSON_SUFFIX}", write)
+
+    def get(self, name, upcast=False):
+        """The artifact's value; upcast restores matrices downcast by the codec."""
+        upcast = upcast and name.endswith(MATRIX_SUFFIX)
+        if (name, upcast) not in self._cache:
+            path = self.path(name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Shared artifact {name} not found in {self.store_dir}")
+            if name.endswith(ARRAY_SUFFIX):
+                value = np.load(path, mmap_mode="r")
+            elif name.endswith(MATRIX_SUFFIX):
+                value = next(iter(matrix_codecs.read_npz(path, upcast_matrices=upcast).values()))
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = f.read()
+            self._cache[(name, upcast)] = value
+
+        value = self._cache[(name, upcast)]
+        # JSON is parsed per call so callers can modify what they get back
+        return json.loads(value) if name.endswith(JSON_SUFFIX) else value
+
+    def names(self):
+        if not os.path.isdir(self.store_dir):
+            return []
+        return sorted(f for f in os.listdir(self.store_dir)
+                      if f.endswith((ARRAY_SUFFIX, MATRIX_SUFFIX, JSON_SUFFIX)) and not f.startswith(".") and ".tmp" not in f)
+
+
+_stores = {}
+
+def open_store(store_dir, codec=None):
+    # One store per directory and process, so loaders share the read cache. Writers pass the
+    # codec new matrices are stored with
+    store_dir = os.path.abspath(store_dir)
+    if store_dir not in _stores:
+        _stores[store_dir] = ArtifactStore(store_dir)
+    if codec is not None:
+        _stores[store_dir].codec = codec
+    return _stores[store_dir]
+
+
+def store_for_results_dir(results_dir, codec=None):
+    return open_store(os.path.join(results_dir, dataset.ARTIFACT_DIR_NAME), codec)
+
+
+def _is_compressed(npz_path):
+    with zipfile.ZipFile(npz_path) as archive:
+        return any(info.compress_type != zipfile.ZIP_STORED for info in archive.infolist())
+
+
+def write_seed_matrices(seed_dir, seed, matrices, store=None, codec=None):
+    """
+    Writes a decoding's matrices in one pass: with a store, the shared ones go there instead of
+    into the seed's NPZ, and the rest are encoded with codec as they are written. Returns the
+    artifact names of the matrices moved to the store.
+    """
+    npz_path    = dataset.seed_dir_files(seed_dir, seed)[0]
+    matrices    = {key: np.asarray(value) for key, value in matrices.items()}
+    references  = {}
+    if store is not None:
+        for key in SHARED_MATRIX_KEYS:
+            if key in matrices:
+                references[key] = store.put_array(key, matrices.pop(key))
+
+    os.makedirs(seed_dir, exist_ok=True)
+    if codec is not None and not codec.is_default:
+        codec.write_npz(npz_path, matrices)
+    else:
+        tmp_path = f"{npz_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **matrices)
+        os.replace(tmp_path, npz_path)
+    return references
+
+
+def deduplicate_seed_dir(seed_dir, seed, store, references=None):
+    """
+    Moves the shared outputs of a saved seed into the store: the encoding matrix leaves the NPZ,
+    the cloud and output layout leave the metadata, and the metadata records their artifact
+    names instead, together with references already made by write_seed_matrices. Returns the
+    artifact names, empty when the seed has nothing to share.
+    """
+    npz_path, json_path, _ = dataset.seed_dir_files(seed_dir, seed)
+    references = dict(references or {})
+
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+        if isinstance(metadata, dict) and ARTIFACTS_KEY not in metadata:
+            for key in SHARED_METADATA_KEYS:
+                if key in metadata:
+                    references[key] = store.put_json(key, metadata.pop(key))
+
+    # Only seeds saved before their matrices were split have shared matrices left to move
+    shared = []
+    if os.path.exists(npz_path):
+        with np.load(npz_path) as data:
+            shared = [key for key in SHARED_MATRIX_KEYS if key in data.files]
+            if shared:
+                matrices = {key: data[key] for key in data.files}
+
+        for key in shared:
+            references[key] = store.put_array(key, matrices.pop(key))
+
+        if shared:
+            save     = np.savez_compressed if _is_compressed(npz_path) else np.savez
+            tmp_path = npz_path + ".tmp.npz"
+            save(tmp_path, **matrices)
+            os.replace(tmp_path, npz_path)
+
+    if references:
+        if not os.path.exists(json_path) or not isinstance(metadata, dict):
+            metadata = {}
+        metadata[ARTIFACTS_KEY] = references
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, json_path)
+
+    return references
+
+
+def artifact_references(metadata):
+    return metadata.get(ARTIFACTS_KEY, {}) if isinstance(metadata, dict) else {}
+
+
+def resolve_metadata(metadata, store):
+    """Metadata with its shared entries read back from the store, as originally saved."""
+    references = artifact_references(metadata)
+    if not references:
+        return metadata
+
+    metadata = {key: value for key, value in metadata.items() if key != ARTIFACTS_KEY}
+    for key, name in references.items():
+        if key in SHARED_METADATA_KEYS:
+            metadata[key] = store.get(name)
+    return metadata
+
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+import numpy as np
+from parameter_sampling.utils import matrix_codecs
+
+OUTPUT_FORMAT_DIRS      = "dirs"
+OUTPUT_FORMAT_SHARDS    = "shards"
+OUTPUT_FORMATS          = (OUTPUT_FORMAT_DIRS, OUTPUT_FORMAT_SHARDS)
+
+SHARD_DIR_NAME          = "shards"
+ARTIFACT_DIR_NAME       = "shared"  # Outputs shared between seeds, see artifacts.py
+SHARD_MATRICES_SUFFIX   = ".npz"
+SHARD_PARQUET_SUFFIX    = ".parquet"
+SHARD_JSONL_SUFFIX      = ".jsonl"
+SHARD_SEEDS_KEY         = "seeds"
+
+# Rows written by one flush: the shard files and the seeds they contain
+ShardFlush = namedtuple("ShardFlush", ["paths", "seeds"])
+
+
+def seed_dir_files(seed_dir, seed):
+    return (os.path.join(seed_dir, f"matrix_data_{seed}.npz"),
+            os.path.join(seed_dir, f"metadata_{seed}.json"),
+            os.path.join(seed_dir, f"y_parameters_{seed}.xml"))
+
+
+def _read_text(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _write_table(path_base, rows):
+    # Parquet when pyarrow is installed, JSON lines otherwise; readers accept both
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        path        = path_base + SHARD_JSONL_SUFFIX
+        tmp_path    = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(tmp_path, path)
+        return path
+
+    path        = path_base + SHARD_PARQUET_SUFFIX
+    tmp_path    = path + ".tmp"
+    pq.write_table(pa.Table.from_pylist(rows), tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_table(path):
+    if path.endswith(SHARD_PARQUET_SUFFIX):
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ShardWriter:
+    """
+    Appends decodings to rolling shards instead of one directory per seed. Each shard is a
+    pair of files sharing a name:
+        <name>.npz                  every matrix key stored as one flat array plus an offset,
+                                    shape and presence index (<key>__data, <key>__offsets,
+                                    <key>__shapes, <key>__present)
+        <name>.parquet / .jsonl     one row per seed: seed, row, parameters XML, metadata JSON
+    A shard is written once it holds max_rows decodings or max_bytes of matrix data. With a
+    MatrixCodec the matrix data is downcast and compressed as configured.
+    """
+
+    def __init__(self, shard_dir, writer_id, max_rows=1000, max_bytes=512 * 2**20, codec=None):
+        self.shard_dir  = shard_dir
+        self.writer_id  = writer_id
+        self.max_rows   = max_rows
+        self.max_bytes  = max_bytes
+        self.codec      = codec
+        self._index     = 0
+        self._lock      = threading.Lock()
+        self._reset()
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def _reset(self):
+        self._seeds     = []
+        self._matrices  = []
+        self._records   = []
+        self._num_bytes = 0
+
+    def add(self, seed, matrices, xml=None, metadata=None):
+        """Buffers one decoding. Returns a ShardFlush when this completed a shard, otherwise None."""
+        with self._lock:
+            row = len(self._seeds)
+            self._seeds.append(int(seed))
+            self._matrices.append({key: np.asarray(value) for key, value in matrices.items()})
+            self._records.append({"seed": int(seed), "row": row, "xml": xml, "metadata": metadata})
+            self._num_bytes += sum(np.asarray(value).nbytes for value in matrices.values())
+
+            if len(self._seeds) >= self.max_rows or self._num_bytes >= self.max_bytes:
+                return self._flush()
+        return None
+
+    def add_seed_dir(self, seed, seed_dir):
+        """Buffers a decoding saved in the per-seed directory layout."""
+        npz_path, json_path, xml_path = seed_dir_files(seed_dir, seed)
+        matrices = matrix_codecs.read_npz(npz_path)
+        return self.add(seed, matrices, xml=_read_text(xml_path), metadata=_read_text(json_path))
+
+    def _flush(self):
+        if not self._seeds:
+            return None
+
+        name        = f"shard_{self.writer_id}_{self._index:05d}"
+        path_base   = os.path.join(self.shard_dir, name)
+        keys        = sorted({key for matrices in self._matrices for key in matrices})
+        arrays      = {SHARD_SEEDS_KEY: np.asarray(self._seeds, dtype=np.int64)}
+
+        for key in keys:
+            present     = [matrices[key] for matrices in self._matrices if key in matrices]
+            max_ndim    = max(array.ndim for array in present)
+            shapes      = np.full((len(self._seeds), max(max_ndim, 1)), -1, dtype=np.int64)
+            sizes       = np.zeros(len(self._seeds), dtype=np.int64)
+            is_present  = np.zeros(len(self._seeds), dtype=bool)
+
+            for row, matrices in enumerate(self._matrices):
+                if key in matrices:
+                    array                       = matrices[key]
+                    shapes[row, :array.ndim]    = array.shape
+                    sizes[row]                  = array.size
+                    is_present[row]             = True
+
+            arrays[f"{key}__data"]      = np.concatenate([array.ravel() for array in present])
+            arrays[f"{key}__offsets"]   = np.concatenate([[0], np.cumsum(sizes)])
+            arrays[f"{key}__shapes"]    = shapes
+            arrays[f"{key}__present"]   = is_present
+
+        if self.codec is not None:
+            # Every seed's matrix has to stay within the tolerance, not just the shard as a whole
+            self.codec.write_npz(path_base + SHARD_MATRICES_SUFFIX, arrays,
+                                 offsets={f"{key}__data": arrays[f"{key}__offsets"] for key in keys})
+        else:
+            tmp_path = path_base + ".tmp" + SHARD_MATRICES_SUFFIX
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path_base + SHARD_MATRICES_SUFFIX)
+        table_path = _write_table(path_base, self._records)
+
+        flush = ShardFlush([path_base + SHARD_MATRICES_SUFFIX, table_path], list(self._seeds))
+        print(f"Wrote shard {name} with {len(self._seeds)} decodings")
+
+        self._index += 1
+        self._reset()
+        return flush
+
+    def close(self):
+        with self._lock:
+            return self._flush()
+
+
+class ShardReader:
+    """
+    Reads one shard: records eagerly, matrices on demand one key at a time. The flat data of a
+    key is read once per reader and memory-mapped when stored uncompressed, so reading many
+    rows through one reader costs one read of the key. Pickled readers keep only their path.
+    """
+
+    def __init__(self, path_base):
+        self.path_base  = path_base
+        self._records   = None
+        self._keys      = None
+        self._index     = {}
+        self._flat      = {}
+
+    def __getstate__(self):
+        return {"path_base": self.path_base}
+
+    def __setstate__(self, state):
+        self.__init__(state["path_base"])
+
+    @property
+    def records(self):
+        if self._records is None:
+            for suffix in (SHARD_PARQUET_SUFFIX, SHARD_JSONL_SUFFIX):
+                if os.path.exists(self.path_base + suffix):
+                    self._records = _read_table(self.path_base + suffix)
+                    break
+            else:
+                raise FileNotFoundError(f"No record table for shard {self.path_base}")
+        return self._records
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            with np.load(self.path_base + SHARD_MATRICES_SUFFIX) as data:
+                self._keys = [name[:-len("__offsets")] for name in data.files if name.endswith("__offsets")]
+        return self._keys
+
+    def _key_index(self, key):
+        if key not in self._index:
+            with np.load(self.path_base + SHARD_MATRICES_SUFFIX) as data:
+                if f"{key}__offsets" not in data.files:
+                    raise KeyError(f"Shard {self.path_base} has no matrix {key}")
+                self._index[key] = (data[f"{key}__offsets"], data[f"{key}__shapes"], data[f"{key}__present"])
+        return self._index[key]
+
+    def _flat_data(self, key, upcast):
+        if (key, upcast) not in self._flat:
+            path = self.path_base + SHARD_MATRICES_SUFFIX
+            flat = matrix_codecs.map_member(path, f"{key}__data")
+            with np.load(path) as data:
+                # Compressed members can only be read whole
+                if flat is None:
+                    flat = data[f"{key}__data"]
+                if upcast:
+                    flat = matrix_codecs.upcast(flat, matrix_codecs.codec_record(data).get(f"{key}__data"))
+            self._flat[(key, upcast)] = flat
+        return self._flat[(key, upcast)]
+
+    def matrix(self, row, key, upcast=False):
+        offsets, shapes, is_present = self._key_index(key)
+        if not is_present[row]:
+            return None
+        shape   = tuple(int(dim) for dim in shapes[row] if dim >= 0)
+        flat    = self._flat_data(key, upcast)
+        return flat[offsets[row]:offsets[row + 1]].reshape(shape)
+
+    def matrices(self, key, upcast=False):
+        """All rows of one key, reading the flat data array once. upcast restores downcast matrices."""
+        offsets, shapes, is_present = self._key_index(key)
+        flat                        = self._flat_data(key, upcast)
+
+        result = []
+        for row in range(len(shapes)):
+            if not is_present[row]:
+                result.append(None)
+                continue
+            shape = tuple(int(dim) for dim in shapes[row] if dim >= 0)
+            result.append(flat[offsets[row]:offsets[row + 1]].reshape(shape))
+        return result
+
+
+def list_shards(shard_dir):
+    names = sorted(f[:-len(SHARD_MATRICES_SUFFIX)] for f in os.listdir(shard_dir)
+                   if f.startswith("shard_") and f.endswith(SHARD_MATRICES_SUFFIX) and ".tmp" not in f)
+    return [os.path.join(shard_dir, name) for name in names]
+
+
+def iter_shard_records(shard_dir):
+    for path_base in list_shards(shard_dir):
+        reader = ShardReader(path_base)
+        for record in reader.records:
+            yield reader, record
+
+
+def convert_seed_dirs(src_dir, dest_dir, max_rows=1000, writer_id="converted"):
+    """Packs an existing run of seed_<n>/ directories into shards."""
+    writer      = ShardWriter(dest_dir, writer_id, max_rows=max_rows)
+    num_seeds   = 0
+
+    for folder_name in sorted(os.listdir(src_dir)):
+        folder_path = os.path.join(src_dir, folder_name)
+        if not os.path.isdir(folder_path) or not folder_name.startswith("seed_"):
+            continue
+        try:
+            seed = int(folder_name.split("_")[-1])
+        except ValueError:
+            print(f"Skipping folder with invalid seed: {folder_name}")
+            continue
+
+        try:
+            writer.add_seed_dir(seed, folder_path)
+            num_seeds += 1
+        except Exception as e:
+            print(f"Failed to convert {folder_path}: {e}")
+
+    writer.close()
+
+    # Shared artifacts referenced by the seeds sit next to the shard directory
+    src_artifacts = os.path.join(src_dir, ARTIFACT_DIR_NAME)
+    if os.path.isdir(src_artifacts):
+        shutil.copytree(src_artifacts,
+                        os.path.join(os.path.dirname(os.path.abspath(dest_dir)), ARTIFACT_DIR_NAME),
+                        dirs_exist_ok=True)
+
+    print(f"Converted {num_seeds} seed directories from {src_dir} into shards in {dest_dir}")
+    return num_seeds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert per-seed result directories into shards.")
+    parser.add_argument("src_dir", type=str, help="Directory containing seed_<n>/ folders")
+    parser.add_argument("dest_dir", type=str, help="Directory to write shards to")
+    parser.add_argument("--shard_size", type=int, default=1000, help="Decodings per shard")
+
+    args = parser.parse_args()
+    convert_seed_dirs(args.src_dir, args.dest_dir, max_rows=args.shard_size)
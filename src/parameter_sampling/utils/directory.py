@@ -1,8 +1,16 @@
-from google.cloud import storage
+import functools
 import os 
 import shutil
 
 
+@functools.lru_cache(maxsize=None)
+def get_storage_client():
+    # One client (and HTTP session) per process instead of one per call. The storage library
+    # is imported here so that runs without a bucket never load it
+    from google.cloud import storage
+    return storage.Client()
+
+
 def prepare_output_dir(yaml_path, bucket_name=None):
     yaml_base   = os.path.splitext(os.path.basename(yaml_path))[0]
     yaml_dir    = yaml_base
@@ -23,7 +31,7 @@ def download_yaml_to_directory(gcs_uri, dest_dir):
     if not is_gcs_path(gcs_uri):
         raise ValueError("Not a valid GCS URI: must start with 'gs://'")
 
-    storage_client  = storage.Client()
+    storage_client  = get_storage_client()
     _, path         = gcs_uri.split("gs://", 1)
     
     bucket_name, *blob_parts = path.split("/")
@@ -49,7 +57,7 @@ def copy_local_yaml_to_directory(local_yaml_path, dest_dir):
 
 def upload_blob_to_gcs(local_file_path, bucket_name, destination_blob_name):
 
-    client  = storage.Client()
+    client  = get_storage_client()
     bucket  = client.bucket(bucket_name)
     blob    = bucket.blob(destination_blob_name)
 
@@ -58,7 +66,7 @@ def upload_blob_to_gcs(local_file_path, bucket_name, destination_blob_name):
 
 
 def blob_exists(bucket_name, blob_name):
-    client = storage.Client()
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
     return blob.exists()
@@ -67,7 +75,7 @@ def upload_directory_to_gcs(local_dir,
                             bucket_name, 
                             gcs_prefix):
     
-    client = storage.Client()
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     for root, _, files in os.walk(local_dir):
@@ -0,0 +1,200 @@
+import json
+import os
+import struct
+import zipfile
+import numpy as np
+
+DTYPE_FLOAT64           = "float64"
+DTYPE_FLOAT32           = "float32"
+DTYPE_FLOAT16           = "float16"
+DTYPES                  = (DTYPE_FLOAT64, DTYPE_FLOAT32, DTYPE_FLOAT16)
+
+COMPRESSION_NONE        = "none"
+COMPRESSION_DEFLATE     = "deflate"
+COMPRESSION_LZMA        = "lzma"
+COMPRESSIONS            = {COMPRESSION_NONE: zipfile.ZIP_STORED,
+                           COMPRESSION_DEFLATE: zipfile.ZIP_DEFLATED,
+                           COMPRESSION_LZMA: zipfile.ZIP_LZMA}
+
+CODEC_MEMBER            = "__codec__"  # NPZ member holding the JSON record of how each matrix was stored
+DEFAULT_TOLERANCE       = 1e-3
+DEFAULT_CHUNK_BYTES     = 64 * 2**20
+
+
+def _flat_chunks(array, chunk_bytes):
+    flat    = np.ascontiguousarray(array).reshape(-1)
+    step    = max(1, chunk_bytes // max(flat.itemsize, 1))
+    for start in range(0, flat.size, step):
+        yield flat[start:start + step]
+
+
+def downcast_error(array, dtype, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Largest absolute error of storing array as dtype, relative to the largest absolute value."""
+    max_error, max_value = 0.0, 0.0
+    for chunk in _flat_chunks(array, chunk_bytes):
+        if not chunk.size:
+            continue
+        max_error = max(max_error, float(np.max(np.abs(chunk - chunk.astype(dtype).astype(chunk.dtype)))))
+        max_value = max(max_value, float(np.max(np.abs(chunk))))
+    if not np.isfinite(max_error):
+        return float("inf")
+    return max_error / max_value if max_value > 0 else max_error
+
+
+def segments_downcast_error(flat, offsets, dtype, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Largest downcast_error of the segments flat[offsets[i]:offsets[i + 1]], each relative to its own values."""
+    max_error = 0.0
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        if stop > start:
+            max_error = max(max_error, downcast_error(flat[start:stop], dtype, chunk_bytes))
+    return max_error
+
+
+class MatrixCodec:
+    """
+    How output matrices are written: floating point matrices are downcast to dtype unless the
+    relative error exceeds tolerance, in which case they keep their own dtype. Members are
+    written chunk by chunk, so a downcast never holds a second full copy of a matrix, and are
+    optionally compressed. The choice and the measured error per matrix are recorded in the
+    archive for read_npz.
+    """
+
+    def __init__(self,
+                 dtype=DTYPE_FLOAT64,
+                 compression=COMPRESSION_NONE,
+                 tolerance=DEFAULT_TOLERANCE,
+                 chunk_bytes=DEFAULT_CHUNK_BYTES):
+
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown matrix dtype {dtype}, expected one of {DTYPES}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}, expected one of {tuple(COMPRESSIONS)}")
+
+        self.dtype          = dtype
+        self.compression    = compression
+        self.tolerance      = tolerance
+        self.chunk_bytes    = chunk_bytes
+
+    @property
+    def is_default(self):
+        return self.dtype == DTYPE_FLOAT64 and self.compression == COMPRESSION_NONE
+
+    def storage_dtype(self, array, offsets=None):
+        """
+        Dtype to store array with, and the record kept for the reader. With offsets, array is
+        the flat concatenation of several matrices and each must stay within the tolerance
+        relative to its own largest value, else the whole array keeps its dtype.
+        """
+        info = {"dtype": array.dtype.str, "stored": array.dtype.str}
+        if not np.issubdtype(array.dtype, np.floating) or np.dtype(self.dtype).itemsize >= array.dtype.itemsize:
+            return array.dtype, info
+
+        if offsets is None:
+            error = downcast_error(array, self.dtype, self.chunk_bytes)
+        else:
+            error = segments_downcast_error(array, offsets, self.dtype, self.chunk_bytes)
+            info["per_segment"] = True
+        info["error"] = error
+        if error > self.tolerance:
+            info["fallback"] = True
+            return array.dtype, info
+
+        info["stored"] = np.dtype(self.dtype).str
+        return np.dtype(self.dtype), info
+
+    def _write_member(self, archive, name, array, dtype):
+        header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": array.shape}
+        with archive.open(f"{name}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array_header_2_0(f, header)
+            for chunk in _flat_chunks(array, self.chunk_bytes):
+                f.write(chunk.astype(dtype, copy=False).tobytes())
+
+    def write_npz(self, path, arrays, offsets=None):
+        """
+        Writes arrays as an NPZ readable by np.load, atomically. Returns the codec record.
+        offsets maps member names to segment offsets whose tolerance is checked per segment.
+        """
+        records     = {}
+        offsets     = offsets or {}
+        tmp_path    = f"{path}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=COMPRESSIONS[self.compression], allowZip64=True) as archive:
+            for name, array in arrays.items():
+                array                   = np.asarray(array)
+                dtype, records[name]    = self.storage_dtype(array, offsets.get(name))
+                self._write_member(archive, name, array, dtype)
+
+            record = np.asarray(json.dumps({"compression": self.compression, "matrices": records}))
+            self._write_member(archive, CODEC_MEMBER, record, record.dtype)
+
+        os.replace(tmp_path, path)
+        return records
+
+    def encode_npz(self, path):
+        """Rewrites an existing NPZ with this codec."""
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files if key != CODEC_MEMBER}
+        return self.write_npz(path, arrays)
+
+
+def codec_record(data):
+    # data is an open NpzFile; archives written without a codec have no record
+    if CODEC_MEMBER not in data.files:
+        return {}
+    return json.loads(str(data[CODEC_MEMBER])).get("matrices", {})
+
+
+def upcast(array, info):
+    """The matrix in the dtype it had before being stored."""
+    if not info or info["dtype"] == array.dtype.str:
+        return array
+    return array.astype(np.dtype(info["dtype"]))
+
+
+def read_npz(path, keys=None, upcast_matrices=False):
+    """
+    Reads matrices from an NPZ written by MatrixCodec or np.savez, without the codec record.
+    Downcast matrices come back in their stored dtype unless upcast_matrices is set.
+    """
+    with np.load(path) as data:
+        record  = codec_record(data)
+        keys    = [key for key in data.files if key != CODEC_MEMBER] if keys is None else keys
+        arrays  = {key: data[key] for key in keys}
+
+    if upcast_matrices:
+        arrays = {key: upcast(array, record.get(key)) for key, array in arrays.items()}
+    return arrays
+
+
+def matrix_keys(path):
+    with np.load(path) as data:
+        return [key for key in data.files if key != CODEC_MEMBER]
+
+
+def map_member(npz_path, key):
+    """
+    Memory-maps one member of an NPZ straight from the archive, or returns None when it is
+    compressed or cannot be mapped (object arrays, scalars, empty arrays, unknown header versions).
+    """
+    with zipfile.ZipFile(npz_path) as archive:
+        info = archive.getinfo(f"{key}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(npz_path, "rb") as f:
+        f.seek(info.header_offset)
+        name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            return None
+        offset = f.tell()
+
+    if dtype.hasobject or not shape or 0 in shape:
+        return None
+    return np.memmap(npz_path, dtype=dtype, mode="r", shape=shape,
+                     order="F" if fortran_order else "C", offset=offset)
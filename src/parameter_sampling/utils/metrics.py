@@ -0,0 +1,104 @@
+import numpy as np
+from usat_designer.processing.constants import *
+
+# Quality score and focus P of a decoding, shared by generation (adaptive rounds) and analysis.
+# The transcoder calculations are imported where they are used, so that importing the scores
+# does not pay for them
+
+def get_width_and_angular_error(cloud_points, S, output_layout):
+    from universal_transcoder.calculations.energy_intensity import (angular_error, radial_I_calculation,
+                                                                     transverse_I_calculation, width_angle)
+
+    radial_i        = radial_I_calculation(cloud_points, S, output_layout)
+    transverse_i    = transverse_I_calculation(cloud_points, S, output_layout)
+    
+    angular_error_calc  = angular_error(radial_i, transverse_i)
+    width_calc          = width_angle(radial_i)
+
+    return angular_error_calc, width_calc
+
+
+def compute_qs_and_ps_batch(angular_error, source_width, energy):
+    """Quality score, P and their components for each row of (decodings, points) arrays."""
+    angular_error   = np.asarray(angular_error, dtype=np.float64)
+    source_width    = np.asarray(source_width, dtype=np.float64)
+    energy          = np.asarray(energy, dtype=np.float64)
+
+    # Metrics
+    ae_mean     = np.mean(angular_error, axis=1)
+    ae_90       = np.percentile(angular_error, 90, axis=1)
+
+    # Share of errors under epsilon among those inside the 0-90 degree histogram range
+    epsilon     = 15 # degrees
+    in_range    = (angular_error >= 0) & (angular_error <= 90)
+    ae_under_15 = (in_range & (angular_error < epsilon)).sum(axis=1) / in_range.sum(axis=1)
+
+    sw_median   = np.median(source_width, axis=1)
+    e_std       = np.std(energy, axis=1)
+
+    # Normalisation
+    def normalise(x, min_val, max_val, inverse=False):
+        norm = (x - min_val) / (max_val - min_val)
+        norm = 1 - norm if inverse else norm
+        return np.clip(norm, 0, 1)
+
+    score_ae_mean       = normalise(ae_mean, 0, 45, inverse=True)
+    score_ae_90         = normalise(ae_90, 0, 90, inverse=True)
+    score_ae_under_15   = ae_under_15
+    score_sw_median     = normalise(sw_median, 0, 90, inverse=True)
+    score_e_std         = normalise(e_std, 0, 1, inverse=True)
+
+    # P
+    P = np.std(source_width, axis=1)
+
+    # --- Weights ---
+    ae_mean_weight      = 0.1
+    sw_median_weight    = 0.6
+    ae_90_weight        = 0.0
+    ae_under_15_weight  = 0.1
+    e_std_weight        = 0.2
+
+    weights = [
+        ae_mean_weight,
+        ae_90_weight,
+        ae_under_15_weight,
+        sw_median_weight,
+        e_std_weight
+    ]
+
+    assert int(round(np.sum(weights))) == 1
+
+    q_s = (score_ae_mean * ae_mean_weight +
+           score_ae_90   * ae_90_weight +
+           score_ae_under_15 * ae_under_15_weight +
+           score_sw_median * sw_median_weight +
+           score_e_std * e_std_weight) * 100
+
+    return [{
+        DSN_SMPL_QUALITY_SCORE: float(q_s[i]),
+        DSN_SMPL_P: float(P[i]),
+        "ae_mean": float(ae_mean[i]),
+        "ae_90": float(ae_90[i]),
+        "ae_under_15": float(ae_under_15[i]),
+        "sw_median": float(sw_median[i]),
+        "e_std": float(e_std[i]),
+        "score_ae_mean": float(score_ae_mean[i]),
+        "score_ae_90": float(score_ae_90[i]),
+        "score_ae_under_15": float(score_ae_under_15[i]),
+        "score_sw_median": float(score_sw_median[i]),
+        "score_e_std": float(score_e_std[i])
+    } for i in range(len(q_s))]
+
+
+def compute_qs_and_ps(angular_error, source_width, energy):
+    return compute_qs_and_ps_batch(np.ravel(angular_error)[None],
+                                   np.ravel(source_width)[None],
+                                   np.ravel(energy)[None])[0]
+
+
+def compute_decoding_metrics(cloud_points, S, output_layout):
+    from universal_transcoder.calculations.energy_intensity import energy_calculation
+
+    energy                  = energy_calculation(S)
+    ang_error, source_width = get_width_and_angular_error(cloud_points, S, output_layout)
+    return compute_qs_and_ps(ang_error, source_width, energy)
@@ -0,0 +1,177 @@
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+LOCAL_BACKEND_PREFIX = "file://"
+
+# Errors that will not go away by trying again
+NON_RETRYABLE_ERRORS = (FileNotFoundError, IsADirectoryError, PermissionError)
+
+
+@dataclass
+class UploadResult:
+    local_path: str
+    destination: str
+    ok: bool
+    attempts: int
+    num_bytes: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+class LocalBackend:
+    """Stand-in for a bucket backed by a local directory, for tests and benchmarks without network access."""
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root_dir, *name.split("/"))
+
+    def uri(self, name):
+        return f"{LOCAL_BACKEND_PREFIX}{self._path(name)}"
+
+    def upload_file(self, local_path, name):
+        destination = self._path(name)
+        tmp_path    = f"{destination}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, destination)
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def download_file(self, name, local_path):
+        if not self.exists(name):
+            return False
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        shutil.copyfile(self._path(name), local_path)
+        return True
+
+
+class GCSBackend:
+    """One storage client per backend, with an HTTP connection pool sized for the upload threads."""
+
+    def __init__(self, bucket_name, max_connections=32):
+        self.bucket_name        = bucket_name
+        self.max_connections    = max_connections
+        self._bucket            = None
+        self._lock              = threading.Lock()
+
+    def bucket(self):
+        with self._lock:
+            if self._bucket is None:
+                from google.cloud import storage
+                import requests.adapters
+
+                client  = storage.Client()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_connections,
+                                                        pool_maxsize=self.max_connections)
+                # The client's authorized session defaults to 10 pooled connections
+                client._http.mount("https://", adapter)
+                self._bucket = client.bucket(self.bucket_name)
+        return self._bucket
+
+    def uri(self, name):
+        return f"gs://{self.bucket_name}/{name}"
+
+    def upload_file(self, local_path, name):
+        self.bucket().blob(name).upload_from_filename(local_path)
+
+    def exists(self, name):
+        return self.bucket().blob(name).exists()
+
+    def download_file(self, name, local_path):
+        blob = self.bucket().blob(name)
+        if not blob.exists():
+            return False
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        blob.download_to_filename(local_path)
+        return True
+
+
+def make_backend(bucket_name, max_connections=32):
+    # "file:///some/dir" selects the local stand-in, anything else is a GCS bucket name
+    if bucket_name.startswith(LOCAL_BACKEND_PREFIX):
+        return LocalBackend(bucket_name[len(LOCAL_BACKEND_PREFIX):])
+    return GCSBackend(bucket_name, max_connections=max_connections)
+
+
+class Uploader:
+    """
+    Uploads files concurrently on a thread pool, retrying failed files with jittered
+    exponential backoff. Every file yields an UploadResult instead of a printed error.
+    """
+
+    def __init__(self, backend, max_workers=8, max_retries=4, backoff=0.5, max_backoff=30.0):
+        self.backend        = backend
+        self.max_retries    = max_retries
+        self.backoff        = backoff
+        self.max_backoff    = max_backoff
+        self._executor      = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+
+    def _upload_with_retry(self, local_path, destination):
+        start       = time.perf_counter()
+        attempts    = 0
+        error       = None
+
+        while attempts <= self.max_retries:
+            attempts += 1
+            try:
+                self.backend.upload_file(local_path, destination)
+                return UploadResult(local_path, self.backend.uri(destination), True, attempts,
+                                    num_bytes=os.path.getsize(local_path),
+                                    elapsed=time.perf_counter() - start)
+            except NON_RETRYABLE_ERRORS as e:
+                error = e
+                break
+            except Exception as e:
+                error = e
+                if attempts <= self.max_retries:
+                    delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+                    time.sleep(delay * (0.5 + random.random()))
+
+        return UploadResult(local_path, self.backend.uri(destination), False, attempts,
+                            elapsed=time.perf_counter() - start,
+                            error=f"{type(error).__name__}: {error}")
+
+    def submit_file(self, local_path, destination):
+        return self._executor.submit(self._upload_with_retry, local_path, destination)
+
+    def upload_files(self, files):
+        """Uploads (local_path, destination) pairs concurrently and waits for all of them."""
+        futures = [self.submit_file(local_path, destination) for local_path, destination in files]
+        return [future.result() for future in futures]
+
+    def upload_directory(self, local_dir, prefix):
+        files = []
+        for root, _, file_names in os.walk(local_dir):
+            for file_name in file_names:
+                local_path      = os.path.join(root, file_name)
+                relative_path   = os.path.relpath(local_path, local_dir)
+                destination     = os.path.join(prefix, relative_path).replace("\\", "/")
+                files.append((local_path, destination))
+        return self.upload_files(files)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def report_failures(results):
+    failures = [result for result in results if not result.ok]
+    for result in failures:
+        print(f"Failed to upload {result.local_path} to {result.destination} "
+              f"after {result.attempts} attempts: {result.error}")
+    return failures
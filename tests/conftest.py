@@ -0,0 +1,8 @@
+import sys
+import os
+
+# The package lives under src/ and the analysis helpers are plain modules next to the notebook
+TOP_LEVEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (os.path.join(TOP_LEVEL_DIR, "src"), os.path.join(TOP_LEVEL_DIR, "analysis")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
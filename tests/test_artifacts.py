@@ -0,0 +1,121 @@
+import json
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("usat_designer")
+
+from usat_designer.processing.constants import *
+from parameter_sampling.utils import artifacts
+from parameter_sampling.utils import dataset
+from parameter_sampling.utils.matrix_codecs import MatrixCodec, read_npz
+
+
+def _outputs(seed):
+    # The encoding matrix, cloud and layout depend on the formats only, the rest on the seed
+    rng = np.random.default_rng(seed)
+    matrices = {
+        DSN_OUT_SPEAKER_MATRIX: rng.normal(size=(50, 12)),
+        DSN_OUT_ENCODING_MATRIX: np.arange(50 * 36, dtype=np.float64).reshape(50, 36),
+        DSN_OUT_TRANSCODING_MATRIX: rng.normal(size=(12, 36)),
+        DSN_OUT_DECODING_MATRIX: rng.normal(size=(50, 12)),
+    }
+    metadata = {
+        DSN_OUT_CLOUD: [[0.0, 0.0, 1.0], [0.5, 0.5, 1.0]],
+        DSN_OUT_OUTPUT_LAYOUT: {"name": "layout_7_0_4", "speakers": 11},
+        "seed": seed,
+    }
+    return matrices, metadata
+
+
+def _write_seed(results_dir, seed, store, codec=None):
+    seed_dir            = os.path.join(results_dir, f"seed_{seed}")
+    matrices, metadata  = _outputs(seed)
+    references          = artifacts.write_seed_matrices(seed_dir, seed, matrices, store, codec)
+    with open(dataset.seed_dir_files(seed_dir, seed)[1], "w") as f:
+        json.dump(metadata, f)
+    artifacts.deduplicate_seed_dir(seed_dir, seed, store, references)
+    return seed_dir
+
+
+def _read_seed(seed_dir, seed, store, upcast=False):
+    npz_path, json_path, _ = dataset.seed_dir_files(seed_dir, seed)
+    with open(json_path, "r") as f:
+        metadata = json.load(f)
+
+    matrices = read_npz(npz_path, upcast_matrices=upcast)
+    for key, name in artifacts.artifact_references(metadata).items():
+        if key in artifacts.SHARED_MATRIX_KEYS:
+            matrices[key] = store.get(name, upcast=upcast)
+    return matrices, artifacts.resolve_metadata(metadata, store)
+
+
+def test_shared_outputs_round_trip(tmp_path):
+    results_dir = str(tmp_path)
+    store       = artifacts.ArtifactStore(os.path.join(results_dir, dataset.ARTIFACT_DIR_NAME))
+
+    seed_dirs = {seed: _write_seed(results_dir, seed, store) for seed in (1, 2, 3)}
+
+    # One copy of every shared output, whatever the number of seeds
+    names = store.names()
+    assert len(names) == len(artifacts.SHARED_MATRIX_KEYS) + len(artifacts.SHARED_METADATA_KEYS)
+
+    for seed, seed_dir in seed_dirs.items():
+        npz_path = dataset.seed_dir_files(seed_dir, seed)[0]
+        with np.load(npz_path) as data:
+            assert not set(artifacts.SHARED_MATRIX_KEYS) & set(data.files)
+
+        matrices, metadata              = _read_seed(seed_dir, seed, store)
+        expected_matrices, expected     = _outputs(seed)
+        assert metadata == expected
+        assert set(matrices) == set(expected_matrices)
+        for key, matrix in matrices.items():
+            assert np.array_equal(matrix, expected_matrices[key]), key
+
+
+def test_seeds_saved_whole_are_deduplicated_later(tmp_path):
+    store       = artifacts.ArtifactStore(str(tmp_path / dataset.ARTIFACT_DIR_NAME))
+    seed_dir    = str(tmp_path / "seed_4")
+    os.makedirs(seed_dir)
+
+    matrices, metadata      = _outputs(4)
+    npz_path, json_path, _  = dataset.seed_dir_files(seed_dir, 4)
+    np.savez_compressed(npz_path, **matrices)
+    with open(json_path, "w") as f:
+        json.dump(metadata, f)
+
+    references = artifacts.deduplicate_seed_dir(seed_dir, 4, store)
+    assert set(references) == set(artifacts.SHARED_MATRIX_KEYS) | set(artifacts.SHARED_METADATA_KEYS)
+
+    read_matrices, read_metadata = _read_seed(seed_dir, 4, store)
+    assert read_metadata == metadata
+    for key, matrix in matrices.items():
+        assert np.array_equal(read_matrices[key], matrix), key
+
+    # A second pass finds nothing left to move and keeps the references
+    assert artifacts.deduplicate_seed_dir(seed_dir, 4, store) == {}
+    assert _read_seed(seed_dir, 4, store)[1] == metadata
+
+
+def test_shared_matrices_go_through_the_codec(tmp_path):
+    codec = MatrixCodec("float32", "deflate", tolerance=1e-5)
+    store = artifacts.ArtifactStore(str(tmp_path / dataset.ARTIFACT_DIR_NAME), codec)
+
+    seed_dir = _write_seed(str(tmp_path), 5, store, codec)
+    assert all(name.endswith(artifacts.MATRIX_SUFFIX) for name in store.names()
+               if not name.endswith(artifacts.JSON_SUFFIX))
+
+    matrices, _     = _read_seed(seed_dir, 5, store, upcast=True)
+    expected, _     = _outputs(5)
+    for key, matrix in matrices.items():
+        assert matrix.dtype == np.float64
+        np.testing.assert_allclose(matrix, expected[key], rtol=1e-6, atol=1e-6, err_msg=key)
+
+
+def test_partial_writes_are_not_listed(tmp_path):
+    store = artifacts.ArtifactStore(str(tmp_path))
+    name  = store.put_json(DSN_OUT_CLOUD, [1, 2, 3])
+    open(store.path(f".{name}.123.tmp"), "w").close()
+
+    assert store.names() == [name]
+    assert store.get(name) == [1, 2, 3]
@@ -0,0 +1,109 @@
+import json
+import os
+import pickle
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from parameter_sampling.utils import dataset
+from parameter_sampling.utils.matrix_codecs import MatrixCodec
+
+
+def _decoding(seed):
+    rng = np.random.default_rng(seed)
+    matrices = {
+        "S": rng.normal(size=(10 + seed, 4)),
+        "T": rng.normal(size=(4, 3 + seed % 2)),
+        "gain": np.asarray(float(seed)),
+    }
+    # One decoding without T, as when the optimizer returned no transcoding matrix
+    if seed == 3:
+        del matrices["T"]
+    return matrices
+
+
+def test_shards_round_trip(tmp_path):
+    shard_dir   = str(tmp_path / "shards")
+    writer      = dataset.ShardWriter(shard_dir, "w0", max_rows=3)
+
+    flushes = [writer.add(seed, _decoding(seed), xml=f"<xml seed='{seed}'/>", metadata=json.dumps({"seed": seed}))
+               for seed in range(5)]
+    assert flushes[:2] == [None, None] and flushes[3] is None
+    assert flushes[2].seeds == [0, 1, 2]
+    assert writer.close().seeds == [3, 4]
+    assert writer.close() is None
+
+    paths = dataset.list_shards(shard_dir)
+    assert [os.path.basename(path) for path in paths] == ["shard_w0_00000", "shard_w0_00001"]
+
+    seen = []
+    for reader, record in dataset.iter_shard_records(shard_dir):
+        seed, row = record["seed"], record["row"]
+        expected  = _decoding(seed)
+        assert record["xml"] == f"<xml seed='{seed}'/>"
+        assert json.loads(record["metadata"]) == {"seed": seed}
+        assert sorted(reader.keys) == ["S", "T", "gain"]
+
+        for key in reader.keys:
+            if key in expected:
+                assert np.array_equal(reader.matrix(row, key), expected[key])
+            else:
+                assert reader.matrix(row, key) is None
+        seen.append(seed)
+    assert seen == list(range(5))
+
+
+def test_matrices_reads_every_row_of_a_key(tmp_path):
+    writer = dataset.ShardWriter(str(tmp_path), "w0", max_rows=100)
+    for seed in range(4):
+        writer.add(seed, _decoding(seed))
+    path_base = writer.close().paths[0][:-len(dataset.SHARD_MATRICES_SUFFIX)]
+
+    reader = dataset.ShardReader(path_base)
+    for key in ("S", "T"):
+        for seed, matrix in enumerate(reader.matrices(key)):
+            expected = _decoding(seed).get(key)
+            assert (matrix is None) if expected is None else np.array_equal(matrix, expected)
+
+    # Pickled readers reopen the shard from its path
+    restored = pickle.loads(pickle.dumps(reader))
+    assert np.array_equal(restored.matrix(1, "S"), _decoding(1)["S"])
+
+
+def test_shards_round_trip_through_a_codec(tmp_path):
+    codec   = MatrixCodec("float32", "deflate", tolerance=1e-5)
+    writer  = dataset.ShardWriter(str(tmp_path), "w0", codec=codec)
+    for seed in range(3):
+        writer.add(seed, _decoding(seed))
+    path_base = writer.close().paths[0][:-len(dataset.SHARD_MATRICES_SUFFIX)]
+
+    reader = dataset.ShardReader(path_base)
+    for seed in range(3):
+        stored      = reader.matrix(seed, "S")
+        restored    = reader.matrix(seed, "S", upcast=True)
+        assert stored.dtype == np.float32 and restored.dtype == np.float64
+        np.testing.assert_allclose(restored, _decoding(seed)["S"], rtol=1e-6, atol=1e-6)
+
+
+def test_convert_seed_dirs(tmp_path):
+    src_dir = tmp_path / "outputs"
+    for seed in (5, 7):
+        seed_dir                        = src_dir / f"seed_{seed}"
+        seed_dir.mkdir(parents=True)
+        npz_path, json_path, xml_path   = dataset.seed_dir_files(str(seed_dir), seed)
+        np.savez(npz_path, **_decoding(seed))
+        with open(json_path, "w") as f:
+            json.dump({"seed": seed}, f)
+        with open(xml_path, "w") as f:
+            f.write(f"<xml seed='{seed}'/>")
+    (src_dir / "seed_invalid").mkdir()
+
+    dest_dir = str(tmp_path / "shards")
+    assert dataset.convert_seed_dirs(str(src_dir), dest_dir) == 2
+
+    records = {record["seed"]: (reader, record) for reader, record in dataset.iter_shard_records(dest_dir)}
+    assert sorted(records) == [5, 7]
+    for seed, (reader, record) in records.items():
+        assert json.loads(record["metadata"]) == {"seed": seed}
+        assert record["xml"] == f"<xml seed='{seed}'/>"
+        assert np.array_equal(reader.matrix(record["row"], "S"), _decoding(seed)["S"])
@@ -0,0 +1,118 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from parameter_sampling.utils import matrix_codecs
+from parameter_sampling.utils.matrix_codecs import MatrixCodec, codec_record, downcast_error, read_npz
+
+
+def _matrices(seed=0):
+    rng = np.random.default_rng(seed)
+    return {"S": rng.normal(size=(300, 12)), "T": rng.normal(size=(12, 36)), "index": np.arange(10)}
+
+
+def _record(path):
+    with np.load(path) as data:
+        return codec_record(data)
+
+
+def test_downcast_within_tolerance(tmp_path):
+    path        = str(tmp_path / "m.npz")
+    matrices    = _matrices()
+    MatrixCodec("float32", tolerance=1e-6).write_npz(path, matrices)
+
+    stored      = read_npz(path)
+    restored    = read_npz(path, upcast_matrices=True)
+    record      = _record(path)
+    for key in ("S", "T"):
+        assert stored[key].dtype == np.float32 and restored[key].dtype == np.float64
+        assert record[key]["error"] <= 1e-6 and "fallback" not in record[key]
+        np.testing.assert_allclose(restored[key], matrices[key], rtol=1e-6)
+
+    # Integer matrices are never downcast
+    assert np.array_equal(stored["index"], matrices["index"])
+    assert stored["index"].dtype == matrices["index"].dtype
+
+
+def test_above_tolerance_keeps_full_precision(tmp_path):
+    path        = str(tmp_path / "m.npz")
+    matrices    = _matrices()
+    matrices["huge"] = np.array([1.0, 1e6])  # Over the float16 range
+
+    MatrixCodec("float16", tolerance=1e-3).write_npz(path, matrices)
+    stored = read_npz(path)
+    record = _record(path)
+
+    assert stored["huge"].dtype == np.float64 and record["huge"]["fallback"]
+    assert np.array_equal(stored["huge"], matrices["huge"])
+
+    MatrixCodec("float32", tolerance=1e-12).write_npz(path, matrices)
+    stored = read_npz(path)
+    for key in ("S", "T"):
+        assert stored[key].dtype == np.float64 and _record(path)[key]["fallback"]
+        assert np.array_equal(stored[key], matrices[key])
+
+
+def test_downcast_error_is_relative_to_the_largest_value():
+    values = np.array([0.1, 1.0, 1000.0])
+    assert downcast_error(values, "float64") == 0.0
+    # Scaling by a power of two leaves the mantissas, and so the relative error, unchanged
+    assert downcast_error(values * 2.0**-10, "float32") == downcast_error(values, "float32") > 0
+    assert downcast_error(np.zeros(4), "float16") == 0.0
+    assert downcast_error(np.array([1e6]), "float16") == float("inf")
+    # Chunking does not change the result
+    data = np.random.default_rng(0).normal(size=1000)
+    assert downcast_error(data, "float16", chunk_bytes=64) == downcast_error(data, "float16")
+
+
+def test_segments_are_checked_each_against_their_own_values(tmp_path):
+    rng     = np.random.default_rng(0)
+    large   = rng.normal(size=200) * 100
+    small   = rng.uniform(1e-7, 2e-7, size=200)  # Below float16 normal range, imprecise on its own
+    flat    = np.concatenate([large, small])
+    offsets = np.array([0, len(large), len(flat)])
+    codec   = MatrixCodec("float16", tolerance=1e-2)
+
+    path = str(tmp_path / "flat.npz")
+    codec.write_npz(path, {"flat": flat})
+    assert read_npz(path)["flat"].dtype == np.float16
+
+    codec.write_npz(path, {"flat": flat}, offsets={"flat": offsets})
+    assert read_npz(path)["flat"].dtype == np.float64
+    assert _record(path)["flat"]["per_segment"]
+
+
+@pytest.mark.parametrize("compression", sorted(matrix_codecs.COMPRESSIONS))
+def test_chunked_writes_match_np_load(tmp_path, compression):
+    path        = str(tmp_path / "m.npz")
+    matrices    = _matrices()
+    MatrixCodec("float32", compression, tolerance=1e-6, chunk_bytes=256).write_npz(path, matrices)
+
+    with np.load(path) as data:
+        for key, matrix in matrices.items():
+            assert np.array_equal(data[key], matrix.astype(np.float32) if key != "index" else matrix)
+
+    mapped = matrix_codecs.map_member(path, "S")
+    if compression == matrix_codecs.COMPRESSION_NONE:
+        assert np.array_equal(mapped, matrices["S"].astype(np.float32))
+    else:
+        assert mapped is None
+
+
+def test_encode_npz_rewrites_a_plain_archive(tmp_path):
+    path        = str(tmp_path / "m.npz")
+    matrices    = _matrices()
+    np.savez(path, **matrices)
+    assert _record(path) == {}
+
+    MatrixCodec("float32", "deflate", tolerance=1e-6).encode_npz(path)
+    restored = read_npz(path, upcast_matrices=True)
+    assert set(restored) == set(matrices)
+    np.testing.assert_allclose(restored["S"], matrices["S"], rtol=1e-6)
+
+
+def test_unknown_codec_settings_are_rejected():
+    with pytest.raises(ValueError, match="dtype"):
+        MatrixCodec("int8")
+    with pytest.raises(ValueError, match="compression"):
+        MatrixCodec(compression="zstd")
@@ -0,0 +1,89 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("usat_designer")
+
+from usat_designer.processing.constants import *
+from parameter_sampling.utils.metrics import compute_qs_and_ps, compute_qs_and_ps_batch
+
+
+def _reference_qs_and_ps(angular_error, source_width, energy):
+    # The notebook's per-decoding score, histogram CDF included
+    ae_mean = np.mean(angular_error)
+    ae_90   = np.percentile(angular_error, 90)
+
+    hist_ae, bins_ae    = np.histogram(angular_error, bins=np.arange(0, 91, 5), density=True)
+    cdf_ae              = np.cumsum(hist_ae) * np.diff(bins_ae)
+    ae_under_15         = cdf_ae[np.searchsorted(bins_ae[1:], 15)]
+
+    sw_median   = np.median(source_width)
+    e_std       = np.std(energy)
+
+    def normalise(x, min_val, max_val):
+        return np.clip(1 - (x - min_val) / (max_val - min_val), 0, 1)
+
+    q_s = (normalise(ae_mean, 0, 45) * 0.1 +
+           ae_under_15 * 0.1 +
+           normalise(sw_median, 0, 90) * 0.6 +
+           normalise(e_std, 0, 1) * 0.2) * 100
+
+    return {
+        DSN_SMPL_QUALITY_SCORE: q_s,
+        DSN_SMPL_P: np.std(source_width),
+        "ae_mean": ae_mean,
+        "ae_90": ae_90,
+        "ae_under_15": ae_under_15,
+        "sw_median": sw_median,
+        "e_std": e_std,
+    }
+
+
+def _random_metrics(num_decodings, num_points, seed=0):
+    rng = np.random.default_rng(seed)
+    # Some angular errors fall outside the 0-90 degree histogram range
+    angular_error   = rng.uniform(0, 120, size=(num_decodings, num_points))
+    source_width    = rng.uniform(0, 90, size=(num_decodings, num_points))
+    energy          = rng.lognormal(0, 0.5, size=(num_decodings, num_points))
+    # Values on the histogram bin edges, where < and the histogram could disagree
+    angular_error[:, :5] = [0, 5, 15, 15, 90]
+    return angular_error, source_width, energy
+
+
+def test_batch_matches_reference_per_decoding():
+    angular_error, source_width, energy = _random_metrics(16, 500)
+    batch = compute_qs_and_ps_batch(angular_error, source_width, energy)
+
+    assert len(batch) == 16
+    for i, metrics in enumerate(batch):
+        reference = _reference_qs_and_ps(angular_error[i], source_width[i], energy[i])
+        for key, value in reference.items():
+            assert metrics[key] == pytest.approx(float(value), rel=1e-9, abs=1e-9), key
+
+
+def test_single_decoding_matches_its_row_of_the_batch():
+    angular_error, source_width, energy = _random_metrics(3, 200, seed=1)
+    batch = compute_qs_and_ps_batch(angular_error, source_width, energy)
+
+    for i in range(3):
+        # Single decodings may come in any shape, as the transcoder returns them
+        single = compute_qs_and_ps(angular_error[i][:, None], source_width[i], energy[i])
+        assert single == pytest.approx(batch[i], rel=1e-12)
+
+
+def test_batched_energy_and_intensity_matches_transcoder():
+    pytest.importorskip("pandas")
+    pytest.importorskip("tqdm")
+    pytest.importorskip("universal_transcoder")
+    from sampling_utils import _reference_energy_and_intensity, batched_energy_and_intensity
+    from parameter_sampling.benchmark.fake_optimizer import fake_coordinates
+
+    cloud_points    = fake_coordinates(200)
+    output_layout   = fake_coordinates(12)
+    S               = np.random.default_rng(2).uniform(0, 1, size=(4, 200, 12))
+
+    batched = batched_energy_and_intensity(np.asarray(cloud_points.cart(), dtype=np.float64), S,
+                                           np.asarray(output_layout.cart(), dtype=np.float64))
+    for i in range(len(S)):
+        reference = _reference_energy_and_intensity(cloud_points, S[i], output_layout)
+        for name, b, r in zip(("energy", "angular error", "source width"), batched, reference):
+            np.testing.assert_allclose(b[i], np.ravel(r), rtol=1e-6, atol=1e-6, err_msg=name)
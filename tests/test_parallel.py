@@ -0,0 +1,62 @@
+import time
+import pytest
+
+from parameter_sampling.generate.parallel import imap_bounded
+
+
+def _square(x):
+    return x * x
+
+
+def _slow_first(x):
+    # Early tasks finish last, so completion order differs from task order
+    time.sleep(0.05 * (4 - x) if x < 4 else 0)
+    return x
+
+
+def _fail_on_three(x):
+    if x == 3:
+        raise ValueError(f"bad task {x}")
+    return x
+
+
+def test_ordered_results_follow_task_order():
+    assert list(imap_bounded(_slow_first, range(8), num_workers=4)) == list(range(8))
+
+
+def test_unordered_results_cover_every_task():
+    results = list(imap_bounded(_slow_first, range(8), num_workers=4, ordered=False))
+    assert sorted(results) == list(range(8))
+
+
+def test_tasks_are_consumed_lazily():
+    consumed = []
+
+    def tasks():
+        for x in range(100):
+            consumed.append(x)
+            yield x
+
+    results = imap_bounded(_square, tasks(), num_workers=2, max_in_flight=3)
+    assert next(results) == 0
+    # One result out, so at most one slot was refilled beyond the bound
+    assert len(consumed) <= 4
+
+    assert list(results) == [x * x for x in range(1, 100)]
+    assert len(consumed) == 100
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_worker_error_propagates(ordered):
+    results = imap_bounded(_fail_on_three, range(10), num_workers=2, ordered=ordered)
+    with pytest.raises(ValueError, match="bad task 3"):
+        list(results)
+
+
+def test_ordered_error_arrives_after_earlier_results():
+    seen    = []
+    results = imap_bounded(_fail_on_three, range(10), num_workers=2)
+    with pytest.raises(ValueError):
+        for value in results:
+            seen.append(value)
+    assert seen == [0, 1, 2]
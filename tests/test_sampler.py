@@ -0,0 +1,170 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+yaml = pytest.importorskip("yaml")
+pytest.importorskip("usat_designer")
+
+import usat_designer.processing.speaker_layouts as sl
+from usat_designer.processing.constants import *
+from parameter_sampling.generate.sampler import ParameterSampler
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "5OA_7_0_4.yaml")
+
+
+def _legacy_y_i(distribution, args):
+    # get_y_i as it was before the sampler was compiled
+    distribution = distribution.lower()
+    if distribution == "none":
+        return args
+    elif distribution == "uniform":
+        return np.random.uniform(*args)
+    elif distribution == "normal":
+        mean, std   = round(args[0], 2), round(args[1], 2)
+        sample      = -1
+        while sample < 0:
+            sample = round(np.random.normal(mean, std), 2)
+        return sample
+    elif distribution == "lognormal":
+        return np.random.lognormal(*args)
+    elif distribution == "beta":
+        return np.random.beta(*args)
+    elif distribution == "choice":
+        return np.random.choice(args)
+    raise ValueError(distribution)
+
+
+def _legacy_format(config_section):
+    selected_format = np.random.choice(config_section[DSN_SMPL_FORMAT_CHOICES])
+    selected_value  = np.random.choice(config_section[selected_format][DSN_SMPL_DISTRIBUTION_ARGS])
+    return selected_format, selected_value
+
+
+def _legacy_parse(config):
+    coeffs = {name: round(_legacy_y_i(data[DSN_SMPL_DISTRIBUTION], data[DSN_SMPL_DISTRIBUTION_ARGS]))
+              for name, data in config[DSN_XML_COEFFICIENTS].items()}
+
+    input_format, input_value   = _legacy_format(config[DSN_SMPL_INPUT_FORMAT])
+    output_format, output_value = _legacy_format(config[DSN_SMPL_OUTPUT_FORMAT])
+    return coeffs, input_format, input_value, output_format, output_value
+
+
+def _mixed_config():
+    # Every distribution and both formats on each side, so every draw site is exercised
+    config = {
+        DSN_XML_COEFFICIENTS: {
+            "energy": {DSN_SMPL_DISTRIBUTION: "none", DSN_SMPL_DISTRIBUTION_ARGS: 5.0},
+            "radialIntensity": {DSN_SMPL_DISTRIBUTION: "normal", DSN_SMPL_DISTRIBUTION_ARGS: [1.0, 3.0]},
+            "transverseIntensity": {DSN_SMPL_DISTRIBUTION: "uniform", DSN_SMPL_DISTRIBUTION_ARGS: [0.0, 10.0]},
+            "pressure": {DSN_SMPL_DISTRIBUTION: "lognormal", DSN_SMPL_DISTRIBUTION_ARGS: [0.5, 0.5]},
+            "inPhaseQuadratic": {DSN_SMPL_DISTRIBUTION: "beta", DSN_SMPL_DISTRIBUTION_ARGS: [2.0, 5.0]},
+            "symmetryQuadratic": {DSN_SMPL_DISTRIBUTION: "choice", DSN_SMPL_DISTRIBUTION_ARGS: [0, 5, 10]},
+        },
+    }
+    layouts = sorted(sl.SPEAKER_LAYOUTS)[:3]
+    for section in (DSN_SMPL_INPUT_FORMAT, DSN_SMPL_OUTPUT_FORMAT):
+        config[section] = {
+            DSN_SMPL_FORMAT_CHOICES: [DSN_XML_AMBISONICS, DSN_XML_SPEAKER_LAYOUT],
+            DSN_XML_AMBISONICS: {DSN_SMPL_DISTRIBUTION_ARGS: [1, 3, 5]},
+            DSN_XML_SPEAKER_LAYOUT: {DSN_SMPL_DISTRIBUTION_ARGS: layouts},
+        }
+    return config
+
+
+def _load_config():
+    with open(CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f)
+
+
+def _summary(usat_state_parameters):
+    settings = usat_state_parameters[DSN_XML_SETTINGS]
+    return (usat_state_parameters[DSN_XML_COEFFICIENTS],
+            settings[DSN_XML_INPUT_TYPE],
+            usat_state_parameters[DSN_XML_INPUT_AMBISONICS][DSN_XML_AMBISONICS_ORDER_IN],
+            usat_state_parameters[DSN_SMPL_INPUT_LAYOUT_DESC],
+            settings[DSN_XML_OUTPUT_TYPE],
+            usat_state_parameters[DSN_XML_OUTPUT_AMBISONICS][DSN_XML_AMBISONICS_ORDER_OUT],
+            usat_state_parameters[DSN_SMPL_OUTPUT_LAYOUT_DESC])
+
+
+def _legacy_summary(legacy):
+    coeffs, input_format, input_value, output_format, output_value = legacy
+
+    def side(fmt, value):
+        return (value, "") if fmt == DSN_XML_AMBISONICS else (1, value)
+
+    return (coeffs, input_format, *side(input_format, input_value), output_format, *side(output_format, output_value))
+
+
+@pytest.mark.parametrize("config", [_load_config(), _mixed_config()], ids=["5OA_7_0_4", "mixed"])
+def test_sample_matches_legacy_draw_order(config):
+    sampler = ParameterSampler(config)
+
+    for seed in range(200):
+        np.random.seed(seed)
+        expected        = _legacy_summary(_legacy_parse(config))
+        expected_next   = np.random.random()
+
+        np.random.seed(seed)
+        assert _summary(sampler.sample(np.random)) == expected, f"seed {seed}"
+        # Nothing more or less may be drawn from the global state
+        assert np.random.random() == expected_next, f"seed {seed}"
+
+
+def test_sample_resolves_speaker_layouts():
+    sampler = ParameterSampler(_load_config())
+
+    np.random.seed(0)
+    parameters = sampler.sample(np.random)
+    assert parameters[DSN_XML_OUTPUT_SPEAKER_LAYOUT] is sl.SPEAKER_LAYOUTS[parameters[DSN_SMPL_OUTPUT_LAYOUT_DESC]]
+    assert parameters[DSN_XML_INPUT_SPEAKER_LAYOUT] == []
+
+
+def test_invalid_config_is_rejected_up_front():
+    config = _mixed_config()
+    config[DSN_XML_COEFFICIENTS]["energy"][DSN_SMPL_DISTRIBUTION_ARGS] = [1.0, 2.0]
+    with pytest.raises(ValueError, match="energy"):
+        ParameterSampler(config)
+
+    config = _mixed_config()
+    config[DSN_SMPL_OUTPUT_FORMAT][DSN_XML_SPEAKER_LAYOUT][DSN_SMPL_DISTRIBUTION_ARGS] = ["no_such_layout"]
+    with pytest.raises(ValueError, match="no_such_layout"):
+        ParameterSampler(config)
+
+
+@pytest.mark.parametrize("num_streams", [1, 3, 4])
+def test_sample_stream_matches_its_rows_of_the_job(num_streams):
+    sampler     = ParameterSampler(_mixed_config())
+    num_samples = 50
+    job         = sampler.sample_job(num_samples, job_seed=1234, num_streams=num_streams)
+
+    for stream in range(num_streams):
+        rows    = np.arange(stream, num_samples, num_streams)
+        drawn   = sampler.sample_stream(num_samples, job_seed=1234, stream=stream, num_streams=num_streams)
+        assert set(drawn) == set(job)
+        for name, column in drawn.items():
+            assert np.array_equal(column, job[name][rows]), name
+
+    # Same job seed, same table; another seed, another table
+    again = sampler.sample_job(num_samples, job_seed=1234, num_streams=num_streams)
+    other = sampler.sample_job(num_samples, job_seed=4321, num_streams=num_streams)
+    assert all(np.array_equal(again[name], job[name]) for name in job)
+    assert not np.array_equal(other["radialIntensity"], job["radialIntensity"])
+
+
+def test_job_seeds_are_unique_and_rows_build_parameters():
+    sampler = ParameterSampler(_mixed_config())
+    job     = sampler.sample_job(500, job_seed=7, num_streams=2)
+
+    assert len(np.unique(job[DSN_SMPL_SEED])) == 500
+    # The truncated normal never goes below zero
+    assert (job["radialIntensity"] >= 0).all()
+
+    for index in range(20):
+        parameters  = sampler.parameters_from_row(job, index)
+        settings    = parameters[DSN_XML_SETTINGS]
+        assert settings[DSN_XML_INPUT_TYPE] == str(job[DSN_XML_INPUT_TYPE][index])
+        assert settings[DSN_XML_OUTPUT_TYPE] == str(job[DSN_XML_OUTPUT_TYPE][index])
+        if settings[DSN_XML_OUTPUT_TYPE] == DSN_XML_SPEAKER_LAYOUT:
+            assert parameters[DSN_XML_OUTPUT_SPEAKER_LAYOUT] is sl.SPEAKER_LAYOUTS[parameters[DSN_SMPL_OUTPUT_LAYOUT_DESC]]
+        assert parameters[DSN_XML_COEFFICIENTS]["energy"] == 5
@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("usat_designer")
+
+from parameter_sampling.generate.sharding import RunManifest, manifest_name, shard_indices, shard_seeds
+from parameter_sampling.utils.uploader import LocalBackend
+
+
+def test_shards_partition_the_job():
+    task_count  = 4
+    indices     = np.concatenate([shard_indices(task, task_count, 25) for task in range(task_count)])
+    assert sorted(indices.tolist()) == list(range(100))
+
+    seeds = np.concatenate([shard_seeds(99, task, task_count, 25) for task in range(task_count)])
+    assert len(np.unique(seeds)) == 100
+
+
+def test_manifest_resumes_from_local_file(tmp_path):
+    path        = str(tmp_path / "manifests" / manifest_name(99, 0, 4))
+    manifest    = RunManifest(path)
+    assert manifest.load() == set()
+
+    for seed in (11, 22, 33):
+        manifest.mark_completed(seed, saved_dir=f"seed_{seed}")
+
+    resumed = RunManifest(path)
+    assert resumed.load() == {11, 22, 33}
+    assert resumed.is_completed(22) and resumed.is_completed(np.int64(33))
+    assert not resumed.is_completed(44)
+
+
+def test_manifest_skips_a_torn_last_line(tmp_path):
+    path        = str(tmp_path / "manifest.jsonl")
+    manifest    = RunManifest(path)
+    manifest.mark_completed(1)
+    manifest.mark_completed(2)
+    with open(path, "a") as f:
+        f.write('{"seed": 3, "ti')
+
+    assert RunManifest(path).load() == {1, 2}
+
+
+def test_manifest_resumes_on_another_vm_from_the_bucket(tmp_path):
+    backend     = LocalBackend(str(tmp_path / "bucket"))
+    blob_name   = manifest_name(99, 1, 4)
+
+    first_vm = RunManifest(str(tmp_path / "vm1" / blob_name), backend, blob_name, upload_every=2)
+    first_vm.load()
+    for seed in range(5):
+        first_vm.mark_completed(seed)
+
+    # Preempted before the last seed was uploaded: the bucket has every seed up to the last sync
+    second_vm = RunManifest(str(tmp_path / "vm2" / blob_name), backend, blob_name)
+    assert second_vm.load() == {0, 1, 2, 3}
+
+    first_vm.sync()
+    third_vm = RunManifest(str(tmp_path / "vm3" / blob_name), backend, blob_name)
+    assert third_vm.load() == set(range(5))
@@ -0,0 +1,114 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("tqdm")
+pytest.importorskip("usat_designer")
+
+from streaming_stats import FixedHistogram, QuantileSketch, RunningMoments, StreamingStats
+
+COLUMNS = ["a", "b", "c"]
+
+
+def _data(num_rows=5000, seed=0):
+    rng     = np.random.default_rng(seed)
+    base    = rng.normal(size=num_rows)
+    # Correlated columns with very different offsets and scales
+    return np.column_stack([base * 10 + 1e4, base + rng.normal(size=num_rows) * 0.1, rng.exponential(size=num_rows)])
+
+
+def _chunks(values, sizes):
+    start = 0
+    for size in sizes:
+        yield values[start:start + size]
+        start += size
+
+
+def test_merged_moments_match_one_pass():
+    values  = _data()
+    sizes   = [1, 999, 0, 1500, 2500]
+
+    # Partial moments of separate workers, merged in a tree
+    partials = []
+    for chunk in _chunks(values, sizes):
+        moments = RunningMoments(COLUMNS)
+        moments.update(chunk)
+        partials.append(moments)
+    merged = partials[0].merge(partials[1]).merge(partials[2].merge(partials[3].merge(partials[4])))
+
+    # The same chunks fed to one accumulator
+    sequential = RunningMoments(COLUMNS)
+    for chunk in _chunks(values, sizes):
+        sequential.update(chunk)
+
+    for moments in (merged, sequential):
+        assert moments.count == len(values)
+        np.testing.assert_allclose(moments.mean, values.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(moments.covariance().values, np.cov(values, rowvar=False), rtol=1e-9, atol=1e-8)
+        np.testing.assert_allclose(moments.correlation().values, np.corrcoef(values, rowvar=False), rtol=1e-9, atol=1e-9)
+
+
+def test_moments_skip_rows_with_missing_values():
+    values          = _data(100)
+    with_missing    = values.copy()
+    with_missing[::7, 1] = np.nan
+
+    moments = RunningMoments(COLUMNS)
+    moments.update(with_missing)
+    kept    = values[np.isfinite(with_missing).all(axis=1)]
+    assert moments.count == len(kept)
+    np.testing.assert_allclose(moments.covariance().values, np.cov(kept, rowvar=False), rtol=1e-9, atol=1e-8)
+
+
+def test_moments_of_other_columns_are_not_merged():
+    with pytest.raises(ValueError):
+        RunningMoments(COLUMNS).merge(RunningMoments(["a", "b"]))
+
+
+def test_merged_histograms_match_one_pass():
+    values  = np.random.default_rng(1).normal(50, 30, size=2000)
+    left    = FixedHistogram(20, (0, 100))
+    right   = FixedHistogram(20, (0, 100))
+    left.update(values[:700])
+    right.update(values[700:])
+    left.merge(right)
+
+    assert np.array_equal(left.counts, np.histogram(values, left.edges)[0])
+    assert left.underflow == (values < 0).sum() and left.overflow == (values > 100).sum()
+
+
+def test_merged_sketches_approximate_quantiles():
+    values      = np.random.default_rng(2).uniform(0, 1, size=50000)
+    sketches    = []
+    for chunk in np.array_split(values, 5):
+        sketch = QuantileSketch(capacity=256, seed=len(sketches))
+        sketch.update(chunk)
+        sketches.append(sketch)
+
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+
+    quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+    assert merged.count == len(values)
+    np.testing.assert_allclose(merged.quantiles(quantiles), np.quantile(values, quantiles), atol=0.03)
+    assert sum(len(items) for items in merged.levels) < len(values) // 10
+
+
+def test_merged_stats_match_one_pass():
+    values  = _data()
+    df      = pd.DataFrame(values, columns=COLUMNS)
+    kwargs  = {"columns": COLUMNS, "histograms": {"c": (10, (0, 5))}}
+
+    whole = StreamingStats(**kwargs)
+    whole.update(df, query="c < 3")
+
+    merged = StreamingStats(**kwargs)
+    for start in range(0, len(df), 1200):
+        partial = StreamingStats(**kwargs)
+        partial.update(df.iloc[start:start + 1200], query="c < 3")
+        merged.merge(partial)
+
+    assert (merged.num_seen, merged.num_selected) == (whole.num_seen, whole.num_selected) == (len(df), (df.c < 3).sum())
+    np.testing.assert_allclose(merged.moments.covariance().values, whole.moments.covariance().values, rtol=1e-9, atol=1e-8)
+    assert np.array_equal(merged.histograms["c"].counts, whole.histograms["c"].counts)